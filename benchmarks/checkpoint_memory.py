@@ -0,0 +1,102 @@
+"""
+Measure the memory a loaded JSON checkpoint takes as nested dicts and as
+compact records (CHECKPOINT_COMPACT), and check that processing it gives the
+same CSV.
+
+Each mode loads the checkpoint in a fresh process and reports the resident
+set size the load added, the load time and the process_data time.
+
+Usage:
+    python -m benchmarks.checkpoint_memory --managers 20000 --holdings 100
+    python -m benchmarks.checkpoint_memory --checkpoint checkpoints/13f-info.json
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.processor_benchmark import make_checkpoint
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process (Linux /proc, else peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(path: str, compact: bool) -> dict:
+    """Load and process the checkpoint in this process."""
+    from scraper.storage.checkpoint_manager import CheckpointManager
+    from scraper.storage.processor import compute_rows
+
+    gc.collect()
+    before = current_rss_mb()
+    started = time.perf_counter()
+    checkpoint = CheckpointManager(path, compact=compact)
+    load = time.perf_counter() - started
+    gc.collect()
+    loaded = current_rss_mb()
+
+    started = time.perf_counter()
+    csv = compute_rows(checkpoint.get_all()).to_csv(index=False)
+    process = time.perf_counter() - started
+    return {
+        "rss_mb": round(loaded - before, 1),
+        "load_seconds": round(load, 2),
+        "process_seconds": round(process, 2),
+        "csv_md5": hashlib.md5(csv.encode()).hexdigest(),
+    }
+
+
+def run_mode(path: str, compact: bool) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.checkpoint_memory", "--measure", path] + (["--compact"] if compact else []),
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--managers", type=int, default=20000)
+    parser.add_argument("--holdings", type=int, default=100, help="average holdings per filing")
+    parser.add_argument("--checkpoint", default=None, help="measure an existing JSON checkpoint instead")
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--compact", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.compact)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.checkpoint
+        if path is None:
+            path = str(Path(workdir) / "checkpoint.json")
+            with open(path, "w") as f:
+                json.dump(make_checkpoint(args.managers, args.holdings), f, indent=2)
+        size_mb = os.path.getsize(path) / 2 ** 20
+        print(f"checkpoint: {size_mb:.1f} MB of JSON")
+
+        dicts, compact = run_mode(path, False), run_mode(path, True)
+        for name, result in (("dicts", dicts), ("compact", compact)):
+            print(f"{name:<8} +{result['rss_mb']:8.1f} MB RSS   load {result['load_seconds']:6.2f}s   "
+                  f"process {result['process_seconds']:6.2f}s")
+        print(f"RSS reduction: {dicts['rss_mb'] / max(compact['rss_mb'], 0.1):.1f}x")
+        if dicts["csv_md5"] != compact["csv_md5"]:
+            raise SystemExit("processing the compact checkpoint gives a different CSV")
+
+
+if __name__ == "__main__":
+    main()
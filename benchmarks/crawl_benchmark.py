@@ -0,0 +1,168 @@
+"""
+End-to-end crawl benchmark against a local fake site.
+
+Starts benchmarks.fake_site on a free port, runs the real `python -m
+scraper.main` flow against it in a scratch directory and reports crawl
+throughput, callback latency, checkpoint and processing time and peak RSS,
+read back from the RUN_SUMMARY_PATH records and the METRICS_SUMMARY_PATH
+snapshot the crawl writes.
+
+Usage:
+    python -m benchmarks.crawl_benchmark --managers-per-letter 40 --latency-ms 20
+    python -m benchmarks.crawl_benchmark --error-rate 0.02 --max-inflight 10 \\
+        --env CRAWL_MODE=pipelined --json results.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.fake_site import add_site_arguments, serve, site_from_args
+from scraper.metrics import Histogram
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_crawl(base_url: str, workdir: Path, env_overrides: Dict[str, str]) -> Dict[str, Any]:
+    """Run scraper.main once; returns exit code, wall time, run summary records and metrics snapshot."""
+    summary_path = workdir / "run_summary.jsonl"
+    metrics_path = workdir / "metrics_summary.json"
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")])),
+        "SCRAPY_SETTINGS_MODULE": "scraper.settings",
+        "BASE_URL": base_url,
+        "MANAGER_LIST_BASE_URL": f"{base_url}/managers",
+        "HOLDING_LIST_BASE_URL": f"{base_url}/data",
+        "CHECKPOINT_PATH": str(workdir / "checkpoints" / "13f-info.json"),
+        "OUTPUT_PATH": str(workdir / "data" / "processed_data.csv"),
+        "VALIDATORS_PATH": str(workdir / "checkpoints" / "validators.json"),
+        "SEEN_FILINGS_PATH": str(workdir / "checkpoints" / "seen_filings.txt"),
+        "RUN_SUMMARY_PATH": str(summary_path),
+        "METRICS_SUMMARY_PATH": str(metrics_path),
+    })
+    env.update(env_overrides)
+
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-m", "scraper.main"], cwd=workdir, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    wall = time.perf_counter() - started
+
+    records = []
+    if summary_path.exists():
+        records = [json.loads(line) for line in summary_path.read_text().splitlines() if line.strip()]
+    snapshot = json.loads(metrics_path.read_text()) if metrics_path.exists() else {}
+    return {"returncode": process.returncode, "wall": wall, "records": records, "metrics": snapshot,
+            "output": process.stdout}
+
+
+def merged_histogram(snapshot: Dict[str, Any], name: str, **labels: str) -> Histogram:
+    """Merge every series of a histogram in a metrics snapshot whose labels include the given ones."""
+    merged = Histogram(tuple(snapshot.get("buckets", ())))
+    for series in snapshot.get("histograms", {}).get(name, []):
+        if labels.items() <= series["labels"].items():
+            merged.merge(Histogram.from_summary(series, merged.buckets))
+    return merged
+
+
+def summarize(records: List[Dict[str, Any]], snapshot: Dict[str, Any], wall: float,
+              peak_rss_mb: float) -> Dict[str, Any]:
+    """Fold the per-stage records and the metrics snapshot into one report."""
+    pages = items = retries = 0
+    process_seconds = 0.0
+    stages: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        if record["stage"] == "process":
+            process_seconds += record["seconds"]
+            continue
+        stats = record["stats"]
+        stage_pages = stats.get("response_received_count", 0)
+        # A batch item carries a filing's holdings: count the holdings, so row and batch runs compare
+        stage_items = (stats.get("item_scraped_count", 0) - stats.get("holdings/batch_items", 0)
+                       + stats.get("holdings/batch_rows", 0))
+        pages += stage_pages
+        items += stage_items
+        retries += stats.get("retry/count", 0)
+        # Shards of a sharded crawl run a stage side by side: it takes as long as the slowest one
+        stage = stages.setdefault(record["stage"], {"seconds": 0.0, "pages": 0, "items": 0})
+        stage["seconds"] = max(stage["seconds"], round(record["seconds"], 3))
+        stage["pages"] += stage_pages
+        stage["items"] += stage_items
+    crawl_seconds = sum(stage["seconds"] for stage in stages.values())
+
+    callbacks = merged_histogram(snapshot, "scraper_callback_seconds")
+    return {
+        "wall_seconds": round(wall, 3),
+        "crawl_seconds": round(crawl_seconds, 3),
+        "pages": pages,
+        "items": items,
+        "retries": retries,
+        "pages_per_sec": round(pages / crawl_seconds, 1) if crawl_seconds else 0.0,
+        "items_per_sec": round(items / crawl_seconds, 1) if crawl_seconds else 0.0,
+        "callback_p50_ms": round(callbacks.percentile(50) * 1000, 2),
+        "callback_p99_ms": round(callbacks.percentile(99) * 1000, 2),
+        "checkpoint_pipeline_seconds": round(merged_histogram(snapshot, "scraper_pipeline_seconds",
+                                                              pipeline="checkpoint").sum, 3),
+        "checkpoint_save_seconds": round(merged_histogram(snapshot, "scraper_checkpoint_save_seconds").sum, 3),
+        "process_seconds": round(process_seconds, 3),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_site_arguments(parser)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the crawl, e.g. CHECKPOINT_BACKEND=sqlite")
+    parser.add_argument("--workdir", default=None, help="keep checkpoints and output here instead of a temp dir")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    site = site_from_args(args)
+    server = serve(site)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory(prefix="crawl-bench-") as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        result = run_crawl(base_url, workdir, env_overrides)
+    server.shutdown()
+
+    if result["returncode"] != 0:
+        print(result["output"][-4000:])
+        raise SystemExit(f"crawl exited with {result['returncode']}")
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    report = summarize(result["records"], result["metrics"], result["wall"], peak_rss_mb)
+    report["server"] = dict(site.counts)
+    report["env"] = env_overrides
+
+    for stage, numbers in report["stages"].items():
+        print(f"{stage:<10} {numbers['seconds']:>8.2f}s {numbers['pages']:>7} pages {numbers['items']:>8} items")
+    print(f"pages/sec:       {report['pages_per_sec']}")
+    print(f"items/sec:       {report['items_per_sec']}")
+    print(f"callback p50:    {report['callback_p50_ms']} ms")
+    print(f"callback p99:    {report['callback_p99_ms']} ms")
+    print(f"checkpoint time: {report['checkpoint_pipeline_seconds']}s in the pipeline, "
+          f"{report['checkpoint_save_seconds']}s saving")
+    print(f"processor time:  {report['process_seconds']}s")
+    print(f"peak RSS:        {report['peak_rss_mb']} MB")
+    print(f"wall time:       {report['wall_seconds']}s ({report['retries']} retries, server {report['server']})")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
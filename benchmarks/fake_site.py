@@ -0,0 +1,233 @@
+"""
+Local stand-in for 13f.info used by the crawl benchmark.
+
+Serves the three page types the spiders read:
+    /managers/{letter}        manager listing table
+    /manager/{id}-{slug}      filings table (#managerFilings)
+    /data/13f/{filing_id}     holdings JSON ({"data": [[...], ...]})
+
+Pages are generated deterministically from the seed, or served from a
+fixtures directory with the same layout (e.g. fixtures/data/13f/123.json)
+when a file exists there. Latency, 5xx errors and 429 throttling can be
+injected to compare concurrency and retry behaviour between commits.
+
+Usage:
+    python -m benchmarks.fake_site --port 8765 --latency-ms 50 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+LETTERS = list(string.ascii_lowercase) + ['0']
+
+
+class FakeSite:
+    """Synthetic 13F site content plus fault injection settings."""
+
+    def __init__(self, managers_per_letter: int = 20, filings_per_manager: int = 4, holdings: int = 50,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 max_inflight: int = 0, retry_after: Optional[float] = None,
+                 fixtures: Optional[str] = None, seed: int = 0):
+        self.managers_per_letter = managers_per_letter
+        self.filings_per_manager = filings_per_manager
+        self.holdings = holdings
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self.fixtures = Path(fixtures) if fixtures else None
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.counts: Dict[str, int] = {}
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def managers(self, letter: str) -> List[tuple]:
+        index = LETTERS.index(letter)
+        return [(str(100000 + index * 10000 + j), f"{letter.upper()} Capital {j}")
+                for j in range(self.managers_per_letter)]
+
+    def filings(self, manager_id: str) -> List[tuple]:
+        """(quarter, filing_id, form_type) newest first; every third filing is an amendment."""
+        rows = []
+        for q in range(self.filings_per_manager):
+            year, quarter = 2024 - q // 4, 4 - q % 4
+            form_type = "13F-HR/A" if q % 3 == 1 else "13F-HR"
+            rows.append((f"Q{quarter} {year}", f"{manager_id}{q:03d}", form_type))
+        return rows
+
+    def filing_value(self, filing_id: str) -> int:
+        """Reported value of a filing: the sum of its holdings' values."""
+        return sum(int(row[4].replace(",", "")) for row in self.holdings_rows(filing_id))
+
+    def holdings_rows(self, filing_id: str) -> List[list]:
+        rng = random.Random(f"{self.seed}:{filing_id}")
+        universe = max(self.holdings * 4, 1)
+        count = rng.randint(1, max(self.holdings * 2, 1))
+        rows = []
+        for symbol_index in rng.sample(range(universe), min(count, universe)):
+            rows.append([
+                f"SYM{symbol_index}", f"Issuer {symbol_index}", "COM", f"{symbol_index:09d}",
+                f"{rng.randint(1, 10 ** 7):,}", round(rng.random() * 5, 2), f"{rng.randint(1, 10 ** 8):,}",
+                None, None,
+            ])
+        return rows
+
+    def render(self, path: str) -> Optional[tuple]:
+        """(body, content type) for a path, or None for 404."""
+        if self.fixtures is not None:
+            fixture = self.fixtures / path.strip('/')
+            for candidate in (fixture, fixture.with_name(fixture.name + ".html"),
+                              fixture.with_name(fixture.name + ".json")):
+                if candidate.is_file():
+                    ctype = "application/json" if candidate.suffix == ".json" else "text/html"
+                    return candidate.read_bytes(), ctype
+
+        parts = path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == "managers" and parts[1] in LETTERS:
+            links = "".join(
+                f'<tr><td><a href="/manager/{manager_id}-{name.lower().replace(" ", "-")}">{name}</a></td></tr>'
+                for manager_id, name in self.managers(parts[1])
+            )
+            return f"<html><body><table>{links}</table></body></html>".encode(), "text/html"
+
+        if len(parts) == 2 and parts[0] == "manager":
+            manager_id = parts[1].split('-')[0]
+            rows = "".join(
+                f'<tr><td><a href="/13f/{filing_id}-filing">{quarter}</a></td>'
+                f'<td>{len(self.holdings_rows(filing_id))}</td><td>{self.filing_value(filing_id):,}</td><td>SYM1, SYM2</td>'
+                f'<td>{form_type}</td><td>2/14/2025</td><td>{filing_id}</td></tr>'
+                for quarter, filing_id, form_type in self.filings(manager_id)
+            )
+            body = (f'<html><body><table id="managerFilings"><thead><tr><th>Quarter</th></tr></thead>'
+                    f'<tbody>{rows}</tbody></table></body></html>')
+            return body.encode(), "text/html"
+
+        if len(parts) == 3 and parts[:2] == ["data", "13f"]:
+            return json.dumps({"data": self.holdings_rows(parts[2])}).encode(), "application/json"
+
+        return None
+
+
+def make_handler(site: FakeSite):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_empty(self, status: int, headers: Optional[dict] = None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            with site.lock:
+                site.inflight += 1
+                inflight = site.inflight
+            try:
+                self.serve(inflight)
+            finally:
+                with site.lock:
+                    site.inflight -= 1
+
+        def serve(self, inflight: int):
+            if site.max_inflight and inflight > site.max_inflight:
+                site.count("throttled")
+                headers = {"Retry-After": str(site.retry_after)} if site.retry_after is not None else None
+                return self.send_empty(429, headers)
+
+            delay = site.latency_ms + (site.rng.uniform(0, site.jitter_ms) if site.jitter_ms else 0.0)
+            if delay:
+                time.sleep(delay / 1000)
+
+            if site.error_rate and site.rng.random() < site.error_rate:
+                site.count("errors")
+                return self.send_empty(500)
+
+            page = site.render(self.path)
+            if page is None:
+                site.count("not_found")
+                return self.send_empty(404)
+            body, ctype = page
+            site.count("pages")
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+class FakeSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The crawler opens up to CONCURRENT_REQUESTS connections at once
+    request_queue_size = 256
+
+
+def serve(site: FakeSite, host: str = "127.0.0.1", port: int = 0) -> FakeSiteServer:
+    """Start the site on a background thread; port 0 picks a free port (see server.server_port)."""
+    server = FakeSiteServer((host, port), make_handler(site))
+    threading.Thread(target=server.serve_forever, name="fake-site", daemon=True).start()
+    return server
+
+
+def add_site_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--managers-per-letter", type=int, default=20)
+    parser.add_argument("--filings", type=int, default=4, help="filings listed per manager")
+    parser.add_argument("--holdings", type=int, default=50, help="average holdings per filing")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra uniform random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--max-inflight", type=int, default=0,
+                        help="answer 429 above this many concurrent requests (0 = unlimited)")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--fixtures", default=None, help="directory of recorded pages served in place of generated ones")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def site_from_args(args) -> FakeSite:
+    return FakeSite(
+        managers_per_letter=args.managers_per_letter,
+        filings_per_manager=args.filings,
+        holdings=args.holdings,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        max_inflight=args.max_inflight,
+        retry_after=args.retry_after,
+        fixtures=args.fixtures,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(site_from_args(args), args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark scraper.parsers against the per-cell CSS extraction it replaced.
+
+Pages come from benchmarks.fake_site, or from a --fixtures directory laid out
+like the site (managers/{letter}.html, manager/{id}.html). Both extractors run
+on the same parsed Selector, their output is compared, and the best of
+--repeat runs is reported per page, with and without the HTML parse itself.
+
+Usage:
+    python -m benchmarks.parser_benchmark --managers-per-letter 200 --filings 40
+    python -m benchmarks.parser_benchmark --fixtures path/to/recorded/pages
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+from urllib.parse import urlparse
+
+from parsel import Selector
+
+from benchmarks.fake_site import LETTERS, FakeSite
+from scraper.parsers import filing_rows, manager_links
+
+
+def css_manager_links(selector: Selector) -> List[Tuple[str, str, str]]:
+    """ManagersSpider.parse before scraper.parsers."""
+    links = []
+    for link in selector.css("table a[href*='/manager/']"):
+        href = link.attrib["href"]
+        name = link.css("::text").get("").strip()
+        path_parts = urlparse(href).path.strip('/').split('/')
+        if len(path_parts) < 2:
+            continue
+        links.append((path_parts[-1].split('-')[0], name, href))
+    return links
+
+
+def css_filing_rows(selector: Selector) -> List[tuple]:
+    """FilingsSpider.parse before scraper.parsers."""
+    rows = []
+    for filing in selector.css("#managerFilings tbody tr"):
+        cells = filing.css("td")
+        if len(cells) < 7:
+            continue
+        quarter_link = cells[0].css("a")
+        rows.append((
+            quarter_link.css("::text").get("").strip(),
+            quarter_link.attrib.get("href", ""),
+            cells[1].css("::text").get("").strip(),
+            cells[2].css("::text").get("").strip(),
+            cells[3].css("::text").get("").strip(),
+            cells[4].css("::text").get("").strip(),
+            cells[5].css("::text").get("").strip(),
+            cells[6].css("::text").get("").strip(),
+        ))
+    return rows
+
+
+def load_pages(args) -> Tuple[List[str], List[str]]:
+    """(listing pages, filings pages) as HTML text."""
+    if args.fixtures:
+        root = Path(args.fixtures)
+        listings = [p.read_text() for p in sorted((root / "managers").glob("*")) if p.is_file()]
+        filings = [p.read_text() for p in sorted((root / "manager").glob("*")) if p.is_file()]
+        return listings, filings
+
+    site = FakeSite(managers_per_letter=args.managers_per_letter, filings_per_manager=args.filings,
+                    holdings=args.holdings)
+    listings = [site.render(f"/managers/{letter}")[0].decode() for letter in LETTERS]
+    filings = [site.render(f"/manager/{manager_id}-fund")[0].decode()
+               for manager_id, _ in site.managers(LETTERS[0])[:args.filings_pages]]
+    return listings, filings
+
+
+def best_per_page(extract: Callable, pages: List[str], repeat: int, parse_html: bool) -> Tuple[float, list]:
+    """Best total time over repeat runs divided by the page count, and the extracted rows."""
+    selectors = [Selector(text=page) for page in pages]
+    best, results = float("inf"), []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        if parse_html:
+            results = [extract(Selector(text=page)) for page in pages]
+        else:
+            results = [extract(selector) for selector in selectors]
+        best = min(best, time.perf_counter() - started)
+    return best / len(pages), results
+
+
+def report(name: str, pages: List[str], old: Callable, new: Callable, repeat: int):
+    if not pages:
+        print(f"{name}: no pages")
+        return
+    for parse_html in (False, True):
+        old_time, old_rows = best_per_page(old, pages, repeat, parse_html)
+        new_time, new_rows = best_per_page(new, pages, repeat, parse_html)
+        if [list(map(tuple, rows)) for rows in old_rows] != [list(map(tuple, rows)) for rows in new_rows]:
+            raise SystemExit(f"{name}: scraper.parsers output differs from the CSS extraction")
+        label = "with HTML parse" if parse_html else "extraction only"
+        rows = sum(len(r) for r in new_rows)
+        print(f"{name:<9} {label:<16} css {old_time * 1e6:9.1f} us/page   "
+              f"xpath {new_time * 1e6:9.1f} us/page   {old_time / new_time:4.1f}x   ({len(pages)} pages, {rows} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--managers-per-letter", type=int, default=100, help="links per listing page")
+    parser.add_argument("--filings", type=int, default=40, help="rows per filings page")
+    parser.add_argument("--holdings", type=int, default=5, help="average holdings per filing (sets the holdings column)")
+    parser.add_argument("--filings-pages", type=int, default=50, help="number of filings pages to generate")
+    parser.add_argument("--fixtures", default=None, help="directory with managers/ and manager/ pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    listings, filings = load_pages(args)
+    report("managers", listings, css_manager_links, lambda selector: manager_links(selector.root), args.repeat)
+    report("filings", filings, css_filing_rows, lambda selector: filing_rows(selector.root), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
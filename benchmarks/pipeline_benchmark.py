@@ -0,0 +1,177 @@
+"""
+Compare the item pipeline overhead of one HoldingItem per holding
+(HOLDINGS_ITEMS=row) with one HoldingsBatchItem per filing (batch).
+
+Generated filings are turned into items the way the holdings spider builds
+them and pushed through Scrapy's ItemPipelineManager, with the normalization,
+checkpoint and holdings index pipelines on temporary files and the
+item_scraped signal sent to the metrics extension, as the engine does for
+every item. Each mode runs
+in a fresh process and reports the time per holding; both must leave the
+same checkpoint behind.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark --filings 2000 --holdings 300
+    python -m benchmarks.pipeline_benchmark --backend sqlite
+"""
+import argparse
+import hashlib
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+MODES = ("row", "batch")
+
+
+def make_filings(filings: int, holdings: int, seed: int = 0) -> Iterator[Tuple[Dict[str, Any], List[list]]]:
+    """(filing fields, rows of the holdings data array) per filing, 10 filings per manager."""
+    rng = random.Random(seed)
+    for number in range(filings):
+        fields = {
+            "manager_id": f"manager-{number // 10}",
+            "manager_name": f"Manager {number // 10}",
+            "filing_id": str(1000000 + number),
+            "filing_date": "2024-02-14",
+            "quarter": f"Q{number % 4 + 1} 2023",
+        }
+        rows = []
+        for position in range(holdings):
+            shares, price = rng.randint(1, 10 ** 7), rng.randint(1, 500)
+            rows.append([
+                f"S{position:04d}", f"Issuer {position}", "COM", f"{rng.randrange(10 ** 9):09d}",
+                f"{shares * price:,}", "0.1", f"{shares:,}", "", "",
+            ])
+        yield fields, rows
+
+
+def measure(workdir: str, mode: str, backend: str, filings: int, holdings: int) -> dict:
+    """Push the generated items through the pipelines in this process, under the asyncio reactor."""
+    from scrapy.utils.reactor import install_reactor
+
+    install_reactor("twisted.internet.asyncioreactor.AsyncioSelectorReactor")
+
+    from scrapy import Spider, signals
+    from scrapy.pipelines import ItemPipelineManager
+    from scrapy.utils.defer import deferred_from_coro
+    from scrapy.utils.test import get_crawler
+    from twisted.internet import reactor
+
+    from scraper.items import FilingItem, ManagerItem
+    from scraper.spiders.holdings_spider import holding_item, holdings_batch_item
+    from scraper.storage.backends import checkpoint_from_settings
+    from scraper.storage.compact import plain
+
+    class BenchmarkSpider(Spider):
+        name = "holdings"
+
+    checkpoint_path = str(Path(workdir) / mode / "checkpoint.json")
+    crawler = get_crawler(BenchmarkSpider, {
+        "ITEM_PIPELINES": {
+            "scraper.pipelines.NormalizationPipeline": 200,
+            "scraper.pipelines.CheckpointPipeline": 300,
+            "scraper.pipelines.HoldingsIndexPipeline": 350,
+        },
+        "EXTENSIONS": {"scraper.extensions.MetricsExtension": 510},
+        "CHECKPOINT_PATH": checkpoint_path,
+        "CHECKPOINT_BACKEND": backend,
+        "HOLDINGS_INDEX_PATH": str(Path(workdir) / mode / "holdings_index.db"),
+        "LOG_ENABLED": False,
+    })
+    crawler.spider = crawler._create_spider()
+    crawler._apply_settings()
+    pipelines = ItemPipelineManager.from_crawler(crawler)
+    result: Dict[str, Any] = {}
+
+    async def scrape(item) -> None:
+        item = await pipelines.process_item_async(item)
+        await crawler.signals.send_catch_log_async(signals.item_scraped, item=item, response=None,
+                                                   spider=crawler.spider)
+
+    async def run() -> None:
+        await pipelines.open_spider_async()
+        managers = set()
+        items = rows = 0
+        seconds = 0.0
+        for fields, data in make_filings(filings, holdings):
+            # The manager and filing items are the same in both modes and aren't timed
+            if fields["manager_id"] not in managers:
+                managers.add(fields["manager_id"])
+                await scrape(ManagerItem(id=fields["manager_id"], name=fields["manager_name"], link=""))
+            await scrape(FilingItem(manager_id=fields["manager_id"], filing_id=fields["filing_id"],
+                                    quarter=fields["quarter"], filing_date=fields["filing_date"], filing_url=""))
+            started = time.perf_counter()
+            if mode == "batch":
+                await scrape(holdings_batch_item(data, fields))
+                items += 1
+            else:
+                for row in data:
+                    await scrape(holding_item(row, fields))
+                items += len(data)
+            seconds += time.perf_counter() - started
+            rows += len(data)
+        started = time.perf_counter()
+        await pipelines.close_spider_async()
+        result.update({
+            "seconds": round(seconds, 3),
+            "close_seconds": round(time.perf_counter() - started, 3),
+            "items": items,
+            "holdings": rows,
+        })
+
+    def finish(failure=None) -> None:
+        if failure is not None:
+            result["error"] = failure.getTraceback()
+        reactor.stop()
+
+    reactor.callWhenRunning(lambda: deferred_from_coro(run()).addBoth(finish))
+    reactor.run()
+    if "error" in result:
+        raise SystemExit(result["error"])
+
+    checkpoint = checkpoint_from_settings(crawler.settings)
+    dump = json.dumps(checkpoint.get_all(), sort_keys=True, default=plain)
+    result["checkpoint_md5"] = hashlib.md5(dump.encode()).hexdigest()
+    return result
+
+
+def run(workdir: str, mode: str, backend: str, filings: int, holdings: int) -> dict:
+    stdout = subprocess.run(
+        [sys.executable, "-m", "benchmarks.pipeline_benchmark", "--measure", mode, "--workdir", workdir,
+         "--backend", backend, "--filings", str(filings), "--holdings", str(holdings)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filings", type=int, default=2000)
+    parser.add_argument("--holdings", type=int, default=300, help="holdings per filing")
+    parser.add_argument("--backend", default="json", choices=("json", "journal", "sqlite"))
+    parser.add_argument("--measure", default=None, choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.workdir, args.measure, args.backend, args.filings, args.holdings)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {mode: run(workdir, mode, args.backend, args.filings, args.holdings) for mode in MODES}
+    row, batch = results["row"], results["batch"]
+    for mode, result in results.items():
+        per_holding = result["seconds"] / result["holdings"] * 1e6
+        print(f"{mode:<6} {result['items']:>9} items  {result['seconds']:8.2f}s  {per_holding:6.2f} µs/holding  "
+              f"close {result['close_seconds']:.2f}s")
+    print(f"batch items: {row['seconds'] / batch['seconds']:.1f}x less pipeline time")
+    if row["checkpoint_md5"] != batch["checkpoint_md5"]:
+        raise SystemExit("row and batch items left different checkpoints")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark the columnar process_data engine against the row-by-row loop.
+
+Usage:
+    python -m benchmarks.processor_benchmark --managers 5000 --holdings 200
+"""
+import argparse
+import random
+import time
+from typing import Any, Dict
+
+from scraper.storage.columnar import compute_diffs
+from scraper.storage.processor import ROW_COLUMNS, compute_diffs_loop
+
+import pandas as pd
+
+
+def make_checkpoint(managers: int, holdings: int, missing: float = 0.0, seed: int = 0) -> Dict[str, Any]:
+    """Synthetic checkpoint with up to two filings per manager and comma-formatted amounts."""
+    rng = random.Random(seed)
+    universe = [f"SYM{i}" for i in range(holdings * 4)]
+
+    def amount() -> Any:
+        if missing and rng.random() < missing:
+            return rng.choice([None, "", "N/A", 0])
+        return f"{rng.randint(0, 10 ** 7):,}"
+
+    def filing(filing_id: str, quarter: str) -> Dict[str, Any]:
+        return {
+            "quarter": quarter,
+            "filing_url": f"/13f/{filing_id}",
+            "filing_date": "2/14/2025",
+            "filing_id": filing_id,
+            "holdings": {
+                symbol: {"shares": amount(), "value": amount(), "cusip": f"{int(symbol[3:]):09d}"}
+                for symbol in rng.sample(universe, rng.randint(1, holdings * 2))
+            },
+        }
+
+    data = {}
+    for i in range(managers):
+        manager_id = str(100000 + i)
+        filings = {}
+        for q, quarter in enumerate(["Q4 2024", "Q3 2024"][:rng.choice([0, 1, 2, 2, 2])]):
+            filing_id = f"{manager_id}{q}"
+            filings[filing_id] = filing(filing_id, quarter)
+        data[manager_id] = {"id": manager_id, "name": f"Fund {i}", "filing_url": f"/manager/{manager_id}", "filings": filings}
+    return data
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--managers", type=int, default=5000)
+    parser.add_argument("--holdings", type=int, default=100, help="average holdings per filing")
+    parser.add_argument("--missing", type=float, default=0.0, help="fraction of blank or malformed amounts")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    checkpoint = make_checkpoint(args.managers, args.holdings, args.missing)
+    print(f"{args.managers} managers, {sum(len(f['holdings']) for m in checkpoint.values() for f in m['filings'].values())} holdings")
+
+    loop_times, columnar_times = [], []
+    for _ in range(args.repeat):
+        rows, elapsed = timed(lambda data: pd.DataFrame(compute_diffs_loop(data), columns=ROW_COLUMNS), checkpoint)
+        loop_times.append(elapsed)
+        df, elapsed = timed(compute_diffs, checkpoint)
+        columnar_times.append(elapsed)
+
+    if rows.to_csv(index=False) != df.to_csv(index=False):
+        raise SystemExit("columnar output differs from the loop engine")
+
+    loop, columnar = min(loop_times), min(columnar_times)
+    print(f"loop:     {loop:.3f}s")
+    print(f"columnar: {columnar:.3f}s ({loop / columnar:.1f}x)")
+    print(f"rows:     {len(df)} (identical CSV)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Time and peak memory of checkpoint load, save and processing as the
+checkpoint grows, for every storage backend.
+
+For each scale a synthetic checkpoint (benchmarks/synthetic_checkpoint.py) is
+written once per backend, then a fresh process measures:
+
+    load      open the checkpoint and materialize get_all()
+    save      write all of it back: save() for json, compact() for the
+              journal's snapshot, import into a new database for sqlite
+    process   process_data to a CSV, which must be the same for every backend
+
+Peak RSS is taken per phase where Linux lets the high-water mark be reset
+(/proc/self/clear_refs), and is the process's peak so far elsewhere. The
+summary gives µs per holding and how each phase grows with the checkpoint
+(1.0 is linear), so a change can be compared before and after at sizes well
+beyond a test crawl.
+
+Usage:
+    python -m benchmarks.scale_benchmark --scales 1000,4000,16000 --filings 4 --holdings 100
+    python -m benchmarks.scale_benchmark --backends sqlite --engine loop --json scale.json
+"""
+import argparse
+import hashlib
+import json
+import math
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.streaming_processor import peak_rss_mb
+from benchmarks.synthetic_checkpoint import generate_managers, write_checkpoint
+
+BACKENDS = ("json", "journal", "sqlite")
+PHASES = ("load", "save", "process")
+
+
+def reset_peak_rss() -> bool:
+    """Reset this process's peak RSS to its current RSS; False where that isn't supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(path: str, backend: str, compact: bool, engine: str) -> dict:
+    """Load, save and process the checkpoint in this process."""
+    import resource
+
+    from scraper.storage.backends import open_checkpoint
+    from scraper.storage.processor import process_data
+
+    result: Dict[str, Any] = {"peak_reset": reset_peak_rss()}
+
+    def phase(name: str, started: float) -> None:
+        result[f"{name}_seconds"] = round(time.perf_counter() - started, 3)
+        result[f"{name}_rss_mb"] = round(peak_rss_mb(resource.RUSAGE_SELF), 1)
+        reset_peak_rss()
+
+    started = time.perf_counter()
+    options = {} if backend == "sqlite" else {"compact": compact}
+    checkpoint = open_checkpoint(path, backend, **options)
+    data = checkpoint.get_all()
+    phase("load", started)
+
+    started = time.perf_counter()
+    if backend == "json":
+        checkpoint.save()
+    elif backend == "journal":
+        checkpoint.compact()
+    else:
+        copy = open_checkpoint(str(Path(path).with_name("copy.json")), backend)
+        copy.import_managers(data)
+        copy.close()
+    phase("save", started)
+
+    output = str(Path(path).with_name("processed_data.csv"))
+    started = time.perf_counter()
+    process_data(data, output, engine)
+    phase("process", started)
+
+    with open(output, "rb") as f:
+        result["csv_md5"] = hashlib.md5(f.read()).hexdigest()
+    return result
+
+
+def run(path: str, backend: str, compact: bool, engine: str) -> dict:
+    command = [sys.executable, "-m", "benchmarks.scale_benchmark", "--measure", path, "--backends", backend,
+               "--engine", engine]
+    if compact:
+        command.append("--compact")
+    stdout = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(stdout.splitlines()[-1])
+
+
+def growth(results: List[dict], phase: str) -> float:
+    """Exponent of a phase's time in the holdings count between the smallest and largest scale."""
+    small, large = results[0], results[-1]
+    if large["holdings"] <= small["holdings"] or not small[f"{phase}_seconds"]:
+        return math.nan
+    return math.log(large[f"{phase}_seconds"] / small[f"{phase}_seconds"]) / math.log(
+        large["holdings"] / small["holdings"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="250,1000,4000", help="comma separated manager counts")
+    parser.add_argument("--filings", type=float, default=4, help="average filings per manager")
+    parser.add_argument("--holdings", type=float, default=100, help="average holdings per filing")
+    parser.add_argument("--skew", type=float, default=1.5, help="Pareto shape of holdings per filing, above 1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated backends to compare")
+    parser.add_argument("--compact", action="store_true",
+                        help="load json and journal checkpoints as compact records (CHECKPOINT_COMPACT=true)")
+    parser.add_argument("--engine", default="columnar", choices=("columnar", "loop"))
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.backends, args.compact, args.engine)))
+        return
+
+    backends = args.backends.split(",")
+    results: Dict[str, List[dict]] = {backend: [] for backend in backends}
+    print(f"{'managers':>8} {'backend':<8} {'holdings':>10} {'size MB':>8}   "
+          + "   ".join(f"{name:>7} s {'peak MB':>8}" for name in PHASES))
+    for managers in [int(scale) for scale in args.scales.split(",")]:
+        csv_md5 = None
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as workdir:
+                path = str(Path(workdir) / "checkpoint.json")
+                started = time.perf_counter()
+                holdings = write_checkpoint(path, generate_managers(
+                    managers, args.filings, args.holdings, args.skew, seed=args.seed), backend)
+                generate = time.perf_counter() - started
+                size = sum(file.stat().st_size for file in Path(workdir).glob("checkpoint.*"))
+                result = run(path, backend, args.compact, args.engine)
+            result.update({"managers": managers, "holdings": holdings, "bytes": size,
+                           "generate_seconds": round(generate, 2)})
+            results[backend].append(result)
+            print(f"{managers:>8} {backend:<8} {holdings:>10} {size / 2 ** 20:>8.1f}   " + "   ".join(
+                f"{result[f'{name}_seconds']:>9.2f} {result[f'{name}_rss_mb']:>8.1f}" for name in PHASES))
+            if csv_md5 is not None and result["csv_md5"] != csv_md5:
+                raise SystemExit(f"{backend} wrote a different CSV for {managers} managers")
+            csv_md5 = result["csv_md5"]
+
+    print()
+    print(f"{'backend':<8} " + "   ".join(f"{name + ' µs/holding':>28}" for name in PHASES))
+    for backend, runs in results.items():
+        cells = []
+        for name in PHASES:
+            per_holding = " ".join(f"{result[f'{name}_seconds'] / max(result['holdings'], 1) * 1e6:.1f}"
+                                   for result in runs)
+            cells.append(f"{per_holding:>19} (n^{growth(runs, name):.2f})")
+        print(f"{backend:<8} " + "   ".join(cells))
+    if not all(result["peak_reset"] for runs in results.values() for result in runs):
+        print("peak RSS couldn't be reset between phases: each phase shows the process's peak so far")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
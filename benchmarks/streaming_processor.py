@@ -0,0 +1,106 @@
+"""
+Compare process_data on the whole checkpoint with the streaming, chunked
+process_parallel (PROCESSING_MODE=parallel) on a generated sqlite checkpoint.
+
+Each run happens in a fresh process and reports wall time, the peak RSS of
+that process and of its largest worker, and the CSV's md5, which must be the
+same for every run.
+
+Usage:
+    python -m benchmarks.streaming_processor --managers 50000 --holdings 100 --workers 1,2,4
+"""
+import argparse
+import hashlib
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def peak_rss_mb(who: int) -> float:
+    """Peak RSS of this process or of its largest child."""
+    if who == resource.RUSAGE_SELF:
+        # ru_maxrss survives exec, so it would include the generating parent's peak; VmHWM doesn't
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(path: str, output: str, workers: int, chunk_size: int) -> dict:
+    """Process the checkpoint in this process: workers 0 for process_data, else process_parallel."""
+    from scraper.storage.parallel import process_parallel
+    from scraper.storage.processor import process_data
+    from scraper.storage.sqlite_checkpoint import SQLiteCheckpointManager
+
+    checkpoint = SQLiteCheckpointManager(path)
+    started = time.perf_counter()
+    if workers:
+        process_parallel(checkpoint, output, chunk_size=chunk_size, workers=workers)
+    else:
+        process_data(checkpoint.get_all(), output)
+    elapsed = time.perf_counter() - started
+    with open(output, "rb") as f:
+        md5 = hashlib.md5(f.read()).hexdigest()
+    return {
+        "seconds": round(elapsed, 2),
+        "rss_mb": round(peak_rss_mb(resource.RUSAGE_SELF), 1),
+        "worker_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "csv_md5": md5,
+    }
+
+
+def run(path: str, output: str, workers: int, chunk_size: int) -> dict:
+    stdout = subprocess.run(
+        [sys.executable, "-m", "benchmarks.streaming_processor", "--measure", path, "--output", output,
+         "--workers", str(workers), "--chunk-size", str(chunk_size)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--managers", type=int, default=50000)
+    parser.add_argument("--holdings", type=int, default=100, help="average holdings per filing")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts to compare")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.output, int(args.workers), args.chunk_size)))
+        return
+
+    from benchmarks.processor_benchmark import make_checkpoint
+    from scraper.storage.sqlite_checkpoint import SQLiteCheckpointManager
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = str(Path(workdir) / "checkpoint.json")
+        checkpoint = SQLiteCheckpointManager(path)
+        checkpoint.import_managers(make_checkpoint(args.managers, args.holdings))
+        checkpoint.close()
+        print(f"checkpoint: {Path(path).with_suffix('.db').stat().st_size / 2 ** 20:.1f} MB of sqlite")
+
+        output = str(Path(workdir) / "processed_data.csv")
+        full = run(path, output, 0, args.chunk_size)
+        print(f"{'full':<12} {full['seconds']:7.2f}s   peak {full['rss_mb']:8.1f} MB RSS")
+        for workers in [int(w) for w in args.workers.split(",")]:
+            result = run(path, output, workers, args.chunk_size)
+            print(f"{f'{workers} workers':<12} {result['seconds']:7.2f}s   peak {result['rss_mb']:8.1f} MB RSS   "
+                  f"worker {result['worker_rss_mb']:8.1f} MB   {full['seconds'] / result['seconds']:.1f}x")
+            if result["csv_md5"] != full["csv_md5"]:
+                raise SystemExit(f"{workers} workers wrote a different CSV")
+
+
+if __name__ == "__main__":
+    main()
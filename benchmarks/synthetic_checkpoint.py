@@ -0,0 +1,247 @@
+"""
+Generate large, realistic checkpoints in the shape CheckpointPipeline writes.
+
+Every manager, filing and holding record has the fields, field order and
+types the pipelines store: normalized holdings (scraper/normalize.py) keyed by
+holding_key, filings with their reported value and holdings count as listed.
+Sizes are skewed the way the real universe is:
+
+    filings per manager    geometric around --filings, some managers with none
+                           yet, and the odd amendment filed for a quarter
+    holdings per filing    Pareto around --holdings (--skew is its shape: lower
+                           is a heavier tail), capped at half the universe
+    securities             drawn from a Zipf-weighted universe, so the biggest
+                           names are held by most managers
+
+A manager's older filings are its latest portfolio walked back quarter by
+quarter, with positions dropped, added and resized, so processing finds
+buys, sells and holds in realistic proportions.
+
+Usage:
+    python -m benchmarks.synthetic_checkpoint checkpoints/synthetic.json --managers 50000 --filings 8
+    python -m benchmarks.synthetic_checkpoint checkpoints/synthetic.json --backend sqlite --skew 1.2
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+
+from scraper.normalize import holding_key
+
+# Share of managers scraped before any of their filings, and of filings followed by an amendment
+NO_FILINGS = 0.05
+AMENDMENTS = 0.05
+# Per quarter walked back: share of positions that were already held, and that kept their share count
+RETAINED = 0.85
+UNCHANGED = 0.2
+# Share of positions that are puts or calls
+OPTIONS = 0.01
+
+LATEST_QUARTER = 2024 * 4 + 3
+_FILING_DATES = ("5/15/{year}", "8/14/{year}", "11/14/{year}", "2/14/{next_year}")
+_CLASSES = ("COM", "COM", "COM", "COM", "COM", "COM", "CL A", "SHS", "SPONSORED ADR", "NOTE")
+
+
+class Universe:
+    """Securities the generated managers hold: Zipf-weighted, with a few blank symbols and non-common classes."""
+
+    def __init__(self, size: int, rng: np.random.Generator):
+        self.size = size
+        self.weights = 1.0 / np.arange(1, size + 1) ** 0.8
+        self.weights /= self.weights.sum()
+        self.cusips = [f"{index * 7919 % 10 ** 9:09d}" for index in range(size)]
+        self.symbols = ["" if rng.random() < 0.02 else f"S{index}" for index in range(size)]
+        self.issuers = [f"Issuer {index} Inc" for index in range(size)]
+        self.classes = [_CLASSES[index % len(_CLASSES)] for index in range(size)]
+        # Price per share in dollars, for value ($000) = shares * price / 1000
+        self.prices = np.exp(rng.normal(3.5, 1.0, size))
+
+    def sample(self, count: int, rng: np.random.Generator) -> np.ndarray:
+        """count distinct security indexes, popular ones first more often."""
+        count = min(count, self.size)
+        drawn = rng.choice(self.size, size=count * 2 + 16, p=self.weights)
+        _, first = np.unique(drawn, return_index=True)
+        picked = drawn[np.sort(first)][:count]
+        if len(picked) < count:
+            rest = np.setdiff1d(np.arange(self.size), picked)
+            picked = np.concatenate([picked, rng.choice(rest, count - len(picked), replace=False)])
+        return picked
+
+
+def quarter_label(quarter: int) -> str:
+    return f"Q{quarter % 4 + 1} {quarter // 4}"
+
+
+def filing_date(quarter: int) -> str:
+    year = quarter // 4
+    return _FILING_DATES[quarter % 4].format(year=year, next_year=year + 1)
+
+
+def holdings_record(universe: Universe, positions: np.ndarray, options: np.ndarray,
+                    shares: np.ndarray) -> Dict[str, Dict[str, Any]]:
+    """Holdings of one filing, key -> record, as NormalizationPipeline and CheckpointPipeline store them."""
+    values = (shares * universe.prices[positions] / 1000).astype(np.int64) + 1
+    total = int(values.sum()) or 1
+    holdings = {}
+    for security, option, count, value in zip(positions.tolist(), options.tolist(), shares.tolist(),
+                                               values.tolist()):
+        symbol, cusip, cl = universe.symbols[security], universe.cusips[security], universe.classes[security]
+        holdings[holding_key(cusip, cl, symbol, option)] = {
+            "shares": count,
+            "value": value,
+            "cusip": cusip,
+            "symbol": symbol,
+            "issuer": universe.issuers[security],
+            "cl": cl,
+            "percentage": round(value / total * 100, 2),
+            "principal": "",
+            "option": option,
+        }
+    return holdings
+
+
+def generate_managers(managers: int, filings: float = 4, holdings: float = 100, skew: float = 1.5,
+                      universe: int = 0, seed: int = 0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (manager_id, manager record) of a synthetic checkpoint, one manager at a time.
+
+    Args:
+        managers: Number of managers
+        filings: Average filings per manager with filings
+        holdings: Average holdings per filing, before capping
+        skew: Pareto shape of the holdings per filing, above 1
+        universe: Securities to draw from, 0 for 50 per average holding (at least 5000)
+        seed: Random seed; the same arguments give the same checkpoint
+    """
+    rng = np.random.default_rng(seed)
+    securities = Universe(universe or max(int(holdings * 50), 5000), rng)
+    # Classical Pareto with the requested mean: scale * (1 + Lomax(skew))
+    scale = holdings * (skew - 1) / skew
+
+    for number in range(managers):
+        manager_id = str(100000 + number)
+        manager = {
+            "id": manager_id,
+            "name": f"Fund {number} Capital",
+            "filing_url": f"/manager/{manager_id}-fund-{number}-capital",
+            "filings": {},
+        }
+        if rng.random() < NO_FILINGS:
+            yield manager_id, manager
+            continue
+
+        quarters = min(int(rng.geometric(1 / max(filings, 1))), int(filings * 8) or 1)
+        size = max(1, min(int(scale * (1 + rng.pareto(skew))), securities.size // 2))
+        positions = securities.sample(size, rng)
+        options = np.where(rng.random(size) < OPTIONS, rng.choice(["Put", "Call"], size), "")
+        shares = np.exp(rng.normal(10, 2, size)).astype(np.int64) + 1
+
+        for back in range(quarters):
+            quarter = LATEST_QUARTER - back
+            amended = rng.random() < AMENDMENTS
+            for amendment in range(2 if amended else 1):
+                filing_id = f"{manager_id}{len(manager['filings']):03d}"
+                filing_holdings = holdings_record(securities, positions, options, shares)
+                manager["filings"][filing_id] = {
+                    "quarter": quarter_label(quarter),
+                    "filing_url": f"/13f/{filing_id}-fund-{number}-capital-13f-hr{'-a' if amendment else ''}",
+                    "filing_date": filing_date(quarter),
+                    "filing_id": filing_id,
+                    "holdings": filing_holdings,
+                    "reported_value": f"{sum(holding['value'] for holding in filing_holdings.values()):,}",
+                    "reported_holdings": str(len(filing_holdings)),
+                }
+            # The quarter before: drop and add positions, resize the others
+            held = len(positions)
+            kept = rng.random(held) < RETAINED
+            resized = np.where(rng.random(held) < UNCHANGED, 1.0, np.exp(rng.normal(0, 0.3, held)))
+            added = securities.sample(max(0, size - int(kept.sum())), rng)
+            added = added[~np.isin(added, positions[kept])]
+            positions = np.concatenate([positions[kept], added])
+            options = np.concatenate([options[kept], np.full(len(added), "", dtype=options.dtype)])
+            shares = np.concatenate([
+                (shares[kept] * resized[kept]).astype(np.int64) + 1,
+                np.exp(rng.normal(10, 2, len(added))).astype(np.int64) + 1,
+            ])
+        yield manager_id, manager
+
+
+def write_checkpoint(path: str, managers: Iterable[Tuple[str, Dict[str, Any]]], backend: str = "json",
+                     chunk_size: int = 1000) -> int:
+    """
+    Write managers to a new checkpoint of a backend, without holding them all in memory.
+
+    The json file is byte for byte what CheckpointManager.save writes, the
+    journal backend gets the snapshot its compact() writes and no journal,
+    and sqlite imports the managers chunk by chunk. Returns the holdings written.
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+
+    def counted(chunk: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        nonlocal count
+        for manager_id, manager in chunk:
+            count += sum(len(filing["holdings"]) for filing in manager["filings"].values())
+            yield manager_id, manager
+
+    if backend == "sqlite":
+        from scraper.storage.sqlite_checkpoint import SQLiteCheckpointManager
+
+        checkpoint = SQLiteCheckpointManager(path)
+        chunk: Dict[str, Any] = {}
+        for manager_id, manager in counted(managers):
+            chunk[manager_id] = manager
+            if len(chunk) >= chunk_size:
+                checkpoint.import_managers(chunk)
+                chunk = {}
+        checkpoint.import_managers(chunk)
+        checkpoint.close()
+        return count
+
+    if backend not in ("json", "journal"):
+        raise ValueError(f"Unknown checkpoint backend: {backend}")
+    tmp_path = target.with_name(target.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        separator = "{"
+        for manager_id, manager in counted(managers):
+            if backend == "json":
+                # json.dump(data, indent=2) one manager at a time
+                record = json.dumps(manager, indent=2).replace("\n", "\n  ")
+                f.write(f"{separator}\n  {json.dumps(manager_id)}: {record}")
+                separator = ","
+            else:
+                f.write(f"{separator}{json.dumps(manager_id)}:" + json.dumps(manager, separators=(",", ":")))
+                separator = ","
+        f.write("{}" if separator == "{" else ("\n}" if backend == "json" else "}"))
+    os.replace(tmp_path, target)
+    if backend == "journal":
+        open(f"{path}.journal", "w").close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="checkpoint to write (CHECKPOINT_PATH; sqlite writes its .db next to it)")
+    parser.add_argument("--backend", default="json", choices=("json", "journal", "sqlite"))
+    parser.add_argument("--managers", type=int, default=10000)
+    parser.add_argument("--filings", type=float, default=4, help="average filings per manager")
+    parser.add_argument("--holdings", type=float, default=100, help="average holdings per filing")
+    parser.add_argument("--skew", type=float, default=1.5, help="Pareto shape of holdings per filing, above 1")
+    parser.add_argument("--universe", type=int, default=0, help="securities to draw from (default 50 per holding)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    managers = generate_managers(args.managers, args.filings, args.holdings, args.skew, args.universe, args.seed)
+    holdings = write_checkpoint(args.path, managers, args.backend)
+    print(f"{args.managers} managers, {holdings} holdings written to {args.path} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
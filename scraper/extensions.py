@@ -0,0 +1,175 @@
+"""
+Scrapy extensions for the 13F scraper project.
+"""
+
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+from scraper import metrics
+
+logger = logging.getLogger(__name__)
+
+# One endpoint per process, shared by the crawlers main runs one after another
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+class RunSummaryExtension:
+    """
+    Append every crawl's final stats to RUN_SUMMARY_PATH.
+
+    One JSON line is written per spider run, so a sequential crawl leaves one
+    record per stage, and a sharded crawl one per stage and shard. main adds a
+    record for the processing step.
+    """
+
+    def __init__(self, path: str, stats, shard: Optional[int] = None):
+        self.path = path
+        self.stats = stats
+        self.shard = shard
+        self.started = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("RUN_SUMMARY_PATH")
+        if not path:
+            raise NotConfigured
+        shard = crawler.settings.getint("SHARD_INDEX") if crawler.settings.getint("SHARD_COUNT", 1) > 1 else None
+        extension = cls(path, crawler.stats, shard)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.started = time.monotonic()
+
+    def spider_closed(self, spider, reason):
+        record = {
+            "stage": spider.name,
+            "reason": reason,
+            "seconds": time.monotonic() - self.started,
+            "stats": self.stats.get_stats(),
+        }
+        if self.shard is not None:
+            record["shard"] = self.shard
+        metrics.append_run_summary(self.path, record)
+        logger.info(f"Run summary for {spider.name} written to {self.path}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.REGISTRY.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the metrics registry at http://host:port/metrics; started once per process."""
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        _metrics_server.daemon_threads = True
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{_metrics_server.server_port}/metrics")
+    return _metrics_server
+
+
+class MetricsExtension:
+    """
+    Feed crawl-level measurements into scraper.metrics and expose them.
+
+    Counts responses and items, observes download latency, and samples queue
+    depths and in-flight requests every METRICS_SAMPLE_INTERVAL seconds. With
+    METRICS_PORT set the registry is served in the Prometheus text format
+    while the crawl runs, and METRICS_SUMMARY_PATH receives a JSON snapshot
+    whenever a spider closes.
+    """
+
+    def __init__(self, crawler, port: int, summary_path: str, interval: float):
+        self.crawler = crawler
+        self.port = port
+        self.summary_path = summary_path
+        self.interval = interval
+        self.sampler: Optional[task.LoopingCall] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("METRICS_ENABLED", True):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            port=settings.getint("METRICS_PORT", 0),
+            summary_path=settings.get("METRICS_SUMMARY_PATH"),
+            interval=settings.getfloat("METRICS_SAMPLE_INTERVAL", 1.0),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(extension.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(extension.item_error, signal=signals.item_error)
+        return extension
+
+    def spider_opened(self, spider):
+        if self.port:
+            start_metrics_server(self.port)
+        self.sampler = task.LoopingCall(self.sample, spider)
+        self.sampler.start(self.interval)
+
+    def spider_closed(self, spider, reason):
+        if self.sampler is not None and self.sampler.running:
+            self.sampler.stop()
+        self.sample(spider)
+        if self.summary_path:
+            metrics.write_summary(self.summary_path)
+
+    def response_received(self, response, request, spider):
+        metrics.inc("scraper_responses_total", spider=spider.name, status=response.status)
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            metrics.observe("scraper_download_seconds", latency, spider=spider.name,
+                            slot=request.meta.get("download_slot", ""))
+
+    def item_scraped(self, item, response, spider):
+        metrics.inc("scraper_items_total", spider=spider.name, item=type(item).__name__, outcome="scraped")
+
+    def item_dropped(self, item, response, exception, spider):
+        metrics.inc("scraper_items_total", spider=spider.name, item=type(item).__name__, outcome="dropped")
+
+    def item_error(self, item, response, spider, failure):
+        metrics.inc("scraper_items_total", spider=spider.name, item=type(item).__name__, outcome="error")
+
+    def sample(self, spider):
+        """Record queue depths and in-flight counts of the engine's components."""
+        engine = self.crawler.engine
+        if engine is None:
+            return
+        name = spider.name
+        scheduler = engine.scheduler
+        if scheduler is not None:
+            metrics.set_gauge("scraper_scheduler_queue_depth", len(scheduler), spider=name)
+        downloader = engine.downloader
+        metrics.set_gauge("scraper_downloader_active", len(downloader.active), spider=name)
+        for key, slot in list(downloader.slots.items()):
+            metrics.set_gauge("scraper_slot_queue_depth", len(slot.queue), spider=name, slot=key)
+            metrics.set_gauge("scraper_slot_transferring", len(slot.transferring), spider=name, slot=key)
+        scraper_slot = engine.scraper.slot
+        if scraper_slot is not None:
+            metrics.set_gauge("scraper_responses_in_callbacks", len(scraper_slot.active), spider=name)
+            metrics.set_gauge("scraper_items_in_pipelines", scraper_slot.itemproc_size, spider=name)
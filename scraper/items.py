@@ -1,3 +1,5 @@
+from typing import Iterator
+
 from scrapy import Item, Field
 
 
@@ -37,4 +39,43 @@ class HoldingItem(Item):
     percentage = Field()
     shares = Field()
     principal = Field()
-    option = Field()
\ No newline at end of file
+    option = Field()
+    # holding_key of the holding, set by NormalizationPipeline
+    key = Field()
+
+# Per-holding fields of HoldingsBatchItem, in the order of a row of the holdings data array
+HOLDING_COLUMNS = ("symbol", "issuer", "cl", "cusip", "value", "percentage", "shares", "principal", "option")
+# Per-holding fields of a normalized HoldingsBatchItem
+BATCH_COLUMNS = HOLDING_COLUMNS + ("key",)
+
+
+class HoldingsBatchItem(Item):
+    """
+    The holdings of a filing as one item: the filing fields once, and each
+    field of BATCH_COLUMNS as a list with one entry per holding.
+    """
+    manager_id = Field()
+    manager_name = Field()
+    filing_id = Field()
+    filing_date = Field()
+    quarter = Field()
+    symbol = Field()
+    issuer = Field()
+    cl = Field()
+    cusip = Field()
+    value = Field()
+    percentage = Field()
+    shares = Field()
+    principal = Field()
+    option = Field()
+    key = Field()
+
+    def row_count(self) -> int:
+        return len(self.get("symbol") or ())
+
+    def holdings(self) -> Iterator[HoldingItem]:
+        """The batch as one HoldingItem per holding, for code that handles single holdings."""
+        columns = [column for column in BATCH_COLUMNS if column in self]
+        filing = {field: self.get(field) for field in self.fields if field not in BATCH_COLUMNS}
+        for row in zip(*(self[column] for column in columns)):
+            yield HoldingItem(**filing, **dict(zip(columns, row)))
@@ -0,0 +1,110 @@
+"""
+Incremental reader for JSON documents shaped like {"data": [row, row, ...]}.
+
+The body is decoded chunk by chunk and each array element is parsed on its
+own, so the full decoded text and the full list of rows never exist at the
+same time. Only the current chunk and the rows of the current batch are held.
+"""
+import codecs
+import json
+from itertools import islice
+from typing import Any, Iterable, Iterator, List
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_TERMINATORS = _WHITESPACE + ",:]}"
+
+
+class _Reader:
+    """Character buffer over a bytes body that is refilled on demand."""
+
+    def __init__(self, body: bytes, chunk_size: int):
+        self.body = memoryview(body)
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+
+    @property
+    def exhausted(self) -> bool:
+        return self.offset >= len(self.body)
+
+    def fill(self) -> bool:
+        """Append the next chunk, dropping what was already consumed. Returns False at end of input."""
+        if self.exhausted:
+            return False
+        chunk = self.body[self.offset:self.offset + self.chunk_size]
+        self.offset += len(chunk)
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=self.exhausted)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or "" at end of input."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at byte {self.offset}, found {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the JSON value at the cursor, reading more input until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number cut off by the chunk boundary ("12" of "12.5") still
+                # decodes; only trust a value once a terminator follows it
+                if self.exhausted or (end < len(self.buf) and self.buf[end] in _TERMINATORS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.fill()
+
+
+def iter_array(body: bytes, key: str = "data", chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """Yield the elements of the array stored under ``key`` in a top-level JSON object."""
+    reader = _Reader(body, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            reader.expect("[")
+            if reader.peek() == "]":
+                return
+            while True:
+                yield reader.value()
+                if reader.peek() == "]":
+                    return
+                reader.expect(",")
+
+        # Other keys are small metadata; decode and discard them
+        reader.value()
+        if reader.peek() == "}":
+            return
+        reader.expect(",")
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Group an iterable into lists of at most ``size`` elements."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -1,36 +1,214 @@
 #!/usr/bin/env python
 """
 Main entry point for the 13F filings scraper.
-This script orchestrates the execution of all spiders in the correct order.
+
+    python -m scraper.main                                      crawl, then process (PROCESS_DATA)
+    python -m scraper.main crawl managers|filings|holdings|all  run one stage or every stage
+    python -m scraper.main process                              turn the checkpoint into the output files
+    python -m scraper.main stats                                summarize the checkpoint
+    python -m scraper.main --profile crawl all                  write profiles of the run to PROFILE_DIR
+
+Scrapy, Twisted, pandas and the spiders are imported by the commands that use
+them, so ``stats`` and ``--help`` start without loading any of them.
 """
 import argparse
-import asyncio
+import json
 import logging
+import os
 import sys
-import platform
+import time
+from typing import Any, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("managers", "filings", "holdings")
+
+
+class ModuleSettings:
+    """
+    scraper.settings read directly, with the getters of Scrapy's Settings that
+    the storage code uses. Lets commands that never crawl skip importing Scrapy.
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, Any]] = None):
+        from . import settings
+        self.values = {name: getattr(settings, name) for name in dir(settings) if name.isupper()}
+        self.values.update(overrides or {})
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.values.get(name, default)
+
+    def getbool(self, name: str, default: bool = False) -> bool:
+        value = self.get(name, default)
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes")
+        return bool(value)
+
+    def getint(self, name: str, default: int = 0) -> int:
+        return int(self.get(name, default))
+
+    def getfloat(self, name: str, default: float = 0.0) -> float:
+        return float(self.get(name, default))
+
+    def getlist(self, name: str, default: Optional[Sequence[str]] = None) -> list:
+        value = self.get(name, default or [])
+        if isinstance(value, str):
+            return [part.strip() for part in value.split(",") if part.strip()]
+        return list(value)
+
+
+def project_settings():
+    """The full Scrapy settings, for commands that crawl."""
+    from scrapy.utils.project import get_project_settings
+    return get_project_settings()
+
+
+def install_reactor() -> None:
+    """Install the asyncio Twisted reactor; must happen before anything imports twisted.internet.reactor."""
+    import asyncio
+    import platform
+
+    # Ensure the right asyncio policy on Windows
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    from twisted.internet import asyncioreactor
+    asyncioreactor.install()
+
+
+def process(settings):
+    """Turn the checkpoint into the output files and record how long it took."""
+    from . import metrics
+    from .storage.backends import checkpoint_from_settings
+    from .storage.processor import process_data
 
-# Ensure the right asyncio policy on Windows
-if platform.system() == "Windows":
-    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    started = time.perf_counter()
+    checkpoint = checkpoint_from_settings(settings, read_only=True)
+    try:
+        # Change log position covered by a full or parallel run
+        changes_end = checkpoint.changes.size()
+        if settings.get("PROCESSING_MODE") == "parallel":
+            from .storage.parallel import process_parallel
+            rows = process_parallel(
+                checkpoint,
+                settings.get("OUTPUT_PATH"),
+                settings.get("PROCESSING_ENGINE"),
+                settings.getlist("OUTPUT_FORMATS"),
+                settings.getint("PROCESSING_CHUNK_SIZE", 2000),
+                settings.getint("PROCESSING_WORKERS", 0)
+            )
+        elif settings.get("PROCESSING_MODE") == "incremental":
+            from .storage.incremental import process_incremental
+            rows = len(process_incremental(
+                checkpoint,
+                settings.get("OUTPUT_PATH"),
+                settings.get("PROCESSING_ENGINE"),
+                settings.getlist("OUTPUT_FORMATS"),
+                settings.get("PROCESSING_STATE_PATH"),
+                settings.get("CHANGE_FEED_PATH")
+            ))
+        else:
+            rows = len(process_data(
+                checkpoint.get_all(),
+                settings.get("OUTPUT_PATH"),
+                settings.get("PROCESSING_ENGINE"),
+                settings.getlist("OUTPUT_FORMATS")
+            ))
+        if settings.get("PROCESSING_MODE") != "incremental" and settings.get("PROCESSING_STATE_PATH"):
+            from .storage.incremental import mark_processed
+            mark_processed(checkpoint, settings.get("PROCESSING_STATE_PATH"), changes_end)
+        if settings.get("HISTORY_PATH"):
+            from .storage.history import write_history
+            write_history(checkpoint.get_all(), settings.get("HISTORY_PATH"), settings.getint("HISTORY_CHANGE_QUARTERS"))
+    finally:
+        checkpoint.release()
+    if settings.get("RUN_SUMMARY_PATH"):
+        metrics.append_run_summary(settings.get("RUN_SUMMARY_PATH"), {
+            "stage": "process",
+            "seconds": time.perf_counter() - started,
+            "rows": rows,
+        })
+    if settings.getbool("METRICS_ENABLED") and settings.get("METRICS_SUMMARY_PATH"):
+        metrics.write_summary(settings.get("METRICS_SUMMARY_PATH"))
 
-# 🛠️ Install the correct Twisted reactor BEFORE importing `reactor` or `task`
-from twisted.internet import asyncioreactor
-asyncioreactor.install()  # MUST happen before any other twisted import
 
-# Now it's safe to import the reactor
-from twisted.internet import defer, reactor, task
+def crawl(settings, stage: str = "all", process_after: bool = False) -> None:
+    """
+    Run one crawl stage, or with "all" the CRAWL_STAGES (or the pipelined
+    spider when CRAWL_MODE is "pipelined"). SHARDS > 1 runs the stages in
+    worker processes. Processes the checkpoint afterwards if asked to.
+    """
+    stages = settings.getlist("CRAWL_STAGES") if stage == "all" else [stage]
 
-# Now continue with your other imports
-from scrapy.crawler import CrawlerRunner
-from scrapy.utils.project import get_project_settings
-from dotenv import load_dotenv
+    if settings.getint("SHARDS", 1) > 1:
+        from .sharding import ShardedCrawl
+        logger.info(f"Starting sharded crawl with {settings.getint('SHARDS')} workers...")
+        ShardedCrawl(settings, stages).run()
+        if process_after:
+            process(settings)
+        return
 
-from .spiders.managers_spider import ManagersSpider
-from .spiders.fillings_spider import FilingsSpider
-from .spiders.holdings_spider import HoldingsSpider
-from .storage.checkpoint_manager import CheckpointManager
-from .storage.processor import process_data
+    install_reactor()
+    from twisted.internet import defer, task
+    from scrapy.crawler import CrawlerRunner
 
+    runner = CrawlerRunner(settings)
+
+    @defer.inlineCallbacks
+    def run(__reactor):
+        if stage == "all" and settings.get("CRAWL_MODE") == "pipelined":
+            from .spiders.pipelined_spider import PipelinedSpider
+            yield runner.crawl(PipelinedSpider)
+        else:
+            for name in stages:
+                yield runner.crawl(stage_spider(name))
+        if process_after:
+            process(settings)
+
+    logger.info("Starting crawl process...")
+    task.react(run)
+
+
+def stage_spider(stage: str):
+    """Spider class of a crawl stage, imported on demand."""
+    if stage == "managers":
+        from .spiders.managers_spider import ManagersSpider
+        return ManagersSpider
+    if stage == "filings":
+        from .spiders.fillings_spider import FilingsSpider
+        return FilingsSpider
+    if stage == "holdings":
+        from .spiders.holdings_spider import HoldingsSpider
+        return HoldingsSpider
+    raise ValueError(f"Unknown crawl stage: {stage}")
+
+
+def stats(settings, as_json: bool = False) -> Dict[str, Any]:
+    """Print the checkpoint's counts of managers, filings and holdings."""
+    from .storage.backends import checkpoint_from_settings
+
+    started = time.perf_counter()
+    checkpoint = checkpoint_from_settings(settings, read_only=True)
+    try:
+        summary = checkpoint.stats()
+    finally:
+        checkpoint.release()
+    summary["backend"] = settings.get("CHECKPOINT_BACKEND", "json")
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+
+    if as_json:
+        print(json.dumps(summary, indent=2))
+        return summary
+    print(f"checkpoint     {summary['path']} ({summary['backend']}, {summary['bytes'] / 2 ** 20:.1f} MB)")
+    print(f"managers       {summary['managers']} ({summary['managers_with_filings']} with filings)")
+    print(f"filings        {summary['filings']} ({summary['filings_without_holdings']} without holdings)")
+    print(f"holdings       {summary['holdings']}")
+    if "journal_records" in summary:
+        print(f"journal        {summary['journal_records']} records")
+    # "Q4 2024" labels, newest year and quarter first
+    for quarter in sorted(summary["quarters"], key=lambda label: label.split()[::-1], reverse=True):
+        print(f"  {quarter or '(none)':<12} {summary['quarters'][quarter]} filings")
+    return summary
 
 
 def setup_logging(log_level='INFO'):
@@ -45,36 +223,57 @@ def setup_logging(log_level='INFO'):
     )
 
 
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m scraper.main", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="log to stdout and 13f_scraper.log at this level")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile spider callbacks, the checkpoint pipeline and processing into PROFILE_DIR")
+    commands = parser.add_subparsers(dest="command")
 
-def main():
-
-
-    """Main entry point."""
-    # Load environment variables
-    load_dotenv()
-
-    # Set up logging
-    logger = logging.getLogger(__name__)
+    crawl_parser = commands.add_parser("crawl", help="run one crawl stage, or all of them")
+    crawl_parser.add_argument("stage", choices=STAGES + ("all",))
+    crawl_parser.add_argument("--process", action="store_true", help="process the checkpoint after crawling")
 
-    # Update settings
-    settings = get_project_settings()
+    commands.add_parser("process", help="turn the checkpoint into the output files")
 
+    stats_parser = commands.add_parser("stats", help="summarize the checkpoint")
+    stats_parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    return parser
 
-    runner = CrawlerRunner(settings)
-    @defer.inlineCallbacks
-    def crawl(__reactor):
-        yield runner.crawl(ManagersSpider)
-        yield runner.crawl(FilingsSpider)
-        yield runner.crawl(HoldingsSpider)
 
-        checkpoint = CheckpointManager(settings.get("CHECKPOINT_PATH"))
-        process_data(checkpoint.get_all(), settings.get("OUTPUT_PATH"))
-        reactor.stop()
+def main(argv: Optional[Sequence[str]] = None):
+    """Main entry point."""
+    args = build_parser().parse_args(argv)
+    if args.log_level:
+        setup_logging(args.log_level)
+    if args.profile:
+        # Set in the environment, so sharded workers profile themselves too
+        os.environ["PROFILE"] = "true"
 
+    profiler = None
+    if args.command != "stats" and ModuleSettings().getbool("PROFILE"):
+        from .profiling import Profiler
+        profiler = Profiler.from_settings(ModuleSettings())
+        profiler.install()
 
-    logger.info("Starting crawl process...")
-    task.react(crawl)
+    try:
+        if args.command == "stats":
+            stats(ModuleSettings(), args.json)
+        elif args.command == "process":
+            process(ModuleSettings())
+        elif args.command == "crawl":
+            crawl(project_settings(), args.stage, args.process)
+        else:
+            # No command: the whole run, as before subcommands existed
+            settings = project_settings()
+            crawl(settings, "all", settings.getbool("PROCESS_DATA", True))
+    finally:
+        if profiler is not None:
+            profiler.stop()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
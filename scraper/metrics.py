@@ -0,0 +1,235 @@
+"""
+In-process metrics for the crawl and processing pipeline.
+
+A single registry holds counters, gauges and latency histograms keyed by
+metric name and labels. Any module can record into it:
+
+    from scraper import metrics
+    metrics.inc("scraper_items_total", pipeline="checkpoint", item="HoldingItem")
+    with metrics.timer("scraper_process_seconds", step="diff"):
+        ...
+
+MetricsExtension serves the registry in the Prometheus text format while a
+crawl runs, and write_summary dumps it as JSON.
+"""
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds, from half a millisecond to ten seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, as exposed by Prometheus."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th percentile (0-100) by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.percentile(50), 6),
+            "p90": round(self.percentile(90), 6),
+            "p99": round(self.percentile(99), 6),
+            "buckets": list(self.counts),
+        }
+
+    @classmethod
+    def from_summary(cls, summary: Dict[str, Any], buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> "Histogram":
+        """Rebuild a histogram from its summary() so series from a JSON dump can be merged."""
+        histogram = cls(buckets)
+        histogram.counts = list(summary["buckets"])
+        histogram.sum = summary["sum"]
+        histogram.count = summary["count"]
+        return histogram
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters, gauges and histograms."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self.lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the block in the named histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def histogram(self, name: str, **labels: Any) -> Histogram:
+        """All series of a histogram whose labels include the given ones, merged."""
+        wanted = set(_label_key(labels))
+        merged = Histogram()
+        with self.lock:
+            for key, histogram in self.histograms.get(name, {}).items():
+                if wanted <= set(key):
+                    merged.merge(histogram)
+        return merged
+
+    def load(self, snapshot: Dict[str, Any]) -> None:
+        """Add a to_dict() snapshot, e.g. one written by another process, into this registry."""
+        buckets = tuple(snapshot.get("buckets", DEFAULT_BUCKETS))
+        for name, series in snapshot.get("counters", {}).items():
+            for entry in series:
+                self.inc(name, entry["value"], **entry["labels"])
+        for name, series in snapshot.get("gauges", {}).items():
+            for entry in series:
+                self.set_gauge(name, entry["value"], **entry["labels"])
+        with self.lock:
+            for name, series in snapshot.get("histograms", {}).items():
+                for entry in series:
+                    key = _label_key(entry["labels"])
+                    histogram = self.histograms.setdefault(name, {}).get(key)
+                    if histogram is None:
+                        histogram = self.histograms[name][key] = Histogram(buckets)
+                    histogram.merge(Histogram.from_summary(entry, buckets))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """The registry in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{_format_labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{_format_labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly snapshot; histograms keep their bucket counts next to the percentiles."""
+        def series_list(series, value):
+            return [dict(labels=dict(key), **value(item)) for key, item in series.items()]
+
+        with self.lock:
+            return {
+                "buckets": list(DEFAULT_BUCKETS),
+                "counters": {name: series_list(series, lambda v: {"value": v})
+                             for name, series in sorted(self.counters.items())},
+                "gauges": {name: series_list(series, lambda v: {"value": v})
+                           for name, series in sorted(self.gauges.items())},
+                "histograms": {name: series_list(series, Histogram.summary)
+                               for name, series in sorted(self.histograms.items())},
+            }
+
+
+REGISTRY = MetricsRegistry()
+
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+
+def load_summary(path: str, registry: MetricsRegistry = REGISTRY) -> None:
+    """Merge a JSON snapshot written by write_summary into the registry."""
+    with open(path) as f:
+        registry.load(json.load(f))
+
+
+def write_summary(path: str, registry: MetricsRegistry = REGISTRY) -> None:
+    """Write the registry snapshot as JSON, replacing the file atomically."""
+    summary_path = Path(path)
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = summary_path.with_name(summary_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(registry.to_dict(), f, indent=2)
+    tmp_path.replace(summary_path)
+
+
+def append_run_summary(path: str, record: Dict[str, Any]) -> None:
+    """Append one JSON record to a run summary file (RUN_SUMMARY_PATH)."""
+    summary_path = Path(path)
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(summary_path, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
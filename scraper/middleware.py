@@ -2,14 +2,26 @@
 Scrapy middlewares for the 13F scraper project.
 """
 
+import json
 import logging
+import os
 import random
-from typing import Union, Optional
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Tuple, Union, Optional
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
 from scrapy.http import Response, Request
 from scrapy.spiders import Spider
 from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.utils.asyncio import sleep
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.response import response_status_message
+from twisted.internet.defer import Deferred
+
+from scraper import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -37,25 +49,63 @@ class RandomUserAgentMiddleware:
         request.headers['User-Agent'] = user_agent
 
 
+def retry_after_seconds(response: Response) -> Optional[float]:
+    """Delay requested by a Retry-After header given in seconds, if any."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value.decode()))
+    except ValueError:
+        return None
+
+
 class CustomRetryMiddleware(RetryMiddleware):
-    """Custom retry middleware with improved logging."""
+    """
+    Custom retry middleware with improved logging.
+
+    Retries wait for a jittered exponential backoff (RETRY_BACKOFF_BASE,
+    doubled per attempt, capped at RETRY_BACKOFF_MAX, honouring Retry-After)
+    instead of going straight back to the server.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.backoff_base = settings.getfloat('RETRY_BACKOFF_BASE', 0.5)
+        self.backoff_max = settings.getfloat('RETRY_BACKOFF_MAX', 60.0)
 
-    def process_response(self, request: Request, response: Response, spider: Spider) -> Union[Response, Request]:
+    def backoff(self, request: Request, retry_after: Optional[float] = None) -> float:
+        """Full jitter: a random delay up to base * 2^attempt, at least Retry-After."""
+        attempt = request.meta.get('retry_times', 0)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, self.backoff_max)
+
+    async def process_response(self, request: Request, response: Response, spider: Spider) -> Union[Response, Request]:
         """Process response and retry if needed."""
         if request.meta.get('dont_retry', False):
             return response
 
         if response.status in self.retry_http_codes:
             reason = response_status_message(response.status)
-            logger.warning(f"Retrying {request.url} (failed with {response.status}): {reason}")
-            return self._retry(request, reason, spider) or response
+            retry_request = self._retry(request, reason)
+            if retry_request is None:
+                return response
+            delay = self.backoff(request, retry_after_seconds(response))
+            logger.warning(f"Retrying {request.url} in {delay:.2f}s (failed with {response.status}): {reason}")
+            await sleep(delay)
+            return retry_request
 
         return response
 
-    def process_exception(self, request: Request, exception: Exception, spider: Spider) -> Optional[Request]:
+    async def process_exception(self, request: Request, exception: Exception, spider: Spider) -> Optional[Request]:
         """Process exception and retry if needed."""
         logger.error(f"Error processing {request.url}: {exception.__class__.__name__}: {str(exception)}")
-        return super().process_exception(request, exception, spider)
+        retry_request = super().process_exception(request, exception, spider)
+        if retry_request is not None:
+            await sleep(self.backoff(request))
+        return retry_request
 
 
 class SpiderErrorMiddleware:
@@ -70,4 +120,403 @@ class SpiderErrorMiddleware:
 
     def spider_error(self, failure, response, spider):
         """Handle spider errors."""
-        logger.error(f"Spider error processing {response.url}: {failure.value}")
\ No newline at end of file
+        logger.error(f"Spider error processing {response.url}: {failure.value}")
+
+class CallbackTimingMiddleware:
+    """
+    Spider middleware that times spider callbacks.
+
+    Only the time spent inside the callback counts, not the time its items
+    spend in the pipelines. Durations go to the scraper_callback_seconds
+    histogram and outputs to scraper_callback_outputs_total, labelled by
+    spider, callback and output type.
+    """
+
+    async def process_spider_output(self, response, result, spider):
+        callback = getattr(response.request.callback, "__name__", "parse") if response.request else "parse"
+        labels = {"spider": spider.name, "callback": callback}
+        outputs: Dict[str, int] = {}
+        elapsed = 0.0
+        started = time.perf_counter()
+        async for output in result:
+            elapsed += time.perf_counter() - started
+            kind = type(output).__name__
+            outputs[kind] = outputs.get(kind, 0) + 1
+            yield output
+            started = time.perf_counter()
+        elapsed += time.perf_counter() - started
+        metrics.observe("scraper_callback_seconds", elapsed, **labels)
+        for kind, count in outputs.items():
+            metrics.inc("scraper_callback_outputs_total", count, type=kind, **labels)
+
+
+class FrontierMiddleware:
+    """
+    Spider middleware that tells FrontierScheduler when a request's callback
+    has run, so the request is only dropped from the disk frontier once its
+    items have reached the pipelines.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get("FRONTIER_PATH"):
+            raise NotConfigured
+        return cls(crawler)
+
+    async def process_spider_output(self, response, result, spider):
+        async for output in result:
+            yield output
+        scheduler = self.crawler.engine.scheduler
+        if response.request is not None and hasattr(scheduler, "complete"):
+            scheduler.complete(response.request)
+
+
+class ConditionalRequestMiddleware:
+    """
+    Middleware that revalidates previously seen URLs with conditional requests.
+
+    ETag and Last-Modified validators are persisted per URL between runs. A
+    request for a known URL carries If-None-Match/If-Modified-Since, and a 304
+    answer is dropped so the unchanged page is never parsed again.
+    """
+
+    def __init__(self, path: str, stats):
+        self.path = Path(path)
+        self.stats = stats
+        self.validators: Dict[str, List[Optional[str]]] = {}
+        self.changed = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Only enabled in incremental mode."""
+        if not crawler.settings.getbool("INCREMENTAL"):
+            raise NotConfigured
+        middleware = cls(crawler.settings.get("VALIDATORS_PATH", "checkpoints/validators.json"), crawler.stats)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.validators = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Error loading validators: {e}")
+
+    def spider_closed(self, spider):
+        if not self.changed:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.validators, f)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            logger.error(f"Error saving validators: {e}")
+
+    def process_request(self, request: Request, spider: Spider) -> None:
+        """Attach the stored validators to the request."""
+        validators = self.validators.get(request.url)
+        if not validators:
+            return
+        etag, last_modified = validators
+        if etag:
+            request.headers.setdefault('If-None-Match', etag)
+        if last_modified:
+            request.headers.setdefault('If-Modified-Since', last_modified)
+
+    def process_response(self, request: Request, response: Response, spider: Spider) -> Response:
+        """Drop unchanged responses and remember validators of fresh ones."""
+        if response.status == 304:
+            self.stats.inc_value('incremental/not_modified', spider=spider)
+            raise IgnoreRequest(f"Not modified: {request.url}")
+
+        if response.status == 200:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.validators[request.url] = [
+                    etag.decode() if etag else None,
+                    last_modified.decode() if last_modified else None,
+                ]
+                self.changed = True
+        return response
+
+
+class _HostState:
+    """Outcomes of the current window and controller state of one host."""
+
+    def __init__(self, concurrency: int, max_concurrency: int):
+        self.concurrency = concurrency
+        # Slow start: double per clean window until the first congestion signal
+        self.threshold = max_concurrency
+        # Download delay added by throttling, on top of each slot's own
+        self.delay = 0.0
+        # Bumped on every decrease; responses to requests sent before it are stale
+        self.epoch = 0
+        self.in_flight = 0
+        # In-flight requests and requests waiting for a place, per downloader slot
+        self.slot_in_flight: Dict[str, int] = {}
+        self.waiters: Dict[str, Deque[Deferred]] = {}
+        self.latencies: List[float] = []
+        self.responses = 0
+        self.throttled = 0
+        self.errors = 0
+        self.baseline: Optional[float] = None
+        self.consecutive_failures = 0
+        self.breaker = "closed"
+        self.open_until = 0.0
+        self.cooldown = 0.0
+
+    def reset_window(self):
+        self.latencies = []
+        self.responses = 0
+        self.throttled = 0
+        self.errors = 0
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    AIMD controller for per-host concurrency and delay, with a circuit breaker.
+
+    State is kept per host, however many downloader slots its requests are
+    spread over (the pipelined crawl pins one download_slot per stage). A
+    slot's concurrency in DOWNLOAD_SLOTS is a ceiling on that slot's share of
+    the host's limit, never raised. Every window of max(ADAPTIVE_WINDOW,
+    concurrency) responses is judged congested when it saw a 429/503, an
+    error rate above ADAPTIVE_ERROR_RATE, or a p95 latency above
+    ADAPTIVE_LATENCY_FACTOR times the lowest median seen so far. Congestion
+    cuts the concurrency by DECREASE_FACTOR, and once it is at
+    ADAPTIVE_MIN_CONCURRENCY throttling doubles the host's delay instead. A
+    clean window first decays any delay back to zero, then doubles the
+    concurrency during slow start and adds one afterwards. Responses to
+    requests sent before the last decrease are not counted.
+
+    The limit is enforced here by holding requests in process_request; the
+    downloader slots' own concurrency is kept in sync but is not relied on,
+    as the asyncio download queue can start more transfers than it allows.
+
+    CIRCUIT_BREAKER_FAILURES consecutive 5xx responses or download errors
+    open the breaker: requests for that host wait CIRCUIT_BREAKER_COOLDOWN
+    seconds, then a single probe decides whether to close it again or reopen
+    it for twice as long.
+    """
+
+    THROTTLE_CODES = {429, 503}
+    # Gentler than halving, so the limit oscillates closer to what the host allows
+    DECREASE_FACTOR = 0.7
+
+    def __init__(self, crawler, settings):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = settings.getint('ADAPTIVE_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('ADAPTIVE_MAX_CONCURRENCY', settings.getint('CONCURRENT_REQUESTS'))
+        self.initial_concurrency = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        self.window = settings.getint('ADAPTIVE_WINDOW', 10)
+        self.error_rate = settings.getfloat('ADAPTIVE_ERROR_RATE', 0.1)
+        self.latency_factor = settings.getfloat('ADAPTIVE_LATENCY_FACTOR', 3.0)
+        self.max_delay = settings.getfloat('ADAPTIVE_MAX_DELAY', 10.0)
+        self.breaker_failures = settings.getint('CIRCUIT_BREAKER_FAILURES', 10)
+        self.breaker_cooldown = settings.getfloat('CIRCUIT_BREAKER_COOLDOWN', 30.0)
+        self.download_delay = settings.getfloat('DOWNLOAD_DELAY')
+        self.slot_settings = settings.getdict('DOWNLOAD_SLOTS')
+        self.hosts: Dict[str, _HostState] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_CONCURRENCY'):
+            raise NotConfigured
+        return cls(crawler, crawler.settings)
+
+    def _ceiling(self, slot_key: str) -> int:
+        """In-flight limit of a downloader slot: its DOWNLOAD_SLOTS concurrency, else the host's limit."""
+        return self.slot_settings.get(slot_key, {}).get('concurrency') or self.max_concurrency
+
+    def _state(self, request: Request) -> Tuple[str, _HostState, str, object]:
+        """(host, its state, downloader slot key, downloader slot or None) of a request."""
+        downloader = self.crawler.engine.downloader
+        slot_key = request.meta.get('download_slot') or downloader.get_slot_key(request)
+        host = urlparse_cached(request).hostname or slot_key
+        state = self.hosts.get(host)
+        if state is None:
+            initial = min(max(self.initial_concurrency, self.min_concurrency), self.max_concurrency)
+            state = self.hosts[host] = _HostState(initial, self.max_concurrency)
+        slot = downloader.slots.get(slot_key)
+        # Idle slots are garbage collected and recreated with the defaults
+        if slot is not None:
+            slot.concurrency = min(self._ceiling(slot_key), state.concurrency)
+            base_delay = self.slot_settings.get(slot_key, {}).get('delay', self.download_delay)
+            slot.delay = max(base_delay, state.delay)
+        return host, state, slot_key, slot
+
+    def _full(self, state: _HostState, slot_key: str) -> bool:
+        return (state.in_flight >= state.concurrency
+                or state.slot_in_flight.get(slot_key, 0) >= self._ceiling(slot_key))
+
+    async def process_request(self, request: Request, spider: Spider) -> None:
+        """Hold requests while the host or the slot is at its limit, or the host's breaker is open."""
+        host, state, slot_key, _ = self._state(request)
+        while True:
+            wait = self._breaker_wait(host, state)
+            if wait > 0:
+                await sleep(wait)
+            elif self._full(state, slot_key):
+                waiter = Deferred()
+                state.waiters.setdefault(slot_key, deque()).append(waiter)
+                await maybe_deferred_to_future(waiter)
+            else:
+                break
+        state.in_flight += 1
+        state.slot_in_flight[slot_key] = state.slot_in_flight.get(slot_key, 0) + 1
+        metrics.set_gauge("scraper_slot_in_flight", state.in_flight, slot=host)
+        request.meta['adaptive_epoch'] = state.epoch
+        request.meta['adaptive_slot'] = slot_key
+
+    def _release(self, request: Request, host: str, state: _HostState) -> Optional[int]:
+        """Free the request's place in the host; returns its epoch, or None if it was never counted."""
+        epoch = request.meta.pop('adaptive_epoch', None)
+        if epoch is None:
+            return None
+        slot_key = request.meta.pop('adaptive_slot')
+        state.in_flight -= 1
+        state.slot_in_flight[slot_key] -= 1
+        metrics.set_gauge("scraper_slot_in_flight", state.in_flight, slot=host)
+        self._wake(state)
+        return epoch
+
+    def _wake(self, state: _HostState):
+        """Let through as many waiting requests as the host's and their slots' free places allow."""
+        free = state.concurrency - state.in_flight
+        for slot_key, waiters in state.waiters.items():
+            if free <= 0:
+                return
+            count = min(len(waiters), free, self._ceiling(slot_key) - state.slot_in_flight.get(slot_key, 0))
+            for _ in range(max(0, count)):
+                waiters.popleft().callback(None)
+            free -= max(0, count)
+
+    def _breaker_wait(self, host: str, state: _HostState) -> float:
+        if state.breaker == "closed":
+            return 0.0
+        now = time.monotonic()
+        if state.breaker == "open":
+            if now < state.open_until:
+                return state.open_until - now
+            # Let this request through as the probe
+            state.breaker = "half-open"
+            logger.info(f"Circuit breaker half-open for {host}, probing")
+            return 0.0
+        # Probe in flight
+        return min(1.0, state.cooldown)
+
+    def process_response(self, request: Request, response: Response, spider: Spider) -> Response:
+        host, state, _, _ = self._state(request)
+        epoch = self._release(request, host, state)
+        if epoch is None:
+            # Served by a middleware further up (e.g. the HTTP cache)
+            return response
+
+        # 429 means the host is up but wants us slower: AIMD's job, not the breaker's
+        if response.status >= 500:
+            self._record_failure(host, state)
+        else:
+            self._record_success(host, state)
+
+        if response.status in self.THROTTLE_CODES:
+            retry_after = retry_after_seconds(response)
+            if retry_after:
+                state.delay = min(self.max_delay, max(state.delay, retry_after))
+
+        if epoch != state.epoch:
+            return response
+        if response.status in self.THROTTLE_CODES:
+            state.throttled += 1
+        elif response.status >= 500:
+            state.errors += 1
+        else:
+            latency = request.meta.get('download_latency')
+            if latency is not None:
+                state.latencies.append(latency)
+        state.responses += 1
+        self._maybe_adjust(host, state)
+        return response
+
+    def process_exception(self, request: Request, exception: Exception, spider: Spider) -> None:
+        host, state, _, _ = self._state(request)
+        epoch = self._release(request, host, state)
+        # A dropped request (e.g. 304 Not Modified) frees its place but says nothing about the host
+        if epoch is None or isinstance(exception, IgnoreRequest):
+            return None
+        self._record_failure(host, state)
+        # Requests sent before the last decrease say nothing about the current limit
+        if epoch == state.epoch:
+            state.errors += 1
+            state.responses += 1
+            self._maybe_adjust(host, state)
+        return None
+
+    def _record_success(self, host: str, state: _HostState):
+        state.consecutive_failures = 0
+        if state.breaker == "half-open":
+            state.breaker = "closed"
+            state.cooldown = 0.0
+            logger.info(f"Circuit breaker closed for {host}")
+
+    def _record_failure(self, host: str, state: _HostState):
+        state.consecutive_failures += 1
+        if state.breaker == "half-open" or (
+            state.breaker == "closed" and state.consecutive_failures >= self.breaker_failures
+        ):
+            state.cooldown = min(state.cooldown * 2, self.breaker_cooldown * 8) if state.cooldown else self.breaker_cooldown
+            state.breaker = "open"
+            state.open_until = time.monotonic() + state.cooldown
+            self.stats.inc_value('adaptive/breaker_opened')
+            logger.warning(f"Circuit breaker open for {host} for {state.cooldown:.0f}s "
+                           f"after {state.consecutive_failures} consecutive failures")
+
+    def _maybe_adjust(self, host: str, state: _HostState):
+        if state.responses < max(self.window, state.concurrency):
+            return
+
+        failures = state.throttled + state.errors
+        congested = state.throttled > 0 or failures / state.responses > self.error_rate
+        if state.latencies:
+            latencies = sorted(state.latencies)
+            median = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            state.baseline = median if state.baseline is None else min(state.baseline, median)
+            congested = congested or p95 > state.baseline * self.latency_factor
+
+        old_concurrency, old_delay = state.concurrency, state.delay
+        if congested:
+            # A delay serializes the host, so only reach for it once concurrency is exhausted
+            if state.throttled and state.concurrency <= self.min_concurrency:
+                state.delay = min(self.max_delay, max(state.delay * 2, 0.1))
+            state.concurrency = max(self.min_concurrency, int(state.concurrency * self.DECREASE_FACTOR))
+            state.threshold = state.concurrency
+            state.epoch += 1
+            self.stats.inc_value('adaptive/decreases')
+        elif state.delay > 0:
+            state.delay = state.delay / 2 if state.delay > 0.01 else 0.0
+        else:
+            if state.concurrency < state.threshold:
+                state.concurrency = min(state.threshold, state.concurrency * 2)
+            else:
+                state.concurrency += 1
+            state.concurrency = min(self.max_concurrency, state.concurrency)
+            self.stats.inc_value('adaptive/increases')
+
+        self._wake(state)
+        self.stats.set_value(f'adaptive/concurrency/{host}', state.concurrency)
+        metrics.set_gauge("scraper_slot_concurrency", state.concurrency, slot=host)
+        if (state.concurrency, state.delay) != (old_concurrency, old_delay):
+            logger.debug(f"Host {host}: concurrency {old_concurrency} -> {state.concurrency}, "
+                         f"delay {old_delay:.2f}s -> {state.delay:.2f}s "
+                         f"({state.responses} responses, {state.throttled} throttled, {state.errors} errors)")
+        state.reset_window()
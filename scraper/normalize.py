@@ -0,0 +1,133 @@
+"""
+Typed holding records.
+
+The holdings data array carries amounts as "1,234,567" text and percentages
+as whatever the site sends. NormalizationPipeline converts them once, as the
+items are scraped, so the checkpoint and everything downstream work on ints
+and floats:
+
+    shares, value                      int (0 where the text isn't a number, as parse_int)
+    percentage                         float, None when blank
+    symbol, issuer, cl, principal,
+    option                             stripped str, "" when blank
+    cusip                              stripped str, None when blank
+
+A holding is keyed by holding_key (cusip, class, principal type and option)
+rather than by symbol, so holdings with blank or repeated symbols no longer
+overwrite each other, and the checkpoint keeps the whole record in
+RECORD_FIELDS order. Rows of a batch that still share a key are summed into
+one holding, and counted.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+from . import metrics
+from .items import BATCH_COLUMNS, HoldingItem, HoldingsBatchItem
+from .storage.compact import RECORD_FIELDS, TEXT_FIELDS
+from .storage.processor import parse_int
+
+logger = logging.getLogger(__name__)
+
+
+def to_float(value: Any) -> Optional[float]:
+    if type(value) is float:
+        return value
+    if value is None or type(value) is bool:
+        return None
+    try:
+        return float(str(value).replace(",", "").rstrip("%"))
+    except ValueError:
+        return None
+
+
+def to_text(value: Any) -> str:
+    if type(value) is str:
+        return value.strip()
+    return "" if value is None else str(value).strip()
+
+
+def holding_key(cusip: Optional[str], cl: str, symbol: str = "", option: str = "", principal: str = "") -> str:
+    """
+    Checkpoint key of a holding: "cusip|class", with the symbol standing in
+    for a missing cusip, the principal type appended unless it is shares
+    (e.g. "|PRN" for a bond's principal amount), and the option type
+    appended for puts and calls.
+    """
+    key = f"{cusip or symbol}|{cl}"
+    if principal and principal != "SH":
+        key = f"{key}|{principal}"
+    return f"{key}|{option}" if option else key
+
+
+def normalize_holding(item: HoldingItem) -> HoldingItem:
+    """Convert a HoldingItem's fields in place and set its key."""
+    for field in TEXT_FIELDS:
+        item[field] = to_text(item.get(field))
+    item["cusip"] = to_text(item.get("cusip")) or None
+    item["shares"] = parse_int(item.get("shares"))
+    item["value"] = parse_int(item.get("value"))
+    item["percentage"] = to_float(item.get("percentage"))
+    item["key"] = holding_key(item["cusip"], item["cl"], item["symbol"], item["option"], item["principal"])
+    return item
+
+
+def normalize_batch(item: HoldingsBatchItem) -> HoldingsBatchItem:
+    """normalize_holding for every row of a HoldingsBatchItem, column by column."""
+    rows = item.row_count()
+    for field in TEXT_FIELDS:
+        item[field] = [to_text(value) for value in item.get(field) or [None] * rows]
+    item["cusip"] = [to_text(value) or None for value in item.get("cusip") or [None] * rows]
+    item["shares"] = [parse_int(value) for value in item.get("shares") or [None] * rows]
+    item["value"] = [parse_int(value) for value in item.get("value") or [None] * rows]
+    item["percentage"] = [to_float(value) for value in item.get("percentage") or [None] * rows]
+    item["key"] = [holding_key(*fields) for fields in zip(
+        item["cusip"], item["cl"], item["symbol"], item["option"], item["principal"])]
+    if len(set(item["key"])) < rows:
+        merge_duplicates(item)
+    return item
+
+
+def merge_duplicates(item: HoldingsBatchItem) -> int:
+    """
+    Sum the shares, value and percentage of rows sharing a key into the first
+    of them and drop the others, so the stores don't keep only the last one.
+    Returns the number of rows merged away.
+    """
+    first: Dict[str, int] = {}
+    kept: List[int] = []
+    shares, values, percentages = item["shares"], item["value"], item["percentage"]
+    for row, key in enumerate(item["key"]):
+        target = first.setdefault(key, row)
+        if target == row:
+            kept.append(row)
+            continue
+        shares[target] += shares[row]
+        values[target] += values[row]
+        if percentages[row] is not None:
+            percentages[target] = (percentages[target] or 0.0) + percentages[row]
+
+    merged = len(item["key"]) - len(kept)
+    for column in BATCH_COLUMNS:
+        column_values = item[column]
+        item[column] = [column_values[row] for row in kept]
+    metrics.inc("scraper_holding_key_collisions_total", merged)
+    logger.warning(f"Summed {merged} holdings of filing {item.get('filing_id')} into rows with the same key")
+    return merged
+
+
+def normalized(item: Union[HoldingItem, HoldingsBatchItem]) -> Union[HoldingItem, HoldingsBatchItem]:
+    """The holdings item, normalized here unless NormalizationPipeline has already set its key."""
+    if item.get("key") is not None:
+        return item
+    return normalize_batch(item) if isinstance(item, HoldingsBatchItem) else normalize_holding(item)
+
+
+def holding_record(item: HoldingItem) -> Dict[str, Any]:
+    """The checkpoint record of a normalized HoldingItem."""
+    return {field: item.get(field) for field in RECORD_FIELDS}
+
+
+def holding_records(item: HoldingsBatchItem) -> Dict[str, Dict[str, Any]]:
+    """key -> checkpoint record for every row of a normalized HoldingsBatchItem."""
+    columns: List[list] = [item[field] for field in RECORD_FIELDS]
+    return {key: dict(zip(RECORD_FIELDS, row)) for key, row in zip(item["key"], zip(*columns))}
@@ -0,0 +1,78 @@
+"""
+Row extraction for the manager listing and filings pages.
+
+The spiders used to run a chain of ``.css("::text").get("").strip()`` calls
+per cell, which translates every selector to XPath again and builds a
+SelectorList per call. Here the XPath expressions are compiled once, each
+row is walked with lxml's element API and returned as a plain tuple.
+
+Both functions take the lxml root of a parsed page (``response.selector.root``).
+"""
+import re
+from typing import List, NamedTuple, Tuple
+
+from lxml import etree
+
+# Same nodes as the CSS selectors "table a[href*='/manager/']" and "#managerFilings tbody tr"
+_MANAGER_LINKS = etree.XPath("//table//a[contains(@href, '/manager/')]")
+_FILING_ROWS = etree.XPath("//*[@id='managerFilings']//tbody//tr")
+
+# Path component of a URL, as urlparse(href).path
+_URL_PATH = re.compile(r"^(?:[A-Za-z][A-Za-z0-9+.-]*:)?(?://[^/?#]*)?([^?#]*)")
+
+FILING_CELLS = 7
+
+
+class FilingRow(NamedTuple):
+    quarter: str
+    filing_url: str
+    holdings: str
+    value: str
+    top_holdings: str
+    form_type: str
+    filing_date: str
+    filing_id: str
+
+
+def first_text(element) -> str:
+    """
+    The first text node inside the element, like Selector.css("::text").get("").
+
+    That selector is descendant-or-self::text(), so text nested in inline
+    markup counts and comments don't; itertext() walks the same nodes in the
+    same order.
+    """
+    return next(element.itertext(), "")
+
+
+def manager_links(root) -> List[Tuple[str, str, str]]:
+    """(manager_id, name, href) of every manager link on a listing page."""
+    links = []
+    for link in _MANAGER_LINKS(root):
+        href = link.get("href")
+        path_parts = _URL_PATH.match(href).group(1).strip('/').split('/')
+        if len(path_parts) < 2:
+            continue
+        links.append((path_parts[-1].split('-')[0], first_text(link).strip(), href))
+    return links
+
+
+def filing_rows(root) -> List[FilingRow]:
+    """Every complete row of a manager's #managerFilings table, whatever its form type."""
+    rows = []
+    for row in _FILING_ROWS(root):
+        cells = list(row.iter("td"))
+        if len(cells) < FILING_CELLS:
+            continue
+        links = list(cells[0].iter("a"))
+        rows.append(FilingRow(
+            quarter=next((text for link in links for text in link.itertext()), "").strip(),
+            filing_url=links[0].get("href", "") if links else "",
+            holdings=first_text(cells[1]).strip(),
+            value=first_text(cells[2]).strip(),
+            top_holdings=first_text(cells[3]).strip(),
+            form_type=first_text(cells[4]).strip(),
+            filing_date=first_text(cells[5]).strip(),
+            filing_id=first_text(cells[6]).strip(),
+        ))
+    return rows
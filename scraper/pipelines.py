@@ -1,26 +1,54 @@
 import logging
-from typing import Dict, List, Any
-from scrapy.exceptions import DropItem
+import queue
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import defer, task
+from twisted.internet.threads import deferToThread
+from . import metrics
+from .storage.backends import checkpoint_from_settings
 from .storage.checkpoint_manager import CheckpointManager
-from scraper.items import ManagerItem, FilingItem, HoldingItem
+from .storage.holdings_index import HoldingsIndex, index_from_settings
+from .normalize import holding_record, holding_records, normalize_batch, normalize_holding, normalized
+from scraper.items import BATCH_COLUMNS, ManagerItem, FilingItem, HoldingItem, HoldingsBatchItem
+
+
+class NormalizationPipeline:
+    """Pipeline converting holdings to typed fields with a holding_key (scraper/normalize.py), ahead of the stores."""
+
+    def process_item(self, item, spider):
+        with metrics.timer("scraper_pipeline_seconds", pipeline="normalize", item=type(item).__name__):
+            if isinstance(item, HoldingItem):
+                normalize_holding(item)
+            elif isinstance(item, HoldingsBatchItem):
+                normalize_batch(item)
+        return item
 
 
 class CheckpointPipeline:
     """Pipeline for saving items to checkpoint."""
 
-    def __init__(self, checkpoint_path):
+    def __init__(self, checkpoint_path, checkpoint: Optional[CheckpointManager] = None):
         self.checkpoint_path = checkpoint_path
-        self.checkpoint = CheckpointManager(checkpoint_path)
+        self.checkpoint = checkpoint if checkpoint is not None else CheckpointManager(checkpoint_path)
         self.logger = logging.getLogger(__name__)
         self.stock_quarters: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            checkpoint_path=crawler.settings.get('CHECKPOINT_PATH', 'checkpoints/13f-info.json')
+            checkpoint_path=crawler.settings.get('CHECKPOINT_PATH', 'checkpoints/13f-info.json'),
+            checkpoint=checkpoint_from_settings(crawler.settings)
         )
 
     def process_item(self, item, spider):
+        with metrics.timer("scraper_pipeline_seconds", pipeline="checkpoint", item=type(item).__name__):
+            return self._process_item(item)
+
+    def _process_item(self, item):
         try:
             if isinstance(item, ManagerItem):
                 manager_id = item['id']
@@ -28,42 +56,292 @@ class CheckpointPipeline:
                     self.logger.info(f"Skipping already processed manager: {item['name']}")
                     raise DropItem(f"Manager {manager_id} already processed")
 
-                self.checkpoint[manager_id] = {
+                self.checkpoint.add_manager(manager_id, {
                     'id': manager_id,
                     'name': item['name'],
                     'filing_url': item['link'],
                     'filings': {}
-                }
+                })
 
             elif isinstance(item, FilingItem):
                 manager_id = item["manager_id"]
                 filing_id = item["filing_id"]
+                if self.checkpoint.has_filing(manager_id, filing_id):
+                    raise DropItem(f"Filing {filing_id} already processed")
 
-
-                if manager_id in self.checkpoint:
-                    self.checkpoint[manager_id]["filings"][filing_id] = {
-                        "quarter": item["quarter"],
-                        "filing_url": item["filing_url"],
-                        'filing_date': item['filing_date'],
-                        'filing_id': item['filing_id'],
-                        "holdings": {}
-                    }
+                self.checkpoint.add_filing(manager_id, filing_id, {
+                    "quarter": item["quarter"],
+                    "filing_url": item["filing_url"],
+                    'filing_date': item['filing_date'],
+                    'filing_id': item['filing_id'],
+                    "holdings": {},
+                    # As listed on the filings table; orders the holdings requests (storage/frontier.py)
+                    "reported_value": item.get("value"),
+                    "reported_holdings": item.get("holdings"),
+                })
             elif isinstance(item, HoldingItem):
                 manager_id = item["manager_id"]
                 filing_id = item["filing_id"]
-                holding_id = item["symbol"]
 
-                if manager_id in self.checkpoint and filing_id in self.checkpoint[manager_id]["filings"]:
-                    self.checkpoint[manager_id]["filings"][filing_id]["holdings"][holding_id] = {
-                        "shares": item["shares"],
-                        "value": item["value"]
-                    }
+                normalized(item)
+                self.checkpoint.add_holding(manager_id, filing_id, item["key"], holding_record(item))
+            elif isinstance(item, HoldingsBatchItem):
+                normalized(item)
+                self.checkpoint.add_holdings(item["manager_id"], item["filing_id"], holding_records(item))
             return item
+        except DropItem:
+            raise
         except Exception as e:
             self.logger.error(f"Error in checkpoint pipeline: {e}")
             return item
 
     def close_spider(self, spider):
         """Save final checkpoint when spider closes."""
-        self.checkpoint.save()
+        self.checkpoint.close()
         self.logger.info(f"Checkpoint saved to {self.checkpoint_path}")
+
+
+class HoldingsIndexPipeline:
+    """Pipeline that adds every manager, filing and holding to the cusip/symbol index."""
+
+    def __init__(self, index: HoldingsIndex):
+        self.index = index
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        index = index_from_settings(crawler.settings)
+        if index is None:
+            raise NotConfigured("HOLDINGS_INDEX_PATH is not set")
+        return cls(index)
+
+    def process_item(self, item, spider):
+        with metrics.timer("scraper_pipeline_seconds", pipeline="holdings_index", item=type(item).__name__):
+            if isinstance(item, ManagerItem):
+                self.index.add_manager(item["id"], item["name"])
+            elif isinstance(item, FilingItem):
+                self.index.add_filing(item["manager_id"], item["filing_id"], item["quarter"])
+            elif isinstance(item, HoldingItem):
+                normalized(item)
+                self.index.add_position(item["manager_id"], item["filing_id"], item["quarter"], item["key"],
+                                        item["symbol"], item.get("cusip"), item["cl"], item["option"],
+                                        item["shares"], item["value"])
+            elif isinstance(item, HoldingsBatchItem):
+                normalized(item)
+                self.index.add_positions(item["manager_id"], item["filing_id"], item["quarter"], item["key"],
+                                         item["symbol"], item["cusip"], item["cl"], item["option"],
+                                         item["shares"], item["value"])
+        return item
+
+    def close_spider(self, spider):
+        self.index.close()
+        self.logger.info(f"Holdings index saved to {self.index.path}")
+
+
+class MongoPipeline:
+    """
+    Pipeline that mirrors managers, filings and holdings into MongoDB.
+
+    Items are turned into upserts keyed by manager id, filing_id and
+    (filing_id, key), key being the holding_key, and buffered; a full buffer, or one older than
+    MONGO_FLUSH_INTERVAL seconds, is handed to a writer thread as one batch
+    and written with unordered bulk_write calls. Once more than
+    MONGO_MAX_PENDING_BATCHES batches wait for the writer, process_item
+    returns a Deferred that fires when the backlog drains, which holds back
+    the scraper until the database catches up.
+    """
+
+    def __init__(self, uri: str, database: str, batch_size: int = 1000,
+                 flush_interval: float = 1.0, max_pending_batches: int = 4, stats=None):
+        self.uri = uri
+        self.database_name = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.logger = logging.getLogger(__name__)
+        self.client: Optional[MongoClient] = None
+        self.db = None
+        # Repeated writes to the same key within a batch collapse into the last one
+        self.buffer: Dict[Tuple[str, Any], UpdateOne] = {}
+        self.buffer_started = 0.0
+        self.max_pending_batches = max_pending_batches
+        # Batches handed to the writer and not yet written, tracked on the reactor thread
+        self.pending_batches = 0
+        self.waiting: List[defer.Deferred] = []
+        self.batches: queue.Queue = queue.Queue()
+        self.reactor = None
+        self.writer: Optional[threading.Thread] = None
+        self.flush_loop: Optional[task.LoopingCall] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        uri = settings.get("MONGO_URI")
+        if not uri:
+            raise NotConfigured("MONGO_URI is not set")
+        return cls(
+            uri=uri,
+            database=settings.get("MONGO_DATABASE", "13f"),
+            batch_size=settings.getint("MONGO_BATCH_SIZE", 1000),
+            flush_interval=settings.getfloat("MONGO_FLUSH_INTERVAL", 1.0),
+            max_pending_batches=settings.getint("MONGO_MAX_PENDING_BATCHES", 4),
+            stats=crawler.stats
+        )
+
+    def open_spider(self, spider):
+        from twisted.internet import reactor
+        self.reactor = reactor
+        self.client = MongoClient(self.uri)
+        self.db = self.client[self.database_name]
+        self.create_indexes()
+        self.writer = threading.Thread(target=self._write_batches, name="mongo-writer", daemon=True)
+        self.writer.start()
+        self.flush_loop = task.LoopingCall(self._flush_if_stale)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def create_indexes(self):
+        """Unique keys for the upserts plus the lookups the analysis runs."""
+        self.db.filings.create_index([("manager_id", ASCENDING)])
+        self.db.filings.create_index([("quarter", ASCENDING)])
+        self.db.holdings.create_index([("filing_id", ASCENDING), ("key", ASCENDING)], unique=True)
+        self.db.holdings.create_index([("cusip", ASCENDING)])
+        self.db.holdings.create_index([("manager_id", ASCENDING), ("quarter", ASCENDING)])
+
+    def process_item(self, item, spider):
+        with metrics.timer("scraper_pipeline_seconds", pipeline="mongo", item=type(item).__name__):
+            return self._process_item(item)
+
+    def _process_item(self, item):
+        if isinstance(item, ManagerItem):
+            key = ("managers", item["id"])
+            self.buffer[key] = UpdateOne(
+                {"_id": item["id"]},
+                {"$set": {"name": item.get("name"), "filing_url": item.get("link")}},
+                upsert=True
+            )
+        elif isinstance(item, FilingItem):
+            key = ("filings", item["filing_id"])
+            self.buffer[key] = UpdateOne(
+                {"_id": item["filing_id"]},
+                {"$set": {
+                    "manager_id": item.get("manager_id"),
+                    "manager_name": item.get("manager_name"),
+                    "quarter": item.get("quarter"),
+                    "filing_url": item.get("filing_url"),
+                    "filing_date": item.get("filing_date"),
+                    "form_type": item.get("form_type"),
+                }},
+                upsert=True
+            )
+        elif isinstance(item, HoldingItem):
+            normalized(item)
+            key = ("holdings", (item["filing_id"], item["key"]))
+            self.buffer[key] = UpdateOne(
+                {"filing_id": item["filing_id"], "key": item["key"]},
+                {"$set": {field: item.get(field) for field in HoldingItem.fields
+                          if field not in ("filing_id", "key")}},
+                upsert=True
+            )
+        elif isinstance(item, HoldingsBatchItem):
+            normalized(item)
+            filing_id = item["filing_id"]
+            filing = {field: item.get(field) for field in HoldingsBatchItem.fields
+                      if field not in BATCH_COLUMNS and field != "filing_id"}
+            columns = [column for column in BATCH_COLUMNS if column != "key"]
+            for key, *values in zip(item["key"], *(item[column] for column in columns)):
+                self.buffer[("holdings", (filing_id, key))] = UpdateOne(
+                    {"filing_id": filing_id, "key": key},
+                    {"$set": {**filing, **dict(zip(columns, values))}},
+                    upsert=True
+                )
+        else:
+            return item
+
+        if len(self.buffer) == 1:
+            self.buffer_started = time.monotonic()
+        if len(self.buffer) >= self.batch_size:
+            waiting = self._flush()
+            if waiting is not None:
+                waiting.addCallback(lambda _: item)
+                return waiting
+        return item
+
+    def _flush_if_stale(self):
+        if self.buffer and time.monotonic() - self.buffer_started >= self.flush_interval:
+            self._flush()
+
+    def _flush(self) -> Optional[defer.Deferred]:
+        """Hand the buffer to the writer. Returns a Deferred if the writer is too far behind."""
+        self.batches.put(self._take_buffer())
+        self.pending_batches += 1
+        metrics.set_gauge("scraper_mongo_pending_batches", self.pending_batches)
+        if self.pending_batches <= self.max_pending_batches:
+            return None
+        if self.stats:
+            self.stats.inc_value("mongo/backpressure_waits")
+        waiting = defer.Deferred()
+        self.waiting.append(waiting)
+        return waiting
+
+    def _batch_written(self):
+        self.pending_batches -= 1
+        metrics.set_gauge("scraper_mongo_pending_batches", self.pending_batches)
+        while self.waiting and self.pending_batches <= self.max_pending_batches:
+            self.waiting.pop(0).callback(None)
+
+    def _take_buffer(self) -> Dict[str, List[UpdateOne]]:
+        batch: Dict[str, List[UpdateOne]] = {}
+        for (collection, _), operation in self.buffer.items():
+            batch.setdefault(collection, []).append(operation)
+        self.buffer = {}
+        return batch
+
+    def _write_batches(self):
+        """Writer thread: bulk write every batch until the None sentinel."""
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.logger.error(f"MongoDB writer error: {e}")
+            finally:
+                self.reactor.callFromThread(self._batch_written)
+
+    def _write(self, batch: Dict[str, List[UpdateOne]]):
+        # Parents first so a reader never sees holdings of an unknown filing
+        for collection in ("managers", "filings", "holdings"):
+            operations = batch.get(collection)
+            if not operations:
+                continue
+            try:
+                self.db[collection].bulk_write(operations, ordered=False)
+                if self.stats:
+                    self.stats.inc_value(f"mongo/{collection}_written", len(operations))
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                self.logger.error(f"{len(errors)} of {len(operations)} {collection} writes failed: "
+                                  f"{errors[0].get('errmsg') if errors else e}")
+                if self.stats:
+                    self.stats.inc_value("mongo/write_errors", len(errors))
+            except PyMongoError as e:
+                self.logger.error(f"Bulk write of {len(operations)} {collection} failed: {e}")
+                if self.stats:
+                    self.stats.inc_value("mongo/write_errors", len(operations))
+        if self.stats:
+            self.stats.inc_value("mongo/batches")
+
+    def close_spider(self, spider):
+        """Write whatever is buffered and wait for the writer to drain."""
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.buffer:
+            self._flush()
+        return deferToThread(self._finish)
+
+    def _finish(self):
+        self.batches.put(None)
+        self.writer.join()
+        self.client.close()
+        self.logger.info(f"MongoDB writes flushed to {self.database_name}")
@@ -0,0 +1,366 @@
+"""
+Sampling profiler for the spider callbacks, the checkpoint pipeline and
+processing, switched on with ``python -m scraper.main --profile ...`` (or
+PROFILE=true).
+
+Profiler.install() wraps the parse methods of the three stage spiders,
+CheckpointPipeline.process_item and process_data. While a wrapped call runs,
+a background thread samples the stack of the thread running it every
+PROFILE_INTERVAL seconds, so the cost doesn't grow with the number of Python
+calls made, unlike cProfile. Every PROFILE_ALLOC_EVERY-th call of each
+target is also run under tracemalloc, and the allocations it leaves live are
+counted by source line. A traced callback runs to completion before its
+items are handed on. Tracing slows the traced call down several times, so
+processing, which is a single call, is only traced with PROFILE_ALLOC_EVERY=1.
+
+stop() writes to a run directory under PROFILE_DIR:
+    profile.json      everything below, per target
+    <target>.txt      calls and latency, time per URL pattern, top functions
+                      (own and cumulative samples), top allocation sites
+"""
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+_OWN_FILES = (__file__, tracemalloc.__file__)
+
+# Frames kept per sample, counted from the profiled target inwards
+MAX_DEPTH = 64
+
+# A path segment that is an id: all digits, or a longer run of digits among other characters
+_ID_SEGMENT = re.compile(r"^\d+$|\d{4,}")
+
+
+def url_pattern(url: str) -> str:
+    """A URL's path with id segments replaced (/data/13f/0001234 -> /data/13f/{id}) and its query parameter names."""
+    parts = urlsplit(url)
+    pattern = "/".join("{id}" if _ID_SEGMENT.search(segment) else segment for segment in parts.path.split("/")) or "/"
+    if parts.query:
+        pattern += "?" + "&".join(sorted(pair.split("=", 1)[0] for pair in parts.query.split("&")))
+    return pattern
+
+
+@lru_cache(maxsize=None)
+def _short_path(path: str) -> str:
+    """A source path relative to the working directory or to site-packages when it is under one."""
+    if "site-packages" + os.sep in path:
+        return path.split("site-packages" + os.sep, 1)[1]
+    try:
+        relative = os.path.relpath(path)
+    except ValueError:
+        return path
+    return path if relative.startswith("..") else relative
+
+
+def _function_name(code) -> str:
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class TargetStats:
+    """What was measured for one profiled target."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = Histogram()
+        # pattern -> [calls, seconds]
+        self.patterns: Dict[str, List[float]] = {}
+        self.samples = 0
+        self.own = Counter()
+        self.cumulative = Counter()
+        self.traced_calls = 0
+        self.alloc_bytes = Counter()
+        self.alloc_count = Counter()
+        self.peak_bytes = 0
+
+    def add_call(self, pattern: str, seconds: float) -> None:
+        self.seconds.observe(seconds)
+        totals = self.patterns.setdefault(pattern, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+    def add_sample(self, functions: List[str]) -> None:
+        self.samples += 1
+        self.own[functions[0]] += 1
+        self.cumulative.update(set(functions))
+
+    def add_snapshot(self, snapshot: tracemalloc.Snapshot, peak: int) -> None:
+        self.traced_calls += 1
+        self.peak_bytes = max(self.peak_bytes, peak)
+        for stat in snapshot.statistics("lineno"):
+            frame = stat.traceback[0]
+            # The sampler thread allocates while a call is traced
+            if frame.filename in _OWN_FILES:
+                continue
+            site = f"{_short_path(frame.filename)}:{frame.lineno}"
+            self.alloc_bytes[site] += stat.size
+            self.alloc_count[site] += stat.count
+
+    def to_dict(self, top: int) -> Dict[str, Any]:
+        def sampled(counter: Counter) -> List[Dict[str, Any]]:
+            return [{"function": function, "samples": count, "share": round(count / self.samples, 4)}
+                    for function, count in counter.most_common(top)]
+
+        return {
+            "calls": self.seconds.count,
+            "latency": self.seconds.summary(),
+            "url_patterns": {
+                pattern: {"calls": calls, "seconds": round(seconds, 6)}
+                for pattern, (calls, seconds) in sorted(self.patterns.items(), key=lambda entry: -entry[1][1])
+            },
+            "samples": self.samples,
+            "top_own": sampled(self.own),
+            "top_cumulative": sampled(self.cumulative),
+            "traced_calls": self.traced_calls,
+            "peak_traced_bytes": self.peak_bytes,
+            "top_allocations": [
+                {"site": site, "bytes": size, "count": self.alloc_count[site],
+                 "bytes_per_call": size // max(self.traced_calls, 1)}
+                for site, size in self.alloc_bytes.most_common(top)
+            ],
+        }
+
+
+def _report(name: str, summary: Dict[str, Any]) -> str:
+    latency = summary["latency"]
+    lines = [
+        name,
+        f"  calls {summary['calls']}, {latency['sum']:.3f}s total, "
+        f"mean {latency['sum'] / max(summary['calls'], 1) * 1000:.2f}ms, "
+        f"p50 ~{latency['p50'] * 1000:.2f}ms, p99 ~{latency['p99'] * 1000:.2f}ms (histogram estimates)",
+        "",
+        "time per URL pattern (or item type):",
+    ]
+    lines += [f"  {entry['seconds']:10.3f}s {entry['calls']:8d} calls  {pattern}"
+              for pattern, entry in summary["url_patterns"].items()]
+    for title, key in (("own", "top_own"), ("cumulative", "top_cumulative")):
+        lines += ["", f"top functions, {title} samples ({summary['samples']} samples):"]
+        lines += [f"  {entry['share'] * 100:6.2f}% {entry['samples']:8d}  {entry['function']}"
+                  for entry in summary[key]]
+    lines += ["", f"top allocation sites, left live by {summary['traced_calls']} traced calls "
+                  f"(peak {summary['peak_traced_bytes'] / 1024:.1f} KiB):"]
+    lines += [f"  {entry['bytes_per_call'] / 1024:10.1f} KiB/call {entry['count']:8d} blocks  {entry['site']}"
+              for entry in summary["top_allocations"]]
+    return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """Wraps the profiled targets, samples their stacks and writes the reports."""
+
+    def __init__(self, directory: str = "profiles", interval: float = 0.005, alloc_every: int = 100, top: int = 25):
+        self.run_dir = Path(directory) / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.interval = interval
+        self.alloc_every = alloc_every
+        self.top = top
+        self.stats: Dict[str, TargetStats] = {}
+        self.lock = threading.Lock()
+        # Thread id -> (stats, code of the wrapper) of the target running on that thread
+        self.active: Dict[int, Tuple[TargetStats, Any]] = {}
+        self.patched: List[Tuple[Any, str, Any]] = []
+        # Profiler frames left out of the samples
+        self.wrapper_codes = {Profiler._drain.__code__, Profiler._traced.__code__, Profiler._traced_sync.__code__}
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_settings(cls, settings) -> "Profiler":
+        return cls(
+            settings.get("PROFILE_DIR", "profiles"),
+            settings.getfloat("PROFILE_INTERVAL", 0.005),
+            settings.getint("PROFILE_ALLOC_EVERY", 100),
+            settings.getint("PROFILE_TOP", 25),
+        )
+
+    def targets(self) -> List[Tuple[Any, str, str]]:
+        """(owner, attribute, name) of every profiled function."""
+        from .pipelines import CheckpointPipeline
+        from .spiders.fillings_spider import FilingsSpider
+        from .spiders.holdings_spider import HoldingsSpider
+        from .spiders.managers_spider import ManagersSpider
+        from .storage import processor
+
+        return [
+            (ManagersSpider, "parse", "ManagersSpider.parse"),
+            (FilingsSpider, "parse", "FilingsSpider.parse"),
+            (HoldingsSpider, "parse", "HoldingsSpider.parse"),
+            (CheckpointPipeline, "process_item", "CheckpointPipeline.process_item"),
+            (processor, "process_data", "process_data"),
+        ]
+
+    def install(self) -> None:
+        """Wrap the targets and start sampling."""
+        for owner, attribute, name in self.targets():
+            original = owner.__dict__[attribute]
+            setattr(owner, attribute, self.wrap(original, name))
+            self.patched.append((owner, attribute, original))
+        self.thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self.thread.start()
+        logger.info(f"Profiling to {self.run_dir}")
+
+    def uninstall(self) -> None:
+        for owner, attribute, original in reversed(self.patched):
+            setattr(owner, attribute, original)
+        self.patched.clear()
+
+    def stop(self) -> Path:
+        """Stop sampling, restore the targets and write the reports."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.uninstall()
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            summaries = {name: stats.to_dict(self.top) for name, stats in self.stats.items()}
+        with open(self.run_dir / "profile.json", "w") as f:
+            json.dump({"interval": self.interval, "alloc_every": self.alloc_every, "targets": summaries}, f, indent=2)
+        for name, summary in summaries.items():
+            (self.run_dir / f"{name}.txt").write_text(_report(name, summary))
+        logger.info(f"Profile of {len(summaries)} targets written to {self.run_dir}")
+        return self.run_dir
+
+    # Wrapping
+
+    def wrap(self, func: Callable, name: str) -> Callable:
+        stats = self.stats.setdefault(name, TargetStats(name))
+        profiler = self
+
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def wrapper(spider, response, *args, **kwargs):
+                pattern = url_pattern(response.url)
+                elapsed = 0.0
+                traced = profiler._should_trace(stats)
+                results = func(spider, response, *args, **kwargs)
+                try:
+                    if traced:
+                        # Run to completion under tracemalloc, so the allocations are the callback's alone
+                        items, elapsed = await profiler._traced(stats, wrapper_code, profiler._drain(results))
+                        for item in items:
+                            yield item
+                        return
+                    while True:
+                        previous = profiler._enter(stats, wrapper_code)
+                        started = time.perf_counter()
+                        try:
+                            item = await results.__anext__()
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            elapsed += time.perf_counter() - started
+                            profiler._exit(previous)
+                        yield item
+                finally:
+                    stats.add_call(pattern, elapsed)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                pattern = profiler._pattern(name, args, kwargs)
+                if profiler._should_trace(stats):
+                    return profiler._traced_sync(stats, wrapper_code, pattern, func, args, kwargs)
+                previous = profiler._enter(stats, wrapper_code)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    stats.add_call(pattern, time.perf_counter() - started)
+                    profiler._exit(previous)
+
+        wrapper_code = wrapper.__code__
+        self.wrapper_codes.add(wrapper_code)
+        return wrapper
+
+    @staticmethod
+    def _pattern(name: str, args: tuple, kwargs: dict) -> str:
+        if name == "CheckpointPipeline.process_item":
+            return type(args[1]).__name__
+        if name == "process_data":
+            return str(kwargs.get("engine", args[2] if len(args) > 2 else "columnar"))
+        return name
+
+    @staticmethod
+    async def _drain(results) -> list:
+        items = []
+        async for item in results:
+            items.append(item)
+        return items
+
+    def _should_trace(self, stats: TargetStats) -> bool:
+        # The N-th, 2N-th... calls: a target called once (process_data) is only traced when N is 1
+        if not self.alloc_every or tracemalloc.is_tracing():
+            return False
+        return (stats.seconds.count + 1) % self.alloc_every == 0
+
+    def _enter(self, stats: TargetStats, code) -> Optional[Tuple[TargetStats, Any]]:
+        thread_id = threading.get_ident()
+        previous = self.active.get(thread_id)
+        self.active[thread_id] = (stats, code)
+        return previous
+
+    def _exit(self, previous: Optional[Tuple[TargetStats, Any]]) -> None:
+        thread_id = threading.get_ident()
+        if previous is None:
+            self.active.pop(thread_id, None)
+        else:
+            self.active[thread_id] = previous
+
+    async def _traced(self, stats: TargetStats, code, awaitable) -> Tuple[Any, float]:
+        previous = self._enter(stats, code)
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            result = await awaitable
+        finally:
+            elapsed = time.perf_counter() - started
+            self._exit(previous)
+            self._snapshot(stats)
+        return result, elapsed
+
+    def _traced_sync(self, stats: TargetStats, code, pattern: str, func: Callable, args: tuple, kwargs: dict) -> Any:
+        previous = self._enter(stats, code)
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.add_call(pattern, time.perf_counter() - started)
+            self._exit(previous)
+            self._snapshot(stats)
+
+    def _snapshot(self, stats: TargetStats) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        with self.lock:
+            stats.add_snapshot(snapshot, peak)
+
+    # Sampling
+
+    def _sample(self) -> None:
+        while not self.stopped.wait(self.interval):
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, (stats, code) in list(self.active.items()):
+                frame = frames.get(thread_id)
+                functions = []
+                while frame is not None and frame.f_code is not code and len(functions) < MAX_DEPTH:
+                    if frame.f_code not in self.wrapper_codes:
+                        functions.append(_function_name(frame.f_code))
+                    frame = frame.f_back
+                if functions:
+                    with self.lock:
+                        stats.add_sample(functions)
@@ -0,0 +1,105 @@
+"""
+Scrapy scheduler backed by the disk frontier (scraper/storage/frontier.py).
+
+Requests are popped by priority and then by their "frontier_weight" meta, the
+reported value of the filing or manager they fetch, so when a crawl is cut
+short the biggest filers are the ones already scraped. The queue lives in
+FRONTIER_PATH, so a crawl that is stopped or killed resumes from it on the
+next run.
+"""
+import logging
+import pickle
+from collections import deque
+from typing import Deque, Optional
+
+from scrapy import Request, Spider
+from scrapy.utils.misc import build_from_crawler, load_object
+from scrapy.utils.request import request_from_dict
+
+from scraper.storage.frontier import Frontier
+
+logger = logging.getLogger(__name__)
+
+
+class FrontierScheduler:
+    """Scheduler keeping pending requests in a Frontier, with Scrapy's dupefilter in front of it."""
+
+    def __init__(self, crawler, dupefilter, path: str, commit_interval: float = 1.0):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.df = dupefilter
+        self.path = path
+        self.commit_interval = commit_interval
+        self.frontier: Optional[Frontier] = None
+        # Requests that can't be serialized (callbacks that aren't spider methods) stay in memory
+        self.memory: Deque[Request] = deque()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dupefilter = build_from_crawler(load_object(crawler.settings["DUPEFILTER_CLASS"]), crawler)
+        return cls(
+            crawler,
+            dupefilter,
+            crawler.settings.get("FRONTIER_PATH", "checkpoints/frontier.db"),
+            crawler.settings.getfloat("FRONTIER_COMMIT_INTERVAL", 1.0),
+        )
+
+    def open(self, spider: Spider):
+        self.spider = spider
+        self.frontier = Frontier(self.path, spider.name, self.commit_interval)
+        # A resumed queue can hold requests whose parent page's items never reached the checkpoint.
+        # Their own items are dropped by the pipeline, so the same requests must get through again when
+        # the parent page is fetched anew: the dupefilter is off for the run, and duplicates collapse
+        # into one frontier row as long as they are queued.
+        self.resumed = len(self.frontier) > 0
+        if self.resumed:
+            logger.info(
+                f"Resuming {spider.name} from {self.path}: {len(self.frontier)} requests queued "
+                f"({self.frontier.requeued} were in flight)"
+            )
+        self.stats.set_value("frontier/resumed", len(self.frontier))
+        return self.df.open()
+
+    def close(self, reason: str):
+        self.frontier.close(finished=reason == "finished")
+        return self.df.close(reason)
+
+    def fingerprint(self, request: Request) -> bytes:
+        return self.crawler.request_fingerprinter.fingerprint(request)
+
+    def has_pending_requests(self) -> bool:
+        return len(self) > 0
+
+    def __len__(self) -> int:
+        return len(self.memory) + len(self.frontier)
+
+    def enqueue_request(self, request: Request) -> bool:
+        if not request.dont_filter and not self.resumed and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return False
+        try:
+            data = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        except ValueError:
+            self.memory.append(request)
+            self.stats.inc_value("scheduler/enqueued/memory")
+        else:
+            weight = int(request.meta.get("frontier_weight") or 0)
+            self.frontier.push(self.fingerprint(request), request.priority, weight, data)
+            self.stats.inc_value("scheduler/enqueued/disk")
+        self.stats.inc_value("scheduler/enqueued")
+        return True
+
+    def next_request(self) -> Optional[Request]:
+        if self.memory:
+            request = self.memory.popleft()
+        else:
+            popped = self.frontier.pop()
+            if popped is None:
+                return None
+            request = request_from_dict(pickle.loads(popped[1]), spider=self.spider)
+        self.stats.inc_value("scheduler/dequeued")
+        return request
+
+    def complete(self, request: Request) -> None:
+        """Called by FrontierMiddleware once the request's callback has run."""
+        self.frontier.complete(self.fingerprint(request))
@@ -24,17 +24,132 @@ RANDOMIZE_DOWNLOAD_DELAY = False
 
 REACTOR_THREADPOOL_MAXSIZE = 15
 
+# Crawl mode: "sequential" runs the managers, filings and holdings spiders one
+# after another, "pipelined" runs all three stages from one shared frontier
+CRAWL_MODE = os.getenv("CRAWL_MODE", "sequential")
+
+# In-flight request limits per stage in pipelined mode
+MANAGERS_STAGE_CONCURRENCY = int(os.getenv("MANAGERS_STAGE_CONCURRENCY", "4"))
+FILINGS_STAGE_CONCURRENCY = int(os.getenv("FILINGS_STAGE_CONCURRENCY", "8"))
+HOLDINGS_STAGE_CONCURRENCY = int(os.getenv("HOLDINGS_STAGE_CONCURRENCY", "8"))
+DOWNLOAD_SLOTS = {
+    "managers": {"concurrency": MANAGERS_STAGE_CONCURRENCY, "delay": DOWNLOAD_DELAY},
+    "filings": {"concurrency": FILINGS_STAGE_CONCURRENCY, "delay": DOWNLOAD_DELAY},
+    "holdings": {"concurrency": HOLDINGS_STAGE_CONCURRENCY, "delay": DOWNLOAD_DELAY},
+}
+
+# Parse holdings JSON incrementally from the response bytes and emit items
+# in batches, keeping per-response memory bounded for very large filings
+HOLDINGS_STREAMING = os.getenv("HOLDINGS_STREAMING", "false").lower() in ("1", "true", "yes")
+HOLDINGS_BATCH_SIZE = int(os.getenv("HOLDINGS_BATCH_SIZE", "500"))
+
+# "batch" yields one HoldingsBatchItem per filing (per HOLDINGS_BATCH_SIZE rows
+# when streaming) with the holdings as parallel columns; "row" yields one
+# HoldingItem per holding, for pipelines that only handle single holdings
+HOLDINGS_ITEMS = os.getenv("HOLDINGS_ITEMS", "batch")
+
 # Enable built-in cache
 HTTPCACHE_ENABLED = True
 HTTPCACHE_EXPIRATION_SECS = 3600
 HTTPCACHE_DIR = "httpcache"
-HTTPCACHE_IGNORE_HTTP_CODES = [503, 504, 400, 401, 403, 404, 408]
+# Compressed responses in one SQLite file (httpcache/cache.db), least recently
+# used entries evicted above HTTPCACHE_MAX_SIZE_MB (0 = unbounded)
+HTTPCACHE_STORAGE = "scraper.storage.http_cache.SQLiteCacheStorage"
+HTTPCACHE_MAX_SIZE_MB = float(os.getenv("HTTPCACHE_MAX_SIZE_MB", "1024"))
+# First matching URL pattern sets the expiry in seconds (0 = never expires);
+# other URLs use HTTPCACHE_EXPIRATION_SECS
+HTTPCACHE_EXPIRATION_RULES = [
+    (r"/data/13f/\d+", 0),
+    (r"/managers?/", int(os.getenv("HTTPCACHE_LISTING_EXPIRATION_SECS", "21600"))),
+]
+# Never cache responses that are retried, or every retry is served the cached error
+HTTPCACHE_IGNORE_HTTP_CODES = [500, 502, 503, 504, 400, 401, 403, 404, 408, 429]
 
 # Retry configuration
 RETRY_ENABLED = True
 RETRY_TIMES = 3
 RETRY_HTTP_CODES = [500, 502, 503, 504, 408, 429]
 
+# Incremental mode: revalidate pages with conditional requests and skip
+# holdings of filings that were already completed in an earlier run
+INCREMENTAL = os.getenv("INCREMENTAL", "false").lower() in ("1", "true", "yes")
+VALIDATORS_PATH = os.getenv("VALIDATORS_PATH", "checkpoints/validators.json")
+SEEN_FILINGS_PATH = os.getenv("SEEN_FILINGS_PATH", "checkpoints/seen_filings.txt")
+
+DOWNLOADER_MIDDLEWARES = {
+    "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
+    "scraper.middleware.CustomRetryMiddleware": 550,
+    "scraper.middleware.ConditionalRequestMiddleware": 950,
+    "scraper.middleware.AdaptiveConcurrencyMiddleware": 960,
+}
+
+SPIDER_MIDDLEWARES = {
+    "scraper.middleware.FrontierMiddleware": 980,
+    "scraper.middleware.CallbackTimingMiddleware": 990,
+}
+
+# Disk-backed request frontier (scraper/scheduler.py): queued requests live in
+# FRONTIER_PATH, ordered by priority and then by the reported value of the
+# filing behind them, and an interrupted crawl resumes from it. Off by default
+# (Scrapy's in-memory scheduler): popping strictly by priority serves the
+# listing pages after the queued filings and holdings, which roughly halves
+# CRAWL_MODE=pipelined throughput. Set e.g. checkpoints/frontier.db to enable.
+# Queue changes are committed every FRONTIER_COMMIT_INTERVAL seconds
+FRONTIER_PATH = os.getenv("FRONTIER_PATH", "")
+FRONTIER_COMMIT_INTERVAL = float(os.getenv("FRONTIER_COMMIT_INTERVAL", "1.0"))
+if FRONTIER_PATH:
+    SCHEDULER = "scraper.scheduler.FrontierScheduler"
+
+EXTENSIONS = {
+    "scraper.extensions.RunSummaryExtension": 500,
+    "scraper.extensions.MetricsExtension": 510,
+}
+
+# Per-stage counters, latency histograms and queue gauges (scraper/metrics.py).
+# METRICS_PORT serves them in the Prometheus text format at /metrics while the
+# crawl runs (0 = off); METRICS_SUMMARY_PATH gets a JSON snapshot at exit
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_SUMMARY_PATH = os.getenv("METRICS_SUMMARY_PATH", "data/metrics_summary.json")
+METRICS_SAMPLE_INTERVAL = float(os.getenv("METRICS_SAMPLE_INTERVAL", "1.0"))
+
+# Profiling (also switched on by `python -m scraper.main --profile`): the spider
+# callbacks, the checkpoint pipeline and process_data get their stacks sampled
+# every PROFILE_INTERVAL seconds, and every PROFILE_ALLOC_EVERY-th call of each
+# is traced with tracemalloc (0 = off). Reports of the PROFILE_TOP functions
+# and allocation sites go to a new directory under PROFILE_DIR per run
+PROFILE = os.getenv("PROFILE", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_ALLOC_EVERY = int(os.getenv("PROFILE_ALLOC_EVERY", "100"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "25"))
+
+# When set, every spider run appends its final stats (and main appends the
+# processing time) as one JSON line to this file; see benchmarks/crawl_benchmark.py
+RUN_SUMMARY_PATH = os.getenv("RUN_SUMMARY_PATH", "")
+
+# Retries wait a random delay of up to RETRY_BACKOFF_BASE * 2^attempt seconds,
+# capped at RETRY_BACKOFF_MAX and never shorter than a Retry-After header
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "60"))
+
+# Adaptive concurrency: CONCURRENT_REQUESTS_PER_DOMAIN is only the starting
+# point; each host is raised or lowered AIMD-style from its latency and
+# 429/5xx rates, between these bounds. The stage slot concurrencies in
+# DOWNLOAD_SLOTS stay ceilings for their share of the host
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() in ("1", "true", "yes")
+ADAPTIVE_MIN_CONCURRENCY = int(os.getenv("ADAPTIVE_MIN_CONCURRENCY", "1"))
+ADAPTIVE_MAX_CONCURRENCY = int(os.getenv("ADAPTIVE_MAX_CONCURRENCY", str(CONCURRENT_REQUESTS)))
+ADAPTIVE_WINDOW = int(os.getenv("ADAPTIVE_WINDOW", "10"))
+ADAPTIVE_ERROR_RATE = float(os.getenv("ADAPTIVE_ERROR_RATE", "0.1"))
+ADAPTIVE_LATENCY_FACTOR = float(os.getenv("ADAPTIVE_LATENCY_FACTOR", "3.0"))
+ADAPTIVE_MAX_DELAY = float(os.getenv("ADAPTIVE_MAX_DELAY", "10"))
+
+# Consecutive failures that open a slot's circuit breaker, and how long it
+# stays open before a probe request is let through
+CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "10"))
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "30"))
+
 # Timeout configuration
 DOWNLOAD_TIMEOUT = 30
 
@@ -43,19 +158,101 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 # Configure item pipelines
 ITEM_PIPELINES = {
+   "scraper.pipelines.NormalizationPipeline": 200,
    "scraper.pipelines.CheckpointPipeline": 300,
+   "scraper.pipelines.HoldingsIndexPipeline": 350,
+   "scraper.pipelines.MongoPipeline": 400,
 }
 
+# Inverted index from cusip and symbol to the positions holding them, filled
+# as items are scraped and written in batches of HOLDINGS_INDEX_BATCH_SIZE rows.
+# Off by default: every holding would pay an extra SQLite write, and sharded
+# workers would all write to the one file. Set e.g. data/holdings_index.db to
+# enable, or fill it afterwards with python -m scraper.storage.holdings_index rebuild
+HOLDINGS_INDEX_PATH = os.getenv("HOLDINGS_INDEX_PATH", "")
+HOLDINGS_INDEX_BATCH_SIZE = int(os.getenv("HOLDINGS_INDEX_BATCH_SIZE", "5000"))
+
+# MongoDB sink, enabled when MONGO_URI is set. Writes are buffered into
+# unordered bulk upserts of up to MONGO_BATCH_SIZE operations, flushed at
+# least every MONGO_FLUSH_INTERVAL seconds; once MONGO_MAX_PENDING_BATCHES
+# batches are waiting for the database the pipeline stalls the scraper
+MONGO_URI = os.getenv("MONGO_URI", "")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "13f")
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "1000"))
+MONGO_FLUSH_INTERVAL = float(os.getenv("MONGO_FLUSH_INTERVAL", "1.0"))
+MONGO_MAX_PENDING_BATCHES = int(os.getenv("MONGO_MAX_PENDING_BATCHES", "4"))
+
 # Base URLs
 BASE_URL = os.getenv("BASE_URL", "https://13f.info")
 MANAGER_LIST_BASE_URL = os.getenv("MANAGER_LIST_BASE_URL", f"{BASE_URL}/managers")
 HOLDING_LIST_BASE_URL = os.getenv("HOLDING_LIST_BASE_URL", f"{BASE_URL}/data")
 
+# Stages run by a sequential crawl, in order, and whether main processes the
+# checkpoint afterwards
+CRAWL_STAGES = [s.strip() for s in os.getenv("CRAWL_STAGES", "managers,filings,holdings").split(",") if s.strip()]
+PROCESS_DATA = os.getenv("PROCESS_DATA", "true").lower() in ("1", "true", "yes")
+
+# Sharded crawl (scraper/sharding.py): with SHARDS > 1 main runs the crawl in
+# that many worker processes, each with its own checkpoint under shards/, and
+# merges them before processing. Workers get SHARD_INDEX/SHARD_COUNT
+SHARDS = int(os.getenv("SHARDS", "1"))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+
 # Checkpoint file path
 CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "checkpoints/13f-info.json")
 
+# Checkpoint storage backend: "json" rewrites the whole file, "journal" appends
+# each mutation to CHECKPOINT_PATH.journal and compacts it into a snapshot,
+# "sqlite" keeps indexed tables next to CHECKPOINT_PATH (with a .db suffix)
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "json")
+CHECKPOINT_JOURNAL_FLUSH_INTERVAL = float(os.getenv("CHECKPOINT_JOURNAL_FLUSH_INTERVAL", "1.0"))
+CHECKPOINT_JOURNAL_COMPACT_THRESHOLD = int(os.getenv("CHECKPOINT_JOURNAL_COMPACT_THRESHOLD", "100000"))
+CHECKPOINT_SQLITE_BATCH_SIZE = int(os.getenv("CHECKPOINT_SQLITE_BATCH_SIZE", "1000"))
+
+# Hold the json and journal checkpoints in memory as compact records (slotted
+# managers and filings, holdings as interned symbols and integer arrays). Off
+# by default: it uses a fraction of the memory but loads about 4x slower, and
+# every spider, pipeline and process run loads the checkpoint
+CHECKPOINT_COMPACT = os.getenv("CHECKPOINT_COMPACT", "false").lower() in ("1", "true", "yes")
+
+# The json checkpoint is saved whole every CHECKPOINT_AUTOSAVE_MANAGERS new
+# managers (0 saves only when the spider closes). Pipelined mode discovers
+# managers while holdings fill the checkpoint, so every autosave would rewrite
+# a growing file, quadratic over a full crawl; it saves on close by default
+CHECKPOINT_AUTOSAVE_MANAGERS = int(os.getenv("CHECKPOINT_AUTOSAVE_MANAGERS",
+                                             "0" if CRAWL_MODE == "pipelined" else "10"))
+
 # Output file path
 OUTPUT_PATH = os.getenv("OUTPUT_PATH", "data/processed_data.csv")
 
-# Number of most recent filings to process
-MAX_FILINGS_PER_MANAGER = int(os.getenv("MAX_FILINGS_PER_MANAGER", "2"))
\ No newline at end of file
+# process_data engine: "columnar" (vectorized) or "loop" (row by row reference)
+PROCESSING_ENGINE = os.getenv("PROCESSING_ENGINE", "columnar")
+
+# "full" rebuilds the output from the whole checkpoint; "incremental" recomputes
+# only the managers in the checkpoint's change log since PROCESSING_STATE_PATH's
+# watermark and appends the changed rows to CHANGE_FEED_PATH; "parallel" diffs
+# PROCESSING_CHUNK_SIZE managers at a time in PROCESSING_WORKERS processes (0 for
+# one per CPU) and streams each chunk's rows to the outputs, so memory is bounded
+# by the chunks in flight instead of the whole output
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "full")
+PROCESSING_CHUNK_SIZE = int(os.getenv("PROCESSING_CHUNK_SIZE", "2000"))
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", "0"))
+PROCESSING_STATE_PATH = os.getenv("PROCESSING_STATE_PATH", "data/processing_state.json")
+CHANGE_FEED_PATH = os.getenv("CHANGE_FEED_PATH", "data/changes.jsonl")
+
+# Comma separated output formats: "csv" and/or "parquet" (a quarter-partitioned
+# dataset written next to OUTPUT_PATH, without its suffix). Incremental
+# processing keeps its rows in the Parquet dataset and defaults to it alone: a
+# CSV is rewritten whole on every run
+OUTPUT_FORMATS = [f.strip() for f in os.getenv("OUTPUT_FORMATS",
+                                                "parquet" if PROCESSING_MODE == "incremental" else "csv").split(",")
+                  if f.strip()]
+
+# Number of most recent filings to process (raise it, e.g. to 24, for HISTORY_PATH)
+MAX_FILINGS_PER_MANAGER = int(os.getenv("MAX_FILINGS_PER_MANAGER", "2"))
+
+# When set, processing also writes a per-position summary of every scraped
+# quarter here: HISTORY_CHANGE_QUARTERS-quarter change, streaks, entry/exit quarters
+HISTORY_PATH = os.getenv("HISTORY_PATH", "")
+HISTORY_CHANGE_QUARTERS = int(os.getenv("HISTORY_CHANGE_QUARTERS", "4"))
\ No newline at end of file
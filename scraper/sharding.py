@@ -0,0 +1,220 @@
+"""
+Sharded crawl across several scraper.main worker processes.
+
+A single Scrapy process is bound to one core by HTML parsing and item
+processing, so SHARDS > 1 splits the crawl into two phases of N workers:
+
+    discover  the manager listing letters are dealt out round-robin and every
+              worker runs the managers spider on its letters
+    shard     managers are partitioned by a stable hash of their id and every
+              worker runs the filings and holdings spiders on its partition
+
+Each worker writes its own checkpoint under CHECKPOINT_PATH's directory in
+shards/. After each phase the shard checkpoints are merged into the main
+checkpoint in sorted manager order, so the result does not depend on which
+worker finished first, and main processes the merged checkpoint as usual.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence
+
+from . import metrics
+from .storage.backends import checkpoint_from_settings
+from .storage.seen_set import SeenSet
+
+logger = logging.getLogger(__name__)
+
+PHASES = (
+    ("discover", ("managers",)),
+    ("shard", ("filings", "holdings")),
+)
+
+# Incremental-mode files that workers rewrite on close, so each gets its own copy
+WORKER_STATE = (("VALIDATORS_PATH", ".validators.json"), ("SEEN_FILINGS_PATH", ".seen.txt"))
+
+
+def shard_of(key: str, count: int) -> int:
+    """Stable shard of a key (crc32, so it is the same in every process and run)."""
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+def shard_slice(items: Sequence[Any], index: int, count: int) -> List[Any]:
+    """The items dealt round-robin to one shard."""
+    return list(items[index::count])
+
+
+def shard_path(path: str, phase: str, index: int) -> Path:
+    """Checkpoint path of one shard, e.g. checkpoints/shards/13f-info.shard-2.json."""
+    base = Path(path)
+    return base.parent / "shards" / f"{base.stem}.{phase}-{index}{base.suffix}"
+
+
+def remove_shard_files(path: Path) -> None:
+    """Delete a shard's checkpoint with its journal or database files."""
+    for candidate in path.parent.glob(f"{path.stem}.*"):
+        candidate.unlink()
+
+
+def split_records(records: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+    """Partition manager records by shard_of(manager_id)."""
+    shards: List[Dict[str, Any]] = [{} for _ in range(count)]
+    for manager_id, manager in records.items():
+        shards[shard_of(manager_id, count)][manager_id] = manager
+    return shards
+
+
+def merge_records(parts: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge checkpoint contents, returning managers sorted by id.
+
+    Filings and holdings are unioned. Like CheckpointPipeline, a manager or
+    filing that is already known keeps the first part's fields, while a
+    holding is overwritten by the later parts.
+    """
+    merged: Dict[str, Any] = {}
+    for part in parts:
+        for manager_id, manager in part.items():
+            target = merged.get(manager_id)
+            if target is None:
+                merged[manager_id] = dict(manager, filings=dict(manager.get("filings", {})))
+                continue
+            filings = target["filings"]
+            for filing_id, filing in manager.get("filings", {}).items():
+                existing = filings.get(filing_id)
+                if existing is None:
+                    filings[filing_id] = filing
+                else:
+                    holdings = dict(existing.get("holdings", {}))
+                    holdings.update(filing.get("holdings", {}))
+                    filings[filing_id] = dict(existing, holdings=holdings)
+    return {manager_id: merged[manager_id] for manager_id in sorted(merged)}
+
+
+def _merge_validators(target: str, sources: Iterable[Path]) -> None:
+    validators: Dict[str, Any] = {}
+    if os.path.exists(target):
+        with open(target) as f:
+            validators = json.load(f)
+    for source in sources:
+        if source.exists():
+            with open(source) as f:
+                validators.update(json.load(f))
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    with open(target, "w") as f:
+        json.dump(validators, f)
+
+
+def _merge_seen(target: str, sources: Iterable[Path]) -> None:
+    seen = SeenSet(target)
+    for source in sources:
+        for filing_id in SeenSet(str(source)).ids:
+            seen.add(filing_id)
+    seen.save()
+
+
+class ShardedCrawl:
+    """Runs the two crawl phases in SHARDS worker processes and merges their checkpoints."""
+
+    def __init__(self, settings, stages: Sequence[str] = ("managers", "filings", "holdings")):
+        self.settings = settings
+        # Phases run only the stages asked for, and are skipped when none is
+        self.stages = stages
+        self.count = settings.getint("SHARDS", 1)
+        self.checkpoint_path = settings.get("CHECKPOINT_PATH", "checkpoints/13f-info.json")
+        self.incremental = settings.getbool("INCREMENTAL")
+
+    def run(self) -> None:
+        for phase, stages in PHASES:
+            stages = tuple(stage for stage in stages if stage in self.stages)
+            if not stages:
+                continue
+            paths = [shard_path(self.checkpoint_path, phase, i) for i in range(self.count)]
+            self.prepare(phase, paths)
+            failed = self.run_workers(phase, stages, paths)
+            # Merge whatever the workers got to before failing, so a rerun resumes from it
+            self.merge(phase, paths)
+            if failed:
+                raise RuntimeError(f"Shards {failed} of the {phase} phase failed")
+
+    def prepare(self, phase: str, paths: List[Path]) -> None:
+        """Create empty discovery checkpoints, or split the main checkpoint by manager id."""
+        for path in paths:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            remove_shard_files(path)
+        if phase == "discover":
+            return
+
+        main = checkpoint_from_settings(self.settings)
+        for path, records in zip(paths, split_records(main.get_all(), self.count)):
+            shard = checkpoint_from_settings(self.settings, str(path))
+            shard.import_managers(records)
+            shard.close()
+        logger.info(f"Split {self.checkpoint_path} into {self.count} shards")
+
+    def worker_env(self, phase: str, stages: Sequence[str], index: int, path: Path) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "SHARDS": "1",
+            "SHARD_INDEX": str(index),
+            "SHARD_COUNT": str(self.count),
+            "CRAWL_MODE": "sequential",
+            "CRAWL_STAGES": ",".join(stages),
+            "PROCESS_DATA": "false",
+            "CHECKPOINT_PATH": str(path),
+            "METRICS_SUMMARY_PATH": str(path.with_suffix(".metrics.json")),
+        })
+        if self.settings.get("FRONTIER_PATH"):
+            env["FRONTIER_PATH"] = str(path.with_suffix(".frontier.db"))
+        port = self.settings.getint("METRICS_PORT", 0)
+        if port:
+            env["METRICS_PORT"] = str(port + 1 + index)
+        if self.incremental:
+            for setting, suffix in WORKER_STATE:
+                copy = path.with_suffix(suffix)
+                source = Path(self.settings.get(setting))
+                if source.exists():
+                    copy.write_bytes(source.read_bytes())
+                env[setting] = str(copy)
+        return env
+
+    def run_workers(self, phase: str, stages: Sequence[str], paths: List[Path]) -> List[int]:
+        """Start one scraper.main per shard and wait for all of them; returns the failed shard indexes."""
+        logger.info(f"Starting {self.count} {phase} workers for {', '.join(stages)}")
+        workers = [
+            subprocess.Popen([sys.executable, "-m", "scraper.main", "crawl", "all"], env=self.worker_env(phase, stages, i, path))
+            for i, path in enumerate(paths)
+        ]
+        failed = []
+        for index, worker in enumerate(workers):
+            if worker.wait() != 0:
+                logger.error(f"{phase} shard {index} exited with {worker.returncode}")
+                failed.append(index)
+        return failed
+
+    def merge(self, phase: str, paths: List[Path]) -> None:
+        """Fold the shard checkpoints, validators, seen filings and metrics back into the main files."""
+        main = checkpoint_from_settings(self.settings)
+        current = main.get_all()
+        parts = [current]
+        for path in paths:
+            parts.append(checkpoint_from_settings(self.settings, str(path)).get_all())
+        # Only managers the workers changed are written, and show up in the change log
+        changed = {manager_id: manager for manager_id, manager in merge_records(parts).items()
+                   if current.get(manager_id) != manager}
+        main.import_managers(changed)
+        main.close()
+        logger.info(f"Merged {self.count} {phase} shards into {self.checkpoint_path} ({len(changed)} managers changed)")
+
+        if self.incremental:
+            (validators, validators_suffix), (seen, seen_suffix) = WORKER_STATE
+            _merge_validators(self.settings.get(validators), [p.with_suffix(validators_suffix) for p in paths])
+            _merge_seen(self.settings.get(seen), [p.with_suffix(seen_suffix) for p in paths])
+        for path in paths:
+            summary = path.with_suffix(".metrics.json")
+            if summary.exists():
+                metrics.load_summary(str(summary))
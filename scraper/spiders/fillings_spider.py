@@ -2,11 +2,19 @@ from typing import Any
 import scrapy
 import os
 from scrapy.http import Response
-from urllib.parse import urljoin
 from scrapy.utils.project import get_project_settings
 
 from scraper.items import FilingItem
-from scraper.storage.checkpoint_manager import CheckpointManager
+from scraper.parsers import filing_rows
+from scraper.storage.backends import checkpoint_from_settings
+from scraper.storage.frontier import filing_weight
+
+def manager_weight(manager: dict) -> int:
+    """Frontier weight of a manager's filings page: the largest reported value among its known filings."""
+    filings = manager.get("filings") or {}
+    return max((filing_weight(filing.get("reported_value"), filing.get("reported_holdings"))
+                for filing in filings.values()), default=0)
+
 
 class FilingsSpider(scrapy.Spider):
     """Spider to scrape 13F filings for managers."""
@@ -17,78 +25,53 @@ class FilingsSpider(scrapy.Spider):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.checkpoint = CheckpointManager(self.custom_settings.get('CHECKPOINT_PATH'))
+        self.checkpoint = checkpoint_from_settings(self.custom_settings)
         self.max_filings = self.custom_settings.getint('MAX_FILINGS_PER_MANAGER', 2)
+        self.incremental = self.custom_settings.getbool('INCREMENTAL')
 
     async def start(self):
         """
         Generate start requests from checkpoint or command line arguments.
         This allows the spider to be run independently or as part of a chain.
+        In incremental mode every manager is revalidated to pick up new filings.
         """
-        for manager_id, data in self.checkpoint.data.items():
-            if not data.get("filings"):
-                yield scrapy.Request(
-                    url=f"{self.custom_settings.get('BASE_URL')}{data['filing_url']}",
-                    meta={"manager_id": manager_id, "manager_name": data["name"]}
-                )
+        for manager_id, data in self.checkpoint.iter_managers(without_filings=not self.incremental):
+            yield scrapy.Request(
+                url=f"{self.custom_settings.get('BASE_URL')}{data['filing_url']}",
+                meta={"manager_id": manager_id, "manager_name": data["name"], "frontier_weight": manager_weight(data)}
+            )
 
     async def parse(self, response: Response):
         """Parse the filings page for a manager."""
         manager_id = response.meta.get("manager_id")
         manager_name = response.meta.get("manager_name")
 
-        filings = response.css("#managerFilings tbody tr")
+        filings = filing_rows(response.selector.root)
 
         if not filings:
             self.logger.warning(f"No filings found for manager {manager_name}")
             return
 
         filings_count = 0
-        for filing in filings:
-            cells = filing.css("td")
-
-            if len(cells) < 7:
+        for row in filings:
+            if row.form_type != "13F-HR":
                 continue
 
-            form_type = cells[4].css("::text").get("").strip()
-
-            if form_type != "13F-HR":
-                continue
-
-            quarter_link = cells[0].css("a")
-            quarter = quarter_link.css("::text").get("").strip()
-            filing_url = quarter_link.attrib.get("href", "")
-            
-            absolute_filing_url = urljoin(self.base_url, filing_url)
-            filing_id = cells[6].css("::text").get("").strip()
             filing_item = FilingItem(
                 manager_id=manager_id,
                 manager_name=manager_name,
-                quarter=quarter,
-                filing_url=filing_url,
-                holdings=cells[1].css("::text").get("").strip(),
-                value=cells[2].css("::text").get("").strip(),
-                top_holdings=cells[3].css("::text").get("").strip(),
-                form_type=form_type,
-                filing_date=cells[5].css("::text").get("").strip(),
-                filing_id=filing_id
+                quarter=row.quarter,
+                filing_url=row.filing_url,
+                holdings=row.holdings,
+                value=row.value,
+                top_holdings=row.top_holdings,
+                form_type=row.form_type,
+                filing_date=row.filing_date,
+                filing_id=row.filing_id
             )
 
             yield filing_item
 
-            if filings_count < self.max_filings and filing_url:
-                yield scrapy.Request(
-                    url=absolute_filing_url,
-                    callback=self.parse_holdings,
-                    meta={
-                        "manager_id": manager_id,
-                        "manager_name": manager_name,
-                        "quarter": quarter,
-                        "filing_date": filing_item["filing_date"],
-                        "filing_id": filing_id
-                    },
-                )
-
             filings_count += 1
             if filings_count >= self.max_filings:
                 break
@@ -1,9 +1,42 @@
 import json
+import time
 import scrapy
 from scrapy.http import Response
 from scrapy.utils.project import get_project_settings
-from scraper.items import HoldingItem
-from scraper.storage.checkpoint_manager import CheckpointManager
+from scraper.items import HOLDING_COLUMNS, HoldingItem, HoldingsBatchItem
+from scraper.json_stream import batched, iter_array
+from scraper.storage.backends import checkpoint_from_settings
+from scraper.storage.frontier import filing_weight
+from scraper.storage.seen_set import seen_filings_from_settings
+
+
+def holding_item(holding: list, fields: dict) -> HoldingItem:
+    """Build a HoldingItem from one row of the data array."""
+    return HoldingItem(
+        manager_id=fields["manager_id"],
+        manager_name=fields["manager_name"],
+        filing_date=fields["filing_date"],
+        quarter=fields["quarter"],
+        symbol=holding[0],
+        issuer=holding[1],
+        cl=holding[2],
+        cusip=holding[3],
+        value=holding[4],
+        percentage=holding[5],
+        shares=holding[6],
+        principal=holding[7],
+        option=holding[8],
+        filing_id=fields["filing_id"]
+    )
+
+
+def holdings_batch_item(holdings: list, fields: dict) -> HoldingsBatchItem:
+    """Build a HoldingsBatchItem from rows of the data array."""
+    item = HoldingsBatchItem(**fields)
+    for index, column in enumerate(HOLDING_COLUMNS):
+        item[column] = [holding[index] for holding in holdings]
+    return item
+
 
 class HoldingsSpider(scrapy.Spider):
     """Spider to scrape holdings from 13F filings."""
@@ -13,21 +46,29 @@ class HoldingsSpider(scrapy.Spider):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.checkpoint = CheckpointManager(self.custom_settings.get('CHECKPOINT_PATH'))
+        self.checkpoint = checkpoint_from_settings(self.custom_settings)
         self.base_holdings_url = self.custom_settings.get("HOLDING_LIST_BASE_URL")
+        self.seen_filings = seen_filings_from_settings(self.custom_settings)
+        self.streaming = self.custom_settings.getbool("HOLDINGS_STREAMING")
+        self.batch_size = self.custom_settings.getint("HOLDINGS_BATCH_SIZE", 500)
+        self.batch_items = self.custom_settings.get("HOLDINGS_ITEMS", "batch") == "batch"
 
     async def start(self):
         """
         Generate start requests from checkpoint.
         This allows the spider to be run independently.
+        In incremental mode filings that are already complete are skipped.
         """
-        for manager_id, data in self.checkpoint.data.items():
-            for filing_id, filing in data["filings"].items():
-                yield scrapy.Request(
-                    url=f"{self.custom_settings.get('BASE_URL')}/data/13f/{filing_id}",
-                    meta={"manager_id": manager_id, "filing_id": filing_id, "quarter": filing["quarter"],
-                          "filing_date": filing["filing_date"]}
-                )
+        incremental = self.seen_filings is not None
+        for manager_id, filing_id, filing in self.checkpoint.iter_filings(without_holdings=incremental):
+            if incremental and filing_id in self.seen_filings:
+                continue
+            yield scrapy.Request(
+                url=f"{self.custom_settings.get('BASE_URL')}/data/13f/{filing_id}",
+                meta={"manager_id": manager_id, "filing_id": filing_id, "quarter": filing["quarter"],
+                      "filing_date": filing["filing_date"],
+                      "frontier_weight": filing_weight(filing.get("reported_value"), filing.get("reported_holdings"))}
+            )
 
 
     async def parse(self, response: Response):
@@ -39,29 +80,71 @@ class HoldingsSpider(scrapy.Spider):
         filing_id = response.meta.get("filing_id", "")
 
         self.logger.info(f"Processing holdings for {manager_id}, quarter {quarter}")
-        response_json = json.loads(response.text)
-
-
-        holdings = response_json["data"]
-
-        for holding in holdings:
-            holding_item = HoldingItem(
-                manager_id=manager_id,
-                manager_name=manager_name,
-                filing_date=filing_date,
-                quarter=quarter,
-                symbol=holding[0],
-                issuer=holding[1],
-                cl=holding[2],
-                cusip=holding[3],
-                value=holding[4],
-                percentage=holding[5],
-                shares=holding[6],
-                principal=holding[7],
-                option=holding[8],
-                filing_id=filing_id
-            )
 
-            yield holding_item
+        fields = dict(manager_id=manager_id, manager_name=manager_name, filing_date=filing_date,
+                      quarter=quarter, filing_id=filing_id)
+        if self.streaming:
+            count = 0
+            for item in self.stream_holdings(response, fields):
+                count += item.row_count() if isinstance(item, HoldingsBatchItem) else 1
+                yield item
+        else:
+            response_json = json.loads(response.text)
+            holdings = response_json["data"]
+            count = len(holdings)
+            if self.batch_items:
+                if holdings:
+                    yield self.holdings_batch(holdings, fields)
+            else:
+                for holding in holdings:
+                    yield holding_item(holding, fields)
+
+        if self.seen_filings is not None and filing_id:
+            self.seen_filings.add(filing_id)
+
+        self.logger.info(f"Processed {count} holdings for {manager_name}, quarter {quarter}")
+
+    def stream_holdings(self, response: Response, fields: dict):
+        """
+        Walk the data array straight from the response bytes, HOLDINGS_BATCH_SIZE
+        rows at a time, so only the current batch of rows is ever decoded.
+        Logs and records parse throughput for the filing.
+        """
+        rows = 0
+        elapsed = 0.0
+        batches = batched(iter_array(response.body), self.batch_size)
+        while True:
+            started = time.perf_counter()
+            batch = next(batches, None)
+            elapsed += time.perf_counter() - started
+            if batch is None:
+                break
+            rows += len(batch)
+            if self.batch_items:
+                yield self.holdings_batch(batch, fields)
+                continue
+            for holding in batch:
+                yield holding_item(holding, fields)
+
+        size = len(response.body)
+        seconds = elapsed or 1e-9
+        self.logger.info(
+            f"Streamed {rows} holdings ({size} bytes) for filing {fields['filing_id']}: "
+            f"{size / seconds:,.0f} bytes/s, {rows / seconds:,.0f} rows/s"
+        )
+        stats = self.crawler.stats
+        stats.inc_value("holdings/stream_bytes", size)
+        stats.inc_value("holdings/stream_rows", rows)
+        stats.inc_value("holdings/stream_seconds", elapsed)
+
+    def holdings_batch(self, holdings: list, fields: dict) -> HoldingsBatchItem:
+        """One item for a filing's rows, or for one HOLDINGS_BATCH_SIZE slice of them when streaming."""
+        stats = self.crawler.stats
+        stats.inc_value("holdings/batch_items")
+        stats.inc_value("holdings/batch_rows", len(holdings))
+        return holdings_batch_item(holdings, fields)
 
-        self.logger.info(f"Processed {len(holdings)} holdings for {manager_name}, quarter {quarter}")
\ No newline at end of file
+    def closed(self, reason):
+        """Persist the completed filings."""
+        if self.seen_filings is not None:
+            self.seen_filings.save()
\ No newline at end of file
@@ -1,11 +1,13 @@
 import string
 from typing import Any
-from urllib.parse import urlparse
 import scrapy
+from scrapy.exceptions import IgnoreRequest
 from scrapy.http import Response
 from scrapy.utils.project import get_project_settings
 from scraper.items import ManagerItem
-from scraper.storage.checkpoint_manager import CheckpointManager
+from scraper.parsers import manager_links
+from scraper.sharding import shard_slice
+from scraper.storage.backends import checkpoint_from_settings
 
 
 class ManagersSpider(scrapy.Spider):
@@ -16,13 +18,16 @@ class ManagersSpider(scrapy.Spider):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.checkpoint = CheckpointManager(self.custom_settings.get('CHECKPOINT_PATH'))
-        self.processed_managers = set(self.checkpoint.data.keys())
+        self.checkpoint = checkpoint_from_settings(self.custom_settings)
+        self.processed_managers = set(self.checkpoint.manager_ids())
 
     async def start(self):
-        """Generate start requests for each alphabet page."""
+        """Generate start requests for each alphabet page, or this shard's pages in a sharded run."""
         base_url = self.custom_settings.get('MANAGER_LIST_BASE_URL')
         pages = list(string.ascii_lowercase) + ['0']
+        shard_count = self.custom_settings.getint('SHARD_COUNT', 1)
+        if shard_count > 1:
+            pages = shard_slice(pages, self.custom_settings.getint('SHARD_INDEX', 0), shard_count)
 
         for page in pages:
             url = f"{base_url}/{page}"
@@ -38,20 +43,9 @@ class ManagersSpider(scrapy.Spider):
         """Parse the manager list page."""
         page = response.meta.get("page", "")
         self.logger.info(f"Processing managers page: {page}")
-        manager_links = response.css("table a[href*='/manager/']")
 
         managers_count = 0
-        for link in manager_links:
-            href = link.attrib["href"]
-            name = link.css("::text").get("").strip()
-            parsed = urlparse(href)
-            path_parts = parsed.path.strip('/').split('/')
-
-            if len(path_parts) < 2:
-                continue
-
-            manager_id = path_parts[-1].split('-')[0]
-
+        for manager_id, name, href in manager_links(response.selector.root):
             if manager_id in self.processed_managers:
                 self.logger.debug(f"Skipping already processed manager: {name}")
                 continue
@@ -68,4 +62,7 @@ class ManagersSpider(scrapy.Spider):
 
     async def handle_error(self, failure):
         """Handle request errors."""
+        if failure.check(IgnoreRequest):
+            self.logger.debug(f"Request ignored: {failure.value}")
+            return
         self.logger.error(f"Request failed: {failure.value}")
\ No newline at end of file
@@ -0,0 +1,135 @@
+import string
+from typing import Any
+import scrapy
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Response
+from scrapy.utils.project import get_project_settings
+
+from scraper.items import ManagerItem, FilingItem
+from scraper.spiders.managers_spider import ManagersSpider
+from scraper.spiders.fillings_spider import FilingsSpider, manager_weight
+from scraper.spiders.holdings_spider import HoldingsSpider
+from scraper.storage.backends import checkpoint_from_settings
+from scraper.storage.frontier import filing_weight
+from scraper.storage.seen_set import seen_filings_from_settings
+
+# Downloader slots used to cap in-flight requests per stage (see DOWNLOAD_SLOTS)
+MANAGERS_SLOT = "managers"
+FILINGS_SLOT = "filings"
+HOLDINGS_SLOT = "holdings"
+
+
+class PipelinedSpider(scrapy.Spider):
+    """
+    Spider that runs the managers, filings and holdings stages from one frontier.
+
+    A manager found on a listing page immediately schedules its filings page,
+    and every 13F-HR filing immediately schedules its holdings request. Later
+    stages get a higher priority so the frontier drains depth-first, and each
+    stage has its own downloader slot so its in-flight requests can be capped.
+    """
+
+    name = "pipelined"
+    custom_settings = get_project_settings()
+
+    # Shared with HoldingsSpider.parse, which runs with this spider as self
+    stream_holdings = HoldingsSpider.stream_holdings
+    holdings_batch = HoldingsSpider.holdings_batch
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkpoint = checkpoint_from_settings(self.custom_settings)
+        self.processed_managers = set(self.checkpoint.manager_ids())
+        self.max_filings = self.custom_settings.getint('MAX_FILINGS_PER_MANAGER', 2)
+        self.base_url = self.custom_settings.get('BASE_URL')
+        self.incremental = self.custom_settings.getbool('INCREMENTAL')
+        self.seen_filings = seen_filings_from_settings(self.custom_settings)
+        self.streaming = self.custom_settings.getbool('HOLDINGS_STREAMING')
+        self.batch_size = self.custom_settings.getint('HOLDINGS_BATCH_SIZE', 500)
+        self.batch_items = self.custom_settings.get('HOLDINGS_ITEMS', 'batch') == 'batch'
+
+    async def start(self):
+        """Start from the listing pages and resume any stage left unfinished in the checkpoint."""
+        base_url = self.custom_settings.get('MANAGER_LIST_BASE_URL')
+        for page in list(string.ascii_lowercase) + ['0']:
+            yield scrapy.Request(
+                url=f"{base_url}/{page}",
+                callback=self.parse,
+                meta={"page": page, "download_slot": MANAGERS_SLOT},
+                errback=self.handle_error
+            )
+
+        # In incremental mode every known manager is revalidated to pick up new filings
+        for manager_id, data in self.checkpoint.iter_managers(without_filings=not self.incremental):
+            yield self.filings_request(manager_id, data["name"], data["filing_url"], manager_weight(data))
+
+        for manager_id, filing_id, filing in self.checkpoint.iter_filings(without_holdings=True):
+            if self.is_complete(filing_id):
+                continue
+            yield self.holdings_request(manager_id, None, filing_id, filing["quarter"], filing["filing_date"],
+                                        filing_weight(filing.get("reported_value"), filing.get("reported_holdings")))
+
+    def is_complete(self, filing_id: str) -> bool:
+        return self.seen_filings is not None and filing_id in self.seen_filings
+
+    def filings_request(self, manager_id: str, manager_name: str, filing_url: str, weight: int = 0) -> scrapy.Request:
+        return scrapy.Request(
+            url=f"{self.base_url}{filing_url}",
+            callback=self.parse_filings,
+            priority=1,
+            meta={"manager_id": manager_id, "manager_name": manager_name, "download_slot": FILINGS_SLOT,
+                  "frontier_weight": weight},
+            errback=self.handle_error
+        )
+
+    def holdings_request(self, manager_id: str, manager_name: Any, filing_id: str, quarter: str,
+                         filing_date: str, weight: int = 0) -> scrapy.Request:
+        return scrapy.Request(
+            url=f"{self.base_url}/data/13f/{filing_id}",
+            callback=self.parse_holdings,
+            priority=2,
+            meta={
+                "manager_id": manager_id,
+                "manager_name": manager_name,
+                "filing_id": filing_id,
+                "quarter": quarter,
+                "filing_date": filing_date,
+                "download_slot": HOLDINGS_SLOT,
+                "frontier_weight": weight,
+            },
+            errback=self.handle_error
+        )
+
+    async def parse(self, response: Response) -> Any:
+        """Parse a manager listing page and schedule the filings page of every new manager."""
+        async for result in ManagersSpider.parse(self, response):
+            yield result
+            if isinstance(result, ManagerItem):
+                yield self.filings_request(result["id"], result["name"], result["link"])
+
+    async def parse_filings(self, response: Response) -> Any:
+        """Parse a manager's filings page and schedule the holdings of every 13F-HR filing."""
+        async for result in FilingsSpider.parse(self, response):
+            yield result
+            if isinstance(result, FilingItem) and result["filing_id"] and not self.is_complete(result["filing_id"]):
+                yield self.holdings_request(
+                    result["manager_id"], result["manager_name"], result["filing_id"],
+                    result["quarter"], result["filing_date"], filing_weight(result["value"], result["holdings"])
+                )
+
+    async def parse_holdings(self, response: Response) -> Any:
+        """Parse the holdings JSON of a filing."""
+        async for result in HoldingsSpider.parse(self, response):
+            yield result
+
+    async def handle_error(self, failure):
+        """Handle request errors."""
+        if failure.check(IgnoreRequest):
+            self.logger.debug(f"Request ignored: {failure.value}")
+            return
+        self.logger.error(f"Request failed: {failure.value}")
+
+    def closed(self, reason):
+        """Persist the completed filings."""
+        if self.seen_filings is not None:
+            self.seen_filings.save()
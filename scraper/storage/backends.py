@@ -0,0 +1,54 @@
+from pathlib import Path
+from typing import Optional
+
+from .checkpoint_manager import CheckpointManager
+
+
+def open_checkpoint(path: str, backend: str = "json", **options) -> CheckpointManager:
+    """
+    Open a checkpoint with the requested storage backend.
+
+    Args:
+        path: Location of the checkpoint
+        backend: "json" for the single-file checkpoint, "journal" for the
+            snapshot plus append-only journal, "sqlite" for the indexed database
+        options: Backend specific keyword arguments
+    """
+    if backend == "json":
+        return CheckpointManager(path, **options)
+    if backend == "journal":
+        from .journal import JournaledCheckpointManager
+        return JournaledCheckpointManager(path, **options)
+    if backend == "sqlite":
+        from .sqlite_checkpoint import SQLiteCheckpointManager
+        return SQLiteCheckpointManager(path, **options)
+    raise ValueError(f"Unknown checkpoint backend: {backend}")
+
+
+def checkpoint_from_settings(settings, path: Optional[str] = None, read_only: bool = False) -> CheckpointManager:
+    """
+    Open the checkpoint configured in the Scrapy settings, or the same backend at another path.
+
+    read_only is for commands that only read the checkpoint and release() it
+    afterwards: an SQLite checkpoint is opened without creating the database
+    or importing into it, and a JSON checkpoint not imported yet is read as is.
+    """
+    path = path or settings.get("CHECKPOINT_PATH", "checkpoints/13f-info.json")
+    backend = settings.get("CHECKPOINT_BACKEND", "json")
+    if read_only and backend == "sqlite" and not Path(path).with_suffix(".db").exists():
+        return open_checkpoint(path)
+    options = {}
+    if backend == "json":
+        options = {
+            "compact": settings.getbool("CHECKPOINT_COMPACT", False),
+            "autosave": settings.getint("CHECKPOINT_AUTOSAVE_MANAGERS", 10),
+        }
+    elif backend == "journal":
+        options = {
+            "flush_interval": settings.getfloat("CHECKPOINT_JOURNAL_FLUSH_INTERVAL", 1.0),
+            "compact_threshold": settings.getint("CHECKPOINT_JOURNAL_COMPACT_THRESHOLD", 100_000),
+            "compact": settings.getbool("CHECKPOINT_COMPACT", False),
+        }
+    elif backend == "sqlite":
+        options = {"batch_size": settings.getint("CHECKPOINT_SQLITE_BATCH_SIZE", 1000), "read_only": read_only}
+    return open_checkpoint(path, backend, **options)
@@ -0,0 +1,74 @@
+"""
+Append-only log of the managers whose checkpoint records changed.
+
+Every checkpoint backend touches the log when a manager, filing or holding
+is stored; a manager is written once per save period, before its data is
+persisted, so a crash can only over-report changes. A consumer
+remembers the byte offset it has read up to (its watermark) and later reads
+only the ids appended after it; see storage/incremental.py.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import IO, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeLog:
+    """Manager ids, one per line, in the order they were changed."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.file: Optional[IO[str]] = None
+        # Ids already written since the last flush; a manager's many holdings log it once
+        self.logged: Set[str] = set()
+
+    def touch(self, manager_id: str) -> None:
+        """Log a changed manager. The line is written before the data it announces is saved."""
+        if manager_id in self.logged:
+            return
+        self.logged.add(manager_id)
+        try:
+            if self.file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.file = open(self.path, "a", encoding="utf-8")
+            self.file.write(f"{manager_id}\n")
+            self.file.flush()
+        except IOError as e:
+            logger.error(f"Error writing change log: {e}")
+
+    def flush(self) -> None:
+        """Called when the checkpoint saves: managers changed after this are logged again."""
+        self.logged.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def size(self) -> int:
+        """Current end of the log, the watermark a consumer reaches by reading everything."""
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def read(self, start: int, end: int) -> Set[str]:
+        """Manager ids appended between two offsets."""
+        if end <= start:
+            return set()
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return set(data.decode("utf-8").split())
+
+    def truncate_if_unchanged(self, end: int) -> bool:
+        """Empty the log once everything up to end was consumed and nothing was appended since."""
+        if end == 0 or self.size() != end:
+            return False
+        with open(self.path, "r+b") as f:
+            f.truncate(0)
+            os.fsync(f.fileno())
+        return True
@@ -1,14 +1,24 @@
 import json
+from collections import Counter
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, Tuple
+
+from .. import metrics
+from .changes import ChangeLog
+from .compact import compact_filing, compact_manager, compact_object, plain
 
 
 class CheckpointManager:
     """Manages checkpoints to resume scraping."""
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, compact: bool = False, autosave: int = 10):
         self.path = Path(path)
         self.data: Dict[str, Any] = {}
+        # Hold records as storage.compact records instead of nested dicts
+        self.compact_records = compact
+        # Save every autosave new managers, 0 for only on close
+        self.autosave = autosave
+        self.changes = ChangeLog(f"{path}.changes")
         self._load()
 
     def _load(self) -> None:
@@ -19,27 +29,132 @@ class CheckpointManager:
 
         try:
             with open(self.path, "r") as f:
-                self.data = json.load(f)
+                self.data = json.load(f, object_hook=compact_object if self.compact_records else None)
         except (json.JSONDecodeError, IOError) as e:
             print(f"Error loading checkpoint: {e}")
             self.data = {}
 
+    def _record(self, record: Any) -> Any:
+        """A manager record in the form this checkpoint holds it."""
+        return compact_manager(record) if self.compact_records else record
+
     def save(self) -> None:
         """Save checkpoint data to file."""
         self.path.parent.mkdir(parents=True, exist_ok=True)
         try:
-            with open(self.path, "w") as f:
-                json.dump(self.data, f, indent=2)
+            with metrics.timer("scraper_checkpoint_save_seconds", backend="json", op="save"):
+                with open(self.path, "w") as f:
+                    json.dump(self.data, f, indent=2, default=plain)
         except IOError as e:
             print(f"Error saving checkpoint: {e}")
+            return
+        self.changes.flush()
+
+    def close(self) -> None:
+        """Persist everything and release resources held by the checkpoint."""
+        self.save()
+        self.changes.close()
+
+    def release(self) -> None:
+        """Release resources held by a checkpoint that was only read, without saving it."""
+        self.changes.close()
+
+    def add_manager(self, manager_id: str, record: Dict[str, Any]) -> None:
+        """Store a manager record."""
+        self[manager_id] = record
+
+    def add_filing(self, manager_id: str, filing_id: str, record: Dict[str, Any]) -> bool:
+        """Store a filing under a known manager. Returns False if the manager is unknown."""
+        if not self._put_filing(manager_id, filing_id, record):
+            return False
+        self.changes.touch(manager_id)
+        return True
+
+    def add_holding(self, manager_id: str, filing_id: str, holding_id: str, record: Dict[str, Any]) -> bool:
+        """Store a holding under a known filing. Returns False if the filing is unknown."""
+        if not self._put_holding(manager_id, filing_id, holding_id, record):
+            return False
+        self.changes.touch(manager_id)
+        return True
+
+    def add_holdings(self, manager_id: str, filing_id: str, holdings: Dict[str, Dict[str, Any]]) -> bool:
+        """Store holding_id -> record under a known filing in one call. Returns False if the filing is unknown."""
+        if not self._put_holdings(manager_id, filing_id, holdings):
+            return False
+        self.changes.touch(manager_id)
+        return True
+
+    def import_managers(self, managers: Dict[str, Any]) -> None:
+        """Store complete manager records, filings and holdings included, and save."""
+        self.data.update((manager_id, self._record(manager)) for manager_id, manager in managers.items())
+        for manager_id in managers:
+            self.changes.touch(manager_id)
+        self.save()
+
+    def manager_ids(self) -> Iterator[str]:
+        """Iterate over the ids of every stored manager."""
+        return iter(list(self.data))
+
+    def iter_managers(self, without_filings: bool = False) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over (manager_id, manager), optionally only managers with no filings yet."""
+        for manager_id, data in list(self.data.items()):
+            if without_filings and data.get("filings"):
+                continue
+            yield manager_id, data
+
+    def iter_manager_chunks(self, size: int) -> Iterator[Dict[str, Any]]:
+        """Iterate over the managers, filings included, as {manager_id: manager} dicts of up to size managers."""
+        chunk: Dict[str, Any] = {}
+        for manager_id, data in self.iter_managers():
+            chunk[manager_id] = data
+            if len(chunk) >= size:
+                yield chunk
+                chunk = {}
+        if chunk:
+            yield chunk
+
+    def iter_filings(self, without_holdings: bool = False) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Iterate over (manager_id, filing_id, filing), optionally only filings with no holdings."""
+        for manager_id, data in list(self.data.items()):
+            for filing_id, filing in list(data.get("filings", {}).items()):
+                if without_holdings and filing.get("holdings"):
+                    continue
+                yield manager_id, filing_id, filing
+
+    def has_filing(self, manager_id: str, filing_id: str) -> bool:
+        """Whether a filing is already stored under a manager."""
+        manager = self.data.get(manager_id)
+        return manager is not None and filing_id in manager.get("filings", {})
+
+    def _put_filing(self,manager_id: str, filing_id: str, record: Dict[str, Any]) -> bool:
+        manager = self.data.get(manager_id)
+        if manager is None:
+            return False
+        manager.setdefault("filings", {})[filing_id] = compact_filing(record) if self.compact_records else record
+        return True
+
+    def _put_holding(self, manager_id: str, filing_id: str, holding_id: str, record: Dict[str, Any]) -> bool:
+        manager = self.data.get(manager_id)
+        if manager is None or filing_id not in manager.get("filings", {}):
+            return False
+        manager["filings"][filing_id].setdefault("holdings", {})[holding_id] = record
+        return True
+
+    def _put_holdings(self, manager_id: str, filing_id: str, holdings: Dict[str, Dict[str, Any]]) -> bool:
+        manager = self.data.get(manager_id)
+        if manager is None or filing_id not in manager.get("filings", {}):
+            return False
+        manager["filings"][filing_id].setdefault("holdings", {}).update(holdings)
+        return True
 
     def __getitem__(self, key: str) -> Any:
         return self.data.get(key)
 
     def __setitem__(self, key: str, value: Any) -> None:
-        self.data[key] = value
+        self.data[key] = self._record(value)
+        self.changes.touch(key)
         # Auto-save on updates to prevent data loss
-        if len(self.data) % 10 == 0:
+        if self.autosave and len(self.data) % self.autosave == 0:
             self.save()
 
     def __contains__(self, key: str) -> bool:
@@ -50,4 +165,27 @@ class CheckpointManager:
 
     def get_all(self) -> Dict[str, Any]:
         """Get all checkpoint data."""
-        return self.data
\ No newline at end of file
+        return self.data
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts of stored managers, filings and holdings, filings per quarter and size on disk."""
+        quarters: Counter = Counter()
+        with_filings = without_holdings = holdings = 0
+        for data in self.data.values():
+            filings = data.get("filings") or {}
+            with_filings += bool(filings)
+            for filing in filings.values():
+                quarters[filing.get("quarter") or ""] += 1
+                count = len(filing.get("holdings") or {})
+                without_holdings += not count
+                holdings += count
+        return {
+            "path": str(self.path),
+            "bytes": self.path.stat().st_size if self.path.exists() else 0,
+            "managers": len(self.data),
+            "managers_with_filings": with_filings,
+            "filings": sum(quarters.values()),
+            "filings_without_holdings": without_holdings,
+            "holdings": holdings,
+            "quarters": dict(quarters),
+        }
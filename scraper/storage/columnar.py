@@ -0,0 +1,178 @@
+"""
+Columnar diff engine for process_data.
+
+The checkpoint is flattened once into typed columns for the latest and the
+previous filing (by quarter) of every manager, and change, pct_change and
+inferred_transaction_type are computed for all managers with a single join.
+The result matches the row-by-row engine exactly.
+"""
+import io
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .compact import HoldingColumns
+from .processor import ROW_COLUMNS, keyed_by_symbol, parse_int, sort_filings
+
+def parse_int_column(values: List[Any]) -> np.ndarray:
+    """parse_int over a whole column, straight into an int64 array."""
+    if not values:
+        return np.zeros(0, dtype=np.int64)
+
+    # Fast path: strip the commas from the whole column at once and let numpy
+    # parse it in C. loadtxt rejects anything that isn't an int64 (blanks end
+    # up as skipped lines, so a length mismatch catches them) and the exact
+    # per-value path takes over. int() also accepts surrounding whitespace,
+    # underscores and non-ASCII digits, so text with any of those skips the
+    # fast path rather than risk reading "1 2" differently.
+    text = "\n".join(map(str, values)).replace(",", "")
+    if text.isascii() and not any(char in text for char in " \t\r\x0b\x0c_"):
+        try:
+            parsed = np.loadtxt(io.StringIO(text), dtype=np.int64, delimiter=",", comments=None, ndmin=1)
+        except ValueError:
+            parsed = None
+        if parsed is not None and len(parsed) == len(values):
+            return parsed
+    return np.fromiter(map(parse_int, values), dtype=np.int64, count=len(values))
+
+
+def int_column(values: List[Any]) -> np.ndarray:
+    """parse_int_column, skipping the text parse when the values are ints already (normalized holdings)."""
+    if all(type(value) is int for value in values):
+        try:
+            return np.fromiter(values, dtype=np.int64, count=len(values))
+        except OverflowError:
+            pass
+    return parse_int_column(values)
+
+
+def holding_symbols(holdings: Dict[str, Any]) -> List[str]:
+    """holding_symbol of every holding of a filing, in order."""
+    if isinstance(holdings, HoldingColumns):
+        return [key if symbol is None else symbol for key, symbol in zip(holdings, holdings.column('symbol'))]
+    return [holding.get('symbol', key) for key, holding in holdings.items()]
+
+
+def flatten_checkpoint(checkpoint_data: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+    """
+    Flatten the latest and previous filing of every manager into two frames.
+
+    Returns:
+        {"latest": one row per holding of each manager's latest filing,
+         "previous": manager position, holding key and shares of the previous filing}
+
+    Holdings are matched on their checkpoint key, or on symbols when only one
+    of the two filings was stored before normalization (keyed_by_symbol).
+    """
+    # Per-manager attributes, repeated once per holding at the end
+    positions, counts, manager_ids, fund_names, filing_dates, quarters = [], [], [], [], [], []
+    keys, holding_keys, symbols, cls, values, shares = [], [], [], [], [], []
+    prev_positions, prev_counts, prev_keys, prev_shares = [], [], [], []
+    rekeyed = False
+
+    for position, (manager_id, manager_data) in enumerate(checkpoint_data.items()):
+        filings = manager_data.get("filings")
+        if not filings:
+            continue
+
+        ordered = sort_filings(filings)
+        latest_filing = ordered[0]
+        prev_filing = ordered[1] if len(ordered) > 1 else None
+
+        holdings = latest_filing.get('holdings', {})
+        prev_holdings = prev_filing.get('holdings', {}) if prev_filing else {}
+        by_symbol = bool(holdings) and bool(prev_holdings) and (
+            keyed_by_symbol(holdings) != keyed_by_symbol(prev_holdings))
+        rekeyed |= by_symbol
+        if holdings:
+            positions.append(position)
+            counts.append(len(holdings))
+            manager_ids.append(manager_id)
+            fund_names.append(manager_data.get('name', 'Unknown'))
+            filing_dates.append(latest_filing.get('filing_date', ''))
+            quarters.append(latest_filing.get('quarter', ''))
+            latest_symbols = holding_symbols(holdings)
+            symbols.extend(latest_symbols)
+            keys.extend(latest_symbols if by_symbol else holdings)
+            holding_keys.extend(holdings)
+            if isinstance(holdings, HoldingColumns):
+                cls.extend(holdings.column('cl', ''))
+                values.extend(holdings.column('value'))
+                shares.extend(holdings.column('shares'))
+            else:
+                records = holdings.values()
+                cls.extend([holding.get('cl', '') for holding in records])
+                values.extend([holding.get('value') for holding in records])
+                shares.extend([holding.get('shares') for holding in records])
+
+        if prev_holdings:
+            prev_positions.append(position)
+            prev_counts.append(len(prev_holdings))
+            prev_keys.extend(holding_symbols(prev_holdings) if by_symbol else prev_holdings)
+            if isinstance(prev_holdings, HoldingColumns):
+                prev_shares.extend(prev_holdings.column('shares'))
+            else:
+                prev_shares.extend([holding.get('shares') for holding in prev_holdings.values()])
+
+    counts = np.asarray(counts, dtype=np.int64)
+    latest = pd.DataFrame({
+        'manager_idx': np.repeat(np.asarray(positions, dtype=np.int64), counts),
+        'fund_name': np.repeat(np.asarray(fund_names, dtype=object), counts),
+        'filing_date': np.repeat(np.asarray(filing_dates, dtype=object), counts),
+        'quarter': np.repeat(np.asarray(quarters, dtype=object), counts),
+        'key': np.asarray(keys, dtype=object),
+        'stock_symbol': np.asarray(symbols, dtype=object),
+        'cl': np.asarray(cls, dtype=object),
+        'value_($000)': int_column(values),
+        'shares': int_column(shares),
+        'manager_id': np.repeat(np.asarray(manager_ids, dtype=object), counts),
+        'holding_key': np.asarray(holding_keys, dtype=object),
+    })
+    previous = pd.DataFrame({
+        'manager_idx': np.repeat(np.asarray(prev_positions, dtype=np.int64), np.asarray(prev_counts, dtype=np.int64)),
+        'key': np.asarray(prev_keys, dtype=object),
+        'prev_shares': int_column(prev_shares),
+    })
+    if rekeyed:
+        # Symbols of normalized holdings can repeat; like a dict of them, the last one wins
+        previous = previous.drop_duplicates(['manager_idx', 'key'], keep='last')
+    return {"latest": latest, "previous": previous}
+
+
+def round_pct(pct: np.ndarray) -> np.ndarray:
+    """Round to 2 decimals exactly like the builtin round()."""
+    rounded = np.round(pct, 2)
+    # np.round scales by 100 before rounding, which can disagree with round()
+    # only when the scaled value sits right on a .5 boundary
+    scaled = np.abs(pct * 100)
+    ambiguous = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(ambiguous):
+        rounded[i] = round(float(pct[i]), 2)
+    return rounded
+
+
+def compute_diffs(checkpoint_data: Dict[str, Any]) -> pd.DataFrame:
+    """Compute the latest-vs-previous filing diff of every manager."""
+    frames = flatten_checkpoint(checkpoint_data)
+    df = frames["latest"].merge(frames["previous"], on=['manager_idx', 'key'], how='left', sort=False)
+
+    prev_shares = df['prev_shares'].fillna(0).to_numpy(dtype=np.int64)
+    current_shares = df['shares'].to_numpy(dtype=np.int64)
+    change = current_shares - prev_shares
+
+    has_prev = prev_shares != 0
+    pct = np.zeros(len(df), dtype=np.float64)
+    pct[has_prev] = change[has_prev] / prev_shares[has_prev] * 100
+    pct_change = np.where(has_prev, round_pct(pct), 0.0)
+
+    transaction_type = np.select(
+        [~has_prev, change > 0, change < 0],
+        ['new', 'buy', 'sell'],
+        default='hold'
+    ).astype(object)
+
+    df['change'] = change
+    df['pct_change'] = pct_change
+    df['inferred_transaction_type'] = transaction_type
+    return df[ROW_COLUMNS]
@@ -0,0 +1,415 @@
+"""
+Compact in-memory representation of checkpoint records.
+
+A loaded JSON checkpoint is a tree of dicts of strings: every holding is a
+dict with its own key strings and amounts kept as "1,234,567" text or ints,
+which costs several hundred bytes per holding. Here managers and filings are
+``__slots__`` records, and the holdings of a filing are columns: interned key,
+cusip and text field strings, int64 arrays of shares and value and a float
+array of percentages. A holding takes a few dozen bytes.
+
+The records are mutable mappings, so code written against the dict
+checkpoint (process_data, the spiders, the pipelines) reads them unchanged:
+``manager["filings"][filing_id]["holdings"][key]["shares"]`` still returns
+1234567, or "1,234,567" for a holding stored before normalization. Both
+layouts are columns, the old {"shares", "value", "cusip"} one and the full
+record of scraper/normalize.py. Amounts are rebuilt in the form they were
+stored in, and a holding that doesn't fit the columns (other fields, amounts
+that are neither ints nor canonical "1,234" text) is kept as its original
+dict, so a save writes back exactly what was loaded.
+"""
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_MISSING = object()
+
+HOLDING_FIELDS = ("shares", "value", "cusip")
+# A normalized holding (scraper/normalize.py RECORD_FIELDS) and its fields stored as text
+RECORD_FIELDS = ("shares", "value", "cusip", "symbol", "issuer", "cl", "percentage", "principal", "option")
+TEXT_FIELDS = ("symbol", "issuer", "cl", "principal", "option")
+
+# How a row's shares and value are stored: as "1,234" text or as JSON ints
+_TEXT, _INT = 0, 1
+# Row flags: a record without a cusip key, a normalized record, one whose percentage is None
+_NO_CUSIP = 4
+_FULL = 8
+_NO_PERCENTAGE = 16
+
+# Row flags of each field layout the columns hold
+_LAYOUTS = {
+    HOLDING_FIELDS: 0,
+    HOLDING_FIELDS[:2]: _NO_CUSIP,
+    RECORD_FIELDS: _FULL,
+    RECORD_FIELDS[:2] + RECORD_FIELDS[3:]: _FULL | _NO_CUSIP,
+}
+
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+def _encode_amount(value: Any) -> Optional[Tuple[int, int]]:
+    """(number, kind) for a value the columns can rebuild exactly, else None."""
+    if type(value) is str:
+        try:
+            number = int(value.replace(",", ""))
+        except ValueError:
+            return None
+        if f"{number:,}" == value and _INT64_MIN <= number <= _INT64_MAX:
+            return number, _TEXT
+        return None
+    if type(value) is int and _INT64_MIN <= value <= _INT64_MAX:
+        return value, _INT
+    return None
+
+
+def _decode_amount(number: int, kind: int) -> Any:
+    return number if kind == _INT else f"{number:,}"
+
+
+def _encode_row(record: Mapping) -> Optional[Tuple[int, int, int, Optional[str], Optional[tuple], float]]:
+    """(flags, shares, value, cusip, text fields, percentage) of a record the columns can rebuild, else None."""
+    flags = _LAYOUTS.get(tuple(record))
+    if flags is None:
+        return None
+    shares, value = _encode_amount(record["shares"]), _encode_amount(record["value"])
+    cusip = record.get("cusip")
+    if shares is None or value is None or not (cusip is None or type(cusip) is str):
+        return None
+    flags |= shares[1] | (value[1] << 1)
+    if not flags & _FULL:
+        return flags, shares[0], value[0], cusip, None, 0.0
+    text = tuple(record[field] for field in TEXT_FIELDS)
+    percentage = record["percentage"]
+    if any(not (field is None or type(field) is str) for field in text):
+        return None
+    if percentage is None:
+        flags |= _NO_PERCENTAGE
+        percentage = 0.0
+    elif type(percentage) is not float:
+        return None
+    return flags, shares[0], value[0], cusip, text, percentage
+
+
+# Columns of a row kept in HoldingColumns.records, and the text of a row that isn't normalized
+_UNENCODED = (_TEXT, 0, 0, None, None, 0.0)
+_NO_TEXT = (None,) * len(TEXT_FIELDS)
+
+
+class HoldingColumns(MutableMapping):
+    """A filing's holdings, key -> holding record, stored column-wise in insertion order."""
+
+    __slots__ = ("symbols", "cusips", "shares", "values_", "kinds", "order", "records", "text", "percentages")
+
+    def __init__(self, holdings: Optional[Mapping] = None):
+        # Holding keys: symbols before normalization, holding_keys since
+        self.symbols: List[str] = []
+        self.cusips: List[Optional[str]] = []
+        self.shares = array("q")
+        self.values_ = array("q")
+        # Per row: how shares (bit 0) and value (bit 1) are rendered, and the row flags
+        self.kinds = array("b")
+        # Row numbers sorted by key, for lookups without a per-filing dict
+        self.order = array("i")
+        # Rows kept as their original dict because the columns can't represent them
+        self.records: Optional[Dict[int, Dict[str, Any]]] = None
+        # TEXT_FIELDS and percentage of normalized rows, created with the first one
+        self.text: Optional[Dict[str, List[Optional[str]]]] = None
+        self.percentages: Optional[array] = None
+        if holdings:
+            self._extend(holdings)
+
+    def _full_columns(self, rows: int) -> None:
+        """Create the columns of normalized rows, empty for the first rows."""
+        if self.text is None:
+            self.text = {field: [None] * rows for field in TEXT_FIELDS}
+            self.percentages = array("d", bytes(8 * rows))
+
+    def _extend(self, holdings: Mapping) -> None:
+        """Fill empty columns. Keys of a mapping are unique, so rows are appended and the lookup order sorted once."""
+        symbols, cusips, kinds = self.symbols, self.cusips, self.kinds
+        shares_column, values_column = self.shares, self.values_
+        for symbol, record in holdings.items():
+            encoded = _encode_row(record)
+            if encoded is None:
+                if self.records is None:
+                    self.records = {}
+                self.records[len(symbols)] = dict(record)
+                encoded = _UNENCODED
+            kind, shares, value, cusip, text, percentage = encoded
+            if text is not None and self.text is None:
+                self._full_columns(len(symbols))
+            if self.text is not None:
+                for field, column_value in zip(TEXT_FIELDS, text or _NO_TEXT):
+                    self.text[field].append(intern(column_value))
+                self.percentages.append(percentage)
+            symbols.append(intern(symbol))
+            cusips.append(intern(cusip))
+            shares_column.append(shares)
+            values_column.append(value)
+            kinds.append(kind)
+        self.order = array("i", sorted(range(len(symbols)), key=symbols.__getitem__))
+
+    def _append(self, symbol: str) -> int:
+        self.symbols.append(intern(symbol))
+        self.cusips.append(None)
+        self.shares.append(0)
+        self.values_.append(0)
+        self.kinds.append(0)
+        if self.text is not None:
+            for column in self.text.values():
+                column.append(None)
+            self.percentages.append(0.0)
+        return len(self.symbols) - 1
+
+    def _find(self, symbol: str) -> Tuple[int, int]:
+        """(position in order, row) of a symbol; row is -1 when absent."""
+        symbols, order = self.symbols, self.order
+        low, high = 0, len(order)
+        while low < high:
+            mid = (low + high) // 2
+            if symbols[order[mid]] < symbol:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(order) and symbols[order[low]] == symbol:
+            return low, order[low]
+        return low, -1
+
+    def _row(self, row: int) -> Dict[str, Any]:
+        if self.records is not None and row in self.records:
+            return dict(self.records[row])
+        kind = self.kinds[row]
+        record = {
+            "shares": _decode_amount(self.shares[row], kind & 1),
+            "value": _decode_amount(self.values_[row], (kind >> 1) & 1),
+        }
+        if not kind & _NO_CUSIP:
+            record["cusip"] = self.cusips[row]
+        if kind & _FULL:
+            text = self.text
+            record["symbol"] = text["symbol"][row]
+            record["issuer"] = text["issuer"][row]
+            record["cl"] = text["cl"][row]
+            record["percentage"] = None if kind & _NO_PERCENTAGE else self.percentages[row]
+            record["principal"] = text["principal"][row]
+            record["option"] = text["option"][row]
+        return record
+
+    def _store(self, row: int, record: Mapping) -> None:
+        encoded = _encode_row(record)
+        if encoded is None:
+            if self.records is None:
+                self.records = {}
+            self.records[row] = dict(record)
+            encoded = _UNENCODED
+        elif self.records is not None:
+            self.records.pop(row, None)
+        kind, shares, value, cusip, text, percentage = encoded
+        self.cusips[row] = intern(cusip)
+        self.shares[row] = shares
+        self.values_[row] = value
+        self.kinds[row] = kind
+        if text is not None:
+            self._full_columns(len(self.symbols))
+            for field, column_value in zip(TEXT_FIELDS, text):
+                self.text[field][row] = intern(column_value)
+            self.percentages[row] = percentage
+        elif self.text is not None:
+            for column in self.text.values():
+                column[row] = None
+            self.percentages[row] = 0.0
+
+    def column(self, field: str, default: Any = None) -> List[Any]:
+        """
+        One field of every row, like [holding.get(field, default) for holding in values()],
+        except that shares and value come back as ints, which parse_int reads the same as the text.
+        """
+        if field in ("shares", "value"):
+            column = list(self.shares if field == "shares" else self.values_)
+        elif field == "cusip":
+            column = [default if kind & _NO_CUSIP else cusip for cusip, kind in zip(self.cusips, self.kinds)]
+        elif field in TEXT_FIELDS and self.text is not None:
+            column = [value if kind & _FULL else default for value, kind in zip(self.text[field], self.kinds)]
+        elif field == "percentage" and self.text is not None:
+            column = [
+                (None if kind & _NO_PERCENTAGE else percentage) if kind & _FULL else default
+                for percentage, kind in zip(self.percentages, self.kinds)
+            ]
+        else:
+            column = [default] * len(self.symbols)
+        if self.records:
+            for row, record in self.records.items():
+                column[row] = record.get(field, default)
+        return column
+
+    def __getitem__(self, symbol: str) -> Dict[str, Any]:
+        _, row = self._find(symbol)
+        if row < 0:
+            raise KeyError(symbol)
+        return self._row(row)
+
+    def __setitem__(self, symbol: str, record: Mapping) -> None:
+        position, row = self._find(symbol)
+        if row < 0:
+            row = self._append(symbol)
+            self.order.insert(position, row)
+        self._store(row, record)
+
+    def __delitem__(self, symbol: str) -> None:
+        if self._find(symbol)[1] < 0:
+            raise KeyError(symbol)
+        remaining = [(s, r) for s, r in self.items() if s != symbol]
+        self.__init__()
+        for s, r in remaining:
+            self[s] = r
+
+    def update(self, other=(), **kwargs) -> None:
+        # A batch of holdings into an empty filing: append the rows and sort the lookup order once
+        if not self.symbols and isinstance(other, Mapping) and not kwargs:
+            self._extend(other)
+        else:
+            super().update(other, **kwargs)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.symbols)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __contains__(self, symbol: object) -> bool:
+        return type(symbol) is str and self._find(symbol)[1] >= 0
+
+    # Row order iteration, without a lookup per key. Lists, like dict views
+    # they can be iterated more than once.
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(symbol, self._row(row)) for row, symbol in enumerate(self.symbols)]
+
+    def values(self) -> List[Dict[str, Any]]:
+        return [self._row(row) for row in range(len(self.symbols))]
+
+    def __repr__(self) -> str:
+        return f"HoldingColumns({dict(self.items())!r})"
+
+
+class _Record(MutableMapping):
+    """A dict-like record with its usual fields in slots and anything else in ``extra``."""
+
+    __slots__ = ("extra",)
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, record: Mapping):
+        for field in self.FIELDS:
+            object.__setattr__(self, field, _MISSING)
+        self.extra: Optional[Dict[str, Any]] = None
+        for key, value in record.items():
+            self[key] = value
+
+    def _convert(self, key: str, value: Any) -> Any:
+        return intern(value)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self.FIELDS:
+            setattr(self, key, self._convert(key, value))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self.FIELDS and getattr(self, key) is not _MISSING:
+            setattr(self, key, _MISSING)
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        # Return the stored (converted) value, so setdefault("holdings", {})[...] = ... lands in the record
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self.FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(getattr(self, field) is not _MISSING for field in self.FIELDS) + len(self.extra or ())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def __reduce__(self):
+        # Rebuilt through __init__: unset slots hold a sentinel that doesn't survive pickling
+        return type(self), (dict(self.items()),)
+
+
+class FilingRecord(_Record):
+    __slots__ = ("quarter", "filing_url", "filing_date", "filing_id", "holdings", "reported_value", "reported_holdings")
+    FIELDS = __slots__
+
+    def _convert(self, key: str, value: Any) -> Any:
+        if key == "holdings":
+            return value if isinstance(value, HoldingColumns) else HoldingColumns(value)
+        return intern(value)
+
+
+class ManagerRecord(_Record):
+    __slots__ = ("id", "name", "filing_url", "filings")
+    FIELDS = __slots__
+
+    def _convert(self, key: str, value: Any) -> Any:
+        if key == "filings":
+            return {filing_id: compact_filing(filing) for filing_id, filing in value.items()}
+        return intern(value)
+
+
+def compact_filing(record: Any) -> Any:
+    """A filing as a FilingRecord; anything that isn't a mapping is left alone."""
+    if isinstance(record, FilingRecord) or not isinstance(record, Mapping):
+        return record
+    return FilingRecord(record)
+
+
+def compact_manager(record: Any) -> Any:
+    """A manager, with its filings and holdings, as compact records."""
+    if isinstance(record, ManagerRecord) or not isinstance(record, Mapping):
+        return record
+    return ManagerRecord(record)
+
+
+def compact_object(record: Dict[str, Any]) -> Any:
+    """
+    json.load object_hook building compact records while the checkpoint is
+    parsed, so the whole tree never exists as dicts. Objects are passed in
+    innermost first: a filing's holdings are already a dict when the filing is.
+    """
+    if "holdings" in record:
+        return FilingRecord(record)
+    if "filings" in record:
+        return ManagerRecord(record)
+    return record
+
+
+def plain(value: Any) -> Any:
+    """json.dump default= hook turning compact records back into dicts."""
+    if isinstance(value, Mapping):
+        return dict(value.items())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
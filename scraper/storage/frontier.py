@@ -0,0 +1,133 @@
+"""
+Disk-backed, value-ordered crawl frontier.
+
+Every request a spider schedules is a row of a SQLite table, popped in order
+of Scrapy priority, then weight (the reported value of the filing behind the
+request, see filing_weight), then arrival. A popped request stays in the
+table, in flight, until its callback has run. When a run stops before
+finishing, the next run of the spider starts from its queued requests, with
+the ones that were in flight queued again. A finished run clears the
+spider's rows: requests still in flight then were answered with a failure.
+
+Completed requests are deleted rather than remembered: whether their items
+reached the checkpoint depends on when the checkpoint was last saved, so the
+spiders keep deciding from the checkpoint what start() has to request again.
+
+Requests are stored as opaque blobs (FrontierScheduler pickles Scrapy's
+request_to_dict output), keyed by their fingerprint.
+"""
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    seq INTEGER PRIMARY KEY,
+    spider TEXT NOT NULL,
+    fingerprint BLOB NOT NULL,
+    priority INTEGER NOT NULL,
+    weight INTEGER NOT NULL,
+    state INTEGER NOT NULL,
+    request BLOB NOT NULL,
+    UNIQUE (spider, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS frontier_next ON frontier (spider, state, priority DESC, weight DESC, seq);
+"""
+
+PENDING, IN_FLIGHT = 0, 1
+
+_NOT_DIGITS = re.compile(r"\D")
+
+
+def reported_amount(text: Any) -> int:
+    """An amount from the filings table ("1,234,567", "$1,234,567") as an int, 0 if there is none."""
+    digits = _NOT_DIGITS.sub("", str(text or ""))
+    return int(digits) if digits else 0
+
+
+def filing_weight(value: Any, holdings: Any = None) -> int:
+    """Frontier weight of a filing: its reported value ($000), or its holdings count if no value was reported."""
+    return reported_amount(value) or reported_amount(holdings)
+
+
+class Frontier:
+    """The queue of one spider in a frontier database."""
+
+    def __init__(self, path: str, spider: str, commit_interval: float = 1.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.spider = spider
+        self.commit_interval = commit_interval
+        self.conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Requests in flight when the last run stopped were never answered
+        self.requeued = self.conn.execute(
+            "UPDATE frontier SET state = ? WHERE spider = ? AND state = ?", (PENDING, spider, IN_FLIGHT)
+        ).rowcount
+        self.pending = self.conn.execute(
+            "SELECT COUNT(*) FROM frontier WHERE spider = ? AND state = ?", (spider, PENDING)
+        ).fetchone()[0]
+        self.conn.execute("BEGIN")
+        self.committed = time.monotonic()
+
+    def _state(self, fingerprint: bytes) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT state FROM frontier WHERE spider = ? AND fingerprint = ?", (self.spider, fingerprint)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _maybe_commit(self) -> None:
+        if time.monotonic() - self.committed >= self.commit_interval:
+            self.conn.execute("COMMIT")
+            self.conn.execute("BEGIN")
+            self.committed = time.monotonic()
+
+    def push(self, fingerprint: bytes, priority: int, weight: int, request: bytes) -> None:
+        """Queue a request, replacing a queued or in-flight copy of it (a retry)."""
+        state = self._state(fingerprint)
+        self.conn.execute(
+            "INSERT INTO frontier (spider, fingerprint, priority, weight, state, request) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (spider, fingerprint) DO UPDATE SET "
+            "priority = excluded.priority, weight = excluded.weight, state = excluded.state, request = excluded.request",
+            (self.spider, fingerprint, priority, weight, PENDING, request),
+        )
+        if state != PENDING:
+            self.pending += 1
+        self._maybe_commit()
+
+    def pop(self) -> Optional[Tuple[bytes, bytes]]:
+        """(fingerprint, request) of the next request, which is now in flight; None when nothing is queued."""
+        row = self.conn.execute(
+            "SELECT seq, fingerprint, request FROM frontier WHERE spider = ? AND state = ? "
+            "ORDER BY priority DESC, weight DESC, seq LIMIT 1",
+            (self.spider, PENDING),
+        ).fetchone()
+        if row is None:
+            return None
+        seq, fingerprint, request = row
+        self.conn.execute("UPDATE frontier SET state = ? WHERE seq = ?", (IN_FLIGHT, seq))
+        self.pending -= 1
+        self._maybe_commit()
+        return fingerprint, request
+
+    def complete(self, fingerprint: bytes) -> None:
+        """Drop an in-flight request whose callback has run."""
+        self.conn.execute(
+            "DELETE FROM frontier WHERE spider = ? AND fingerprint = ? AND state = ?",
+            (self.spider, fingerprint, IN_FLIGHT),
+        )
+        self._maybe_commit()
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def close(self, finished: bool) -> None:
+        """Commit the queue; a finished run has nothing left to resume, so its rows are cleared."""
+        if finished:
+            self.conn.execute("DELETE FROM frontier WHERE spider = ?", (self.spider,))
+        self.conn.execute("COMMIT")
+        self.conn.close()
@@ -0,0 +1,254 @@
+"""
+Multi-quarter holdings history.
+
+process_data only compares a manager's latest filing with the one before it.
+HoldingsHistory keeps every scraped quarter instead: one row per
+(manager, position, quarter), where a position is the holding's cusip (its
+symbol when the cusip is missing; puts and calls on it are positions of their
+own), stored as integer-coded numpy columns so 20+ quarters of every manager
+stay compact. A manager contributes one filing per quarter, the first of
+that quarter in sort_filings order, and the classes of a cusip it lists
+apart are summed into the one position.
+
+summary() derives, for every position, the N-quarter share change, the
+current holding streak and the entry/exit quarters in one vectorized pass
+over the rows sorted by (manager, position, quarter). Quarters are counted in
+the manager's own filed quarters, so a quarter that wasn't scraped doesn't
+break a streak.
+"""
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .. import metrics
+from .columnar import holding_symbols, int_column, round_pct
+from .compact import HoldingColumns
+from .processor import quarter_key, sort_filings
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLUMNS = [
+    'manager_id', 'fund_name', 'cusip', 'stock_symbol', 'first_quarter', 'entry_quarter', 'exit_quarter',
+    'quarters_held', 'streak', 'latest_quarter', 'shares', 'base_quarter', 'base_shares', 'change', 'pct_change'
+]
+
+# Quarter ordinals and position codes are packed into one sortable int64
+_SHIFT = 32
+
+
+def quarter_label(key: int) -> str:
+    """Inverse of quarter_key."""
+    return f"Q{key % 4 + 1} {key // 4}"
+
+
+def position_key(cusip: Optional[str], symbol: str, option: str) -> str:
+    """A position across quarters: the cusip (symbol when missing), with puts and calls apart from the shares."""
+    key = cusip or symbol
+    return f"{key}|{option}" if option else key
+
+
+class HoldingsHistory:
+    """Position time series of every manager across all scraped quarters."""
+
+    def __init__(self, checkpoint_data: Dict[str, Any]):
+        manager_ids, fund_names = [], []
+        # Per quarter filed by a manager
+        filed_manager, filed_quarter, counts = [], [], []
+        # Per holding
+        keys, symbols, shares, values = [], [], [], []
+
+        for manager_id, manager_data in checkpoint_data.items():
+            filings = manager_data.get('filings')
+            if not filings:
+                continue
+            manager = len(manager_ids)
+            manager_ids.append(manager_id)
+            fund_names.append(manager_data.get('name', 'Unknown'))
+
+            last_quarter = None
+            for filing in sort_filings(filings):
+                quarter = quarter_key(filing.get('quarter', ''))
+                if quarter < 0 or quarter == last_quarter:
+                    continue
+                last_quarter = quarter
+                holdings = filing.get('holdings', {})
+                filed_manager.append(manager)
+                filed_quarter.append(quarter)
+                counts.append(len(holdings))
+                filing_symbols = holding_symbols(holdings)
+                symbols.extend(filing_symbols)
+                if isinstance(holdings, HoldingColumns):
+                    keys.extend([position_key(cusip, symbol, option) for cusip, symbol, option in zip(
+                        holdings.column('cusip'), filing_symbols, holdings.column('option', ''))])
+                    shares.extend(holdings.column('shares'))
+                    values.extend(holdings.column('value'))
+                    continue
+                for symbol, holding in zip(filing_symbols, holdings.values()):
+                    keys.append(position_key(holding.get('cusip'), symbol, holding.get('option', '')))
+                    shares.append(holding.get('shares'))
+                    values.append(holding.get('value'))
+
+        self.manager_ids = np.asarray(manager_ids, dtype=object)
+        self.fund_names = np.asarray(fund_names, dtype=object)
+        self.filed_manager = np.asarray(filed_manager, dtype=np.int32)
+        self.filed_quarter = np.asarray(filed_quarter, dtype=np.int32)
+
+        counts = np.asarray(counts, dtype=np.int64)
+        manager = np.repeat(self.filed_manager, counts)
+        quarter = np.repeat(self.filed_quarter, counts)
+        key_codes, self.keys = pd.factorize(pd.Series(keys, dtype=object))
+        key = key_codes.astype(np.int32)
+        shares, values = int_column(shares), int_column(values)
+
+        # A filing lists each class of a cusip apart (the checkpoint keys holdings by cusip|class): sum them
+        # into one row per (manager, position, quarter), the first row's symbol standing for the position
+        rows = np.lexsort((quarter, key, manager))
+        packed = (manager[rows].astype(np.int64) << _SHIFT) | key[rows]
+        first = np.flatnonzero(np.r_[True, (packed[1:] != packed[:-1]) | (quarter[rows][1:] != quarter[rows][:-1])])
+        if len(first) < len(rows):
+            shares, values = np.add.reduceat(shares[rows], first), np.add.reduceat(values[rows], first)
+            rows = rows[first]
+            manager, quarter, key = manager[rows], quarter[rows], key[rows]
+            symbols = [symbols[row] for row in rows]
+        self.manager, self.quarter, self.key = manager, quarter, key
+        # Symbol as filed, per row (a cusip can be listed under different symbols)
+        self.symbols = pd.Categorical(symbols)
+        self.shares = shares
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.manager)
+
+    def frame(self) -> pd.DataFrame:
+        """Every (manager, position, quarter) row, names as categoricals."""
+        return pd.DataFrame({
+            'manager_id': pd.Categorical.from_codes(self.manager, self.manager_ids),
+            'fund_name': pd.Categorical(self.fund_names[self.manager]),
+            'cusip': pd.Categorical.from_codes(self.key, self.keys),
+            'stock_symbol': self.symbols,
+            'quarter': pd.Categorical([quarter_label(q) for q in self.quarter]),
+            'value_($000)': self.values,
+            'shares': self.shares,
+        })
+
+    def series(self, manager_id: str, key: str) -> pd.DataFrame:
+        """Quarter by quarter shares and value of one position, oldest first."""
+        manager = np.flatnonzero(self.manager_ids == manager_id)
+        key_code = self.keys.get_indexer([key])[0]
+        if not len(manager) or key_code < 0:
+            return pd.DataFrame(columns=['quarter', 'shares', 'value_($000)'])
+        rows = np.flatnonzero((self.manager == manager[0]) & (self.key == key_code))
+        rows = rows[np.argsort(self.quarter[rows], kind='stable')]
+        return pd.DataFrame({
+            'quarter': [quarter_label(q) for q in self.quarter[rows]],
+            'shares': self.shares[rows],
+            'value_($000)': self.values[rows],
+        })
+
+    def summary(self, quarters: int = 4) -> pd.DataFrame:
+        """
+        One row per (manager, position) ever held.
+
+        Args:
+            quarters: Compare the manager's latest quarter with the one this
+                many filed quarters earlier
+
+        Columns:
+            first_quarter, entry_quarter: First quarter held, and first quarter
+                of the latest streak of consecutive quarters
+            exit_quarter: First quarter the position was gone, "" if still held
+            quarters_held, streak: Quarters held in total and in the latest streak
+            shares, base_shares: Shares in the latest and the base quarter, 0
+                where the position (or the base quarter) is absent
+        """
+        if not len(self):
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+        # Ordinal of each filed quarter within its manager: 0 for the oldest
+        order = np.lexsort((self.filed_quarter, self.filed_manager))
+        filed_manager, filed_quarter = self.filed_manager[order], self.filed_quarter[order]
+        manager_start = np.r_[True, filed_manager[1:] != filed_manager[:-1]]
+        first_filed = np.maximum.accumulate(np.where(manager_start, np.arange(len(order)), 0))
+        filed_ordinal = np.arange(len(order)) - first_filed
+        filed_packed = (filed_manager.astype(np.int64) << _SHIFT) | filed_quarter
+        # Latest ordinal and quarter, and position of the oldest filed quarter, indexed by manager
+        manager_end = np.r_[manager_start[1:], True]
+        latest_ordinal = np.zeros(len(self.manager_ids), dtype=np.int64)
+        latest_ordinal[filed_manager[manager_end]] = filed_ordinal[manager_end]
+        latest_quarter = np.zeros(len(self.manager_ids), dtype=np.int64)
+        latest_quarter[filed_manager[manager_end]] = filed_quarter[manager_end]
+        manager_offset = np.zeros(len(self.manager_ids), dtype=np.int64)
+        manager_offset[filed_manager[manager_start]] = np.flatnonzero(manager_start)
+
+        # Rows sorted by (manager, position, quarter)
+        rows = np.lexsort((self.quarter, self.key, self.manager))
+        manager, key = self.manager[rows], self.key[rows]
+        shares = self.shares[rows]
+        ordinal = filed_ordinal[np.searchsorted(filed_packed, (manager.astype(np.int64) << _SHIFT) | self.quarter[rows])]
+
+        index = np.arange(len(rows))
+        group_start = np.r_[True, (manager[1:] != manager[:-1]) | (key[1:] != key[:-1])]
+        group = np.cumsum(group_start) - 1
+        run_start = group_start | np.r_[True, ordinal[1:] != ordinal[:-1] + 1]
+        first_row = np.flatnonzero(group_start)
+        last_row = np.r_[first_row[1:] - 1, len(rows) - 1]
+        streak_row = np.maximum.accumulate(np.where(run_start, index, 0))[last_row]
+
+        group_manager = manager[last_row]
+        last_ordinal = ordinal[last_row]
+        held = last_ordinal == latest_ordinal[group_manager]
+        exit_index = manager_offset[group_manager] + np.minimum(last_ordinal + 1, latest_ordinal[group_manager])
+
+        # Shares in the base quarter: look (group, base ordinal) up among the sorted rows
+        base_ordinal = latest_ordinal[group_manager] - quarters
+        packed = (group.astype(np.int64) << _SHIFT) | ordinal
+        wanted = (np.arange(len(first_row), dtype=np.int64) << _SHIFT) | np.maximum(base_ordinal, 0)
+        found = np.minimum(np.searchsorted(packed, wanted), len(rows) - 1)
+        has_base = (base_ordinal >= 0) & (packed[found] == wanted)
+        base_shares = np.where(has_base, shares[found], 0)
+        current = np.where(held, shares[last_row], 0)
+        change = current - base_shares
+        pct = np.zeros(len(first_row), dtype=np.float64)
+        np.divide(change, base_shares, out=pct, where=base_shares != 0)
+        pct_change = np.where(base_shares != 0, round_pct(pct * 100), 0.0)
+
+        base_index = manager_offset[group_manager] + base_ordinal
+        oldest = int(filed_quarter.min())
+        labels = np.asarray([quarter_label(q) for q in range(oldest, int(filed_quarter.max()) + 1)], dtype=object)
+
+        def quarter_of(keys: np.ndarray) -> np.ndarray:
+            return labels[keys - oldest]
+
+        first_rows, last_rows = rows[first_row], rows[last_row]
+        return pd.DataFrame({
+            'manager_id': self.manager_ids[group_manager],
+            'fund_name': self.fund_names[group_manager],
+            'cusip': self.keys.to_numpy(dtype=object)[key[last_row]],
+            'stock_symbol': np.asarray(self.symbols[last_rows], dtype=object),
+            'first_quarter': quarter_of(self.quarter[first_rows]),
+            'entry_quarter': quarter_of(self.quarter[rows[streak_row]]),
+            'exit_quarter': np.where(held, "", quarter_of(filed_quarter[exit_index])),
+            'quarters_held': last_row - first_row + 1,
+            'streak': last_row - streak_row + 1,
+            'latest_quarter': quarter_of(latest_quarter[group_manager]),
+            'shares': current,
+            'base_quarter': np.where(base_ordinal >= 0, quarter_of(filed_quarter[np.maximum(base_index, 0)]), ""),
+            'base_shares': base_shares,
+            'change': change,
+            'pct_change': pct_change,
+        }, columns=HISTORY_COLUMNS)
+
+
+def write_history(checkpoint_data: Dict[str, Any], path: str, quarters: int = 4) -> pd.DataFrame:
+    """Build the history of the checkpoint and save its summary as CSV."""
+    with metrics.timer("scraper_process_seconds", step="history"):
+        history = HoldingsHistory(checkpoint_data)
+        df = history.summary(quarters)
+    output_file = Path(path)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(output_file, index=False)
+    logger.info(f"Holdings history of {len(history)} rows summarized in {output_file}")
+    return df
@@ -0,0 +1,348 @@
+"""
+Inverted index from securities to the managers holding them.
+
+The checkpoint nests holdings under manager -> filing -> holding, so finding
+the holders of one security means reading every manager. HoldingsIndex keeps
+a SQLite table of positions keyed by (filing_id, key), key being the
+checkpoint's holding key (cusip, class and option type), with covering
+indexes on cusip and on symbol, filled in batches by HoldingsIndexPipeline as
+HoldingItems arrive (or rebuilt from a checkpoint), so a holders lookup only
+reads that security's index entries.
+
+Usage:
+    python -m scraper.storage.holdings_index holders 037833100
+    python -m scraper.storage.holdings_index changes AAPL --quarter "Q4 2024"
+    python -m scraper.storage.holdings_index rebuild
+"""
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .. import metrics
+from .processor import parse_int, quarter_key
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS managers (
+    manager_id TEXT PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS filings (
+    filing_id TEXT PRIMARY KEY,
+    manager_id TEXT NOT NULL,
+    quarter TEXT,
+    period INTEGER
+);
+CREATE INDEX IF NOT EXISTS filings_manager_period ON filings (manager_id, period);
+CREATE TABLE IF NOT EXISTS positions (
+    filing_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    symbol TEXT,
+    cusip TEXT,
+    cl TEXT,
+    option TEXT,
+    manager_id TEXT NOT NULL,
+    period INTEGER,
+    shares INTEGER,
+    value INTEGER,
+    PRIMARY KEY (filing_id, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_cusip ON positions (cusip, period, manager_id, shares, value, symbol, cl, option);
+CREATE INDEX IF NOT EXISTS positions_symbol ON positions (symbol, period, manager_id, shares, value, cusip, cl, option);
+"""
+
+HOLDER_COLUMNS = ["manager_id", "name", "quarter", "filing_id", "cusip", "symbol", "cl", "option", "shares", "value"]
+CHANGE_COLUMNS = [
+    "manager_id", "name", "quarter", "cusip", "shares", "prev_shares", "change", "pct_change", "transaction_type",
+]
+
+_HOLDERS = """
+SELECT p.manager_id, m.name, p.period, p.filing_id, p.cusip, p.symbol, p.cl, p.option, p.shares, p.value, p.key
+FROM positions p LEFT JOIN managers m ON m.manager_id = p.manager_id
+WHERE {column} = ? {period}
+ORDER BY p.period DESC, p.filing_id DESC, p.value DESC
+"""
+
+
+def _period_label(period: Optional[int]) -> str:
+    return f"Q{period % 4 + 1} {period // 4}" if period is not None and period >= 0 else ""
+
+
+class HoldingsIndex:
+    """Positions by cusip and symbol, in one SQLite file."""
+
+    def __init__(self, path: str, batch_size: int = 5000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        # Sharded workers write to the same file; wait for each other's batches
+        self.conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Pending rows keyed by primary key, so repeated writes collapse within a batch
+        self.pending: Dict[str, Dict[Any, tuple]] = {"managers": {}, "filings": {}, "positions": {}}
+        self.pending_count = 0
+
+    def _queue(self, table: str, key: Any, row: tuple) -> None:
+        with self.lock:
+            self.pending[table][key] = row
+            self.pending_count += 1
+            if self.pending_count >= self.batch_size:
+                self.flush()
+
+    def add_manager(self, manager_id: str, name: str) -> None:
+        self._queue("managers", manager_id, (manager_id, name))
+
+    def add_filing(self, manager_id: str, filing_id: str, quarter: str) -> None:
+        self._queue("filings", filing_id, (filing_id, manager_id, quarter, quarter_key(quarter)))
+
+    def add_position(self, manager_id: str, filing_id: str, quarter: str, key: str, symbol: str,
+                     cusip: Optional[str], cl: str, option: str, shares: Any, value: Any) -> None:
+        """Index one holding under its checkpoint key."""
+        self._queue("positions", (filing_id, key), (
+            filing_id, key, symbol or None, cusip or None, cl or "", option or "", manager_id, quarter_key(quarter),
+            parse_int(shares), parse_int(value),
+        ))
+
+    def add_positions(self, manager_id: str, filing_id: str, quarter: str, keys: Sequence[str],
+                      symbols: Sequence[str], cusips: Sequence[Optional[str]], classes: Sequence[str],
+                      options: Sequence[str], shares: Sequence[Any], values: Sequence[Any]) -> None:
+        """add_position for the parallel columns of a filing's holdings."""
+        period = quarter_key(quarter)
+        rows = {
+            (filing_id, key): (
+                filing_id, key, symbol or None, cusip or None, cl or "", option or "", manager_id, period,
+                parse_int(count), parse_int(value),
+            )
+            for key, symbol, cusip, cl, option, count, value in zip(
+                keys, symbols, cusips, classes, options, shares, values)
+        }
+        with self.lock:
+            self.pending["positions"].update(rows)
+            self.pending_count += len(rows)
+            if self.pending_count >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.pending_count:
+                return
+            started = time.perf_counter()
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO managers (manager_id, name) VALUES (?, ?) "
+                    "ON CONFLICT (manager_id) DO UPDATE SET name = excluded.name",
+                    self.pending["managers"].values(),
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO filings (filing_id, manager_id, quarter, period) VALUES (?, ?, ?, ?)",
+                    self.pending["filings"].values(),
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO positions "
+                    "(filing_id, key, symbol, cusip, cl, option, manager_id, period, shares, value) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self.pending["positions"].values(),
+                )
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+            for rows in self.pending.values():
+                rows.clear()
+            self.pending_count = 0
+            metrics.observe("scraper_holdings_index_flush_seconds", time.perf_counter() - started)
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+    def add_checkpoint(self, managers: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Index (manager_id, manager) pairs with their filings, e.g. checkpoint_managers(). Returns the positions added."""
+        count = 0
+        for manager_id, manager in managers:
+            self.add_manager(manager_id, manager.get("name", "Unknown"))
+            for filing_id, filing in manager.get("filings", {}).items():
+                quarter = filing.get("quarter", "")
+                self.add_filing(manager_id, filing_id, quarter)
+                for key, holding in filing.get("holdings", {}).items():
+                    # Holdings of checkpoints written before holding_key are keyed by symbol
+                    self.add_position(manager_id, filing_id, quarter, key, holding.get("symbol", key),
+                                      holding.get("cusip"), holding.get("cl"), holding.get("option"),
+                                      holding.get("shares"), holding.get("value"))
+                    count += 1
+        self.flush()
+        return count
+
+    def rebuild(self, managers: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Replace the whole index. The position indexes are dropped while loading and sorted in afterwards."""
+        with self.lock:
+            self.flush()
+            self.conn.executescript(
+                "DROP INDEX IF EXISTS positions_cusip; DROP INDEX IF EXISTS positions_symbol; "
+                "DELETE FROM positions; DELETE FROM filings; DELETE FROM managers;"
+            )
+            try:
+                return self.add_checkpoint(managers)
+            finally:
+                self.conn.executescript(SCHEMA)
+
+    def _lookup(self, security: str, period: Optional[int] = None) -> List[tuple]:
+        """Positions whose cusip, or failing that symbol, is the security, optionally in one quarter."""
+        with self.lock:
+            self.flush()
+            rows: List[tuple] = []
+            for column in ("cusip", "symbol"):
+                if period is None:
+                    rows = self.conn.execute(_HOLDERS.format(column=f"p.{column}", period=""), (security,)).fetchall()
+                else:
+                    rows = self.conn.execute(_HOLDERS.format(column=f"p.{column}", period="AND p.period = ?"),
+                                             (security, period)).fetchall()
+                if rows:
+                    break
+            return rows
+
+    def holders(self, security: str, quarter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Every position in a security, matched by cusip first and by symbol
+        otherwise, most recent quarter and largest value first.
+        """
+        rows = self._lookup(security, quarter_key(quarter) if quarter else None)
+        return [dict(zip(HOLDER_COLUMNS, (m, name, _period_label(p), *rest[:-1]))) for m, name, p, *rest in rows]
+
+    def changes(self, security: str, quarter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        How each holder's position in each cusip matching the security changed
+        from its previous filing to quarter (by default the latest quarter
+        anyone held the security in), largest change first.
+
+        Managers that filed for the quarter without the security but held it
+        in their previous filing are reported as exits.
+        """
+        positions = self._lookup(security)
+        if not positions:
+            return []
+        period = quarter_key(quarter) if quarter else positions[0][2]
+
+        # Shares per (manager, cusip, quarter), summed over classes and options. A position
+        # listed in both an original and an amended filing of the same quarter counts once,
+        # from the later filing id
+        shares_at: Dict[Tuple[str, Optional[str], int], int] = {}
+        names: Dict[str, str] = {}
+        seen = set()
+        for manager_id, name, row_period, _, cusip, _, _, _, shares, _, key in positions:
+            if row_period > period or (manager_id, row_period, key) in seen:
+                continue
+            seen.add((manager_id, row_period, key))
+            names[manager_id] = name
+            shares_at[manager_id, cusip, row_period] = shares_at.get((manager_id, cusip, row_period), 0) + (shares or 0)
+
+        managers = sorted(names)
+        filed = {row[0] for row in self._filings(
+            "SELECT DISTINCT manager_id FROM filings WHERE period = ? AND manager_id IN ({})", period, managers)}
+        previous = dict(self._filings(
+            "SELECT manager_id, MAX(period) FROM filings WHERE period < ? AND manager_id IN ({}) GROUP BY manager_id",
+            period, managers))
+
+        results = []
+        held_securities = sorted({(manager_id, cusip) for manager_id, cusip, _ in shares_at},
+                                 key=lambda pair: (pair[0], pair[1] or ""))
+        for manager_id, cusip in held_securities:
+            held = (manager_id, cusip, period) in shares_at
+            shares = shares_at.get((manager_id, cusip, period), 0)
+            prev_shares = shares_at.get((manager_id, cusip, previous.get(manager_id)), 0)
+            if not held and not (manager_id in filed and prev_shares):
+                continue
+            change = shares - prev_shares
+            if not held:
+                transaction_type = "exit"
+            elif prev_shares == 0:
+                transaction_type = "new"
+            else:
+                transaction_type = "buy" if change > 0 else "sell" if change < 0 else "hold"
+            results.append(dict(zip(CHANGE_COLUMNS, (
+                manager_id, names[manager_id], _period_label(period), cusip, shares, prev_shares, change,
+                round(change / prev_shares * 100, 2) if prev_shares else 0.0, transaction_type,
+            ))))
+        results.sort(key=lambda row: -abs(row["change"]))
+        return results
+
+    def _filings(self, sql: str, period: int, managers: List[str]) -> List[tuple]:
+        """Run a filings query over the managers in chunks that fit SQLite's parameter limit."""
+        rows = []
+        with self.lock:
+            for i in range(0, len(managers), 500):
+                chunk = managers[i:i + 500]
+                rows.extend(self.conn.execute(sql.format(",".join("?" * len(chunk))), (period, *chunk)))
+        return rows
+
+
+def checkpoint_managers(checkpoint, chunk_size: int = 1000) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Every (manager_id, manager) of a checkpoint, filings included, read
+    chunk_size managers at a time. iter_managers() leaves the filings out on
+    the sqlite backend, so it can't feed the index.
+    """
+    for chunk in checkpoint.iter_manager_chunks(chunk_size):
+        yield from chunk.items()
+
+
+def index_from_settings(settings) -> Optional[HoldingsIndex]:
+    """The index at HOLDINGS_INDEX_PATH, or None when it is disabled."""
+    path = settings.get("HOLDINGS_INDEX_PATH")
+    if not path:
+        return None
+    return HoldingsIndex(path, settings.getint("HOLDINGS_INDEX_BATCH_SIZE", 5000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=None, help="index file (default HOLDINGS_INDEX_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("holders", "managers holding a security"),
+                            ("changes", "how the holders' positions changed from the previous quarter")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("security", help="cusip or symbol")
+        command.add_argument("--quarter", default=None, help='e.g. "Q4 2024"')
+        command.add_argument("--csv", action="store_true", help="print CSV instead of a table")
+    commands.add_parser("rebuild", help="index the whole checkpoint at CHECKPOINT_PATH")
+    args = parser.parse_args()
+
+    from scrapy.utils.project import get_project_settings
+    import pandas as pd
+
+    settings = get_project_settings()
+    index = HoldingsIndex(args.path or settings.get("HOLDINGS_INDEX_PATH") or "data/holdings_index.db")
+    if args.command == "rebuild":
+        from .backends import checkpoint_from_settings
+        started = time.perf_counter()
+        count = index.rebuild(checkpoint_managers(checkpoint_from_settings(settings)))
+        print(f"Indexed {count} positions in {time.perf_counter() - started:.1f}s")
+        index.close()
+        return
+
+    started = time.perf_counter()
+    if args.command == "holders":
+        df = pd.DataFrame(index.holders(args.security, args.quarter), columns=HOLDER_COLUMNS)
+    else:
+        df = pd.DataFrame(index.changes(args.security, args.quarter), columns=CHANGE_COLUMNS)
+    elapsed = time.perf_counter() - started
+    index.close()
+    if args.csv:
+        print(df.to_csv(index=False), end="")
+    else:
+        print(df.to_string(index=False) if len(df) else "No positions found")
+        print(f"\n{len(df)} rows in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Single-file HTTP cache storage for Scrapy's HttpCacheMiddleware.
+
+Responses live in one SQLite database keyed by request fingerprint, with
+zlib-compressed bodies, instead of a directory of small files per response.
+The cache is bounded by HTTPCACHE_MAX_SIZE_MB and evicts the least recently
+used entries first; HTTPCACHE_EXPIRATION_RULES gives URL patterns their own
+expiry so listings can go stale while immutable holdings JSON never does.
+"""
+import logging
+import re
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+from scrapy.http import Headers, Request, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    fingerprint BLOB PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers BLOB,
+    body BLOB,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+# Evict down to this fraction of the limit so a full cache does not evict on every store
+EVICT_TO = 0.9
+
+
+def compile_rules(rules: Iterable[Tuple[str, int]]) -> List[Tuple[Pattern, int]]:
+    """Compile (URL regex, expiry seconds) pairs; 0 seconds means never expire."""
+    return [(re.compile(pattern), int(seconds)) for pattern, seconds in rules]
+
+
+class SQLiteCacheStorage:
+    """
+    HTTPCACHE_STORAGE backend keeping every response in HTTPCACHE_DIR/cache.db.
+
+    Lookups and stores are counted in scraper.metrics
+    (scraper_http_cache_requests_total by result) and the hit ratio is logged
+    when the spider closes.
+    """
+
+    def __init__(self, settings):
+        self.path = Path(data_path(settings["HTTPCACHE_DIR"], createdir=True)) / "cache.db"
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.rules = compile_rules(settings.getlist("HTTPCACHE_EXPIRATION_RULES"))
+        self.max_bytes = int(settings.getfloat("HTTPCACHE_MAX_SIZE_MB", 0) * 1024 * 1024)
+        self.compress_level = settings.getint("HTTPCACHE_COMPRESS_LEVEL", 6)
+        self.conn: Optional[sqlite3.Connection] = None
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def open_spider(self, spider):
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        self.spider_name = spider.name
+        self.conn = sqlite3.connect(str(self.path), isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.total_bytes = self._stored_bytes()
+        metrics.set_gauge("scraper_http_cache_bytes", self.total_bytes)
+        logger.debug(f"Using SQLite cache storage in {self.path} ({self.total_bytes} bytes)")
+
+    def close_spider(self, spider):
+        lookups = self.hits + self.misses
+        if lookups:
+            logger.info(f"HTTP cache for {spider.name}: {self.hits} hits, {self.misses} misses "
+                        f"({self.hits / lookups:.1%} hit ratio), {self.total_bytes / 1024 / 1024:.1f} MB stored")
+        self.conn.close()
+        self.conn = None
+
+    def expiry_for(self, url: str) -> int:
+        """Expiry in seconds of the first rule matching the URL, else HTTPCACHE_EXPIRATION_SECS."""
+        for pattern, seconds in self.rules:
+            if pattern.search(url):
+                return seconds
+        return self.expiration_secs
+
+    def retrieve_response(self, spider, request: Request) -> Optional[Response]:
+        """Return the cached response, or None if it is missing or expired."""
+        fingerprint = self.fingerprinter.fingerprint(request)
+        row = self.conn.execute(
+            "SELECT url, status, headers, body, stored_at FROM responses WHERE fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+        if row is None:
+            return self._miss("miss")
+
+        url, status, raw_headers, body, stored_at = row
+        expiry = self.expiry_for(request.url)
+        now = time.time()
+        if 0 < expiry < now - stored_at:
+            return self._miss("expired")
+
+        self.conn.execute("UPDATE responses SET accessed_at = ? WHERE fingerprint = ?", (now, fingerprint))
+        self.hits += 1
+        metrics.inc("scraper_http_cache_requests_total", spider=self.spider_name, result="hit")
+
+        headers = Headers(headers_raw_to_dict(zlib.decompress(raw_headers)))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        request.meta["cache_timestamp"] = stored_at
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request: Request, response: Response):
+        """Store the response compressed, then evict if the cache grew past its limit."""
+        headers = zlib.compress(headers_dict_to_raw(response.headers), self.compress_level)
+        body = zlib.compress(response.body, self.compress_level)
+        size = len(headers) + len(body)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.fingerprinter.fingerprint(request), response.url, response.status, headers, body, size, now, now),
+        )
+        metrics.inc("scraper_http_cache_stored_bytes_total", size, spider=self.spider_name)
+        # Approximate: replaced entries and other processes' writes are
+        # corrected by recounting before anything is evicted
+        self.total_bytes += size
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self.total_bytes = self._stored_bytes()
+            if self.total_bytes > self.max_bytes:
+                self.evict(int(self.max_bytes * EVICT_TO))
+        metrics.set_gauge("scraper_http_cache_bytes", self.total_bytes)
+
+    def evict(self, target_bytes: int) -> int:
+        """Delete least recently used entries until at most target_bytes remain; returns the count."""
+        excess = self.total_bytes - target_bytes
+        victims = []
+        for fingerprint, size in self.conn.execute("SELECT fingerprint, size FROM responses ORDER BY accessed_at"):
+            if excess <= 0:
+                break
+            victims.append((fingerprint,))
+            excess -= size
+        self.conn.execute("BEGIN")
+        self.conn.executemany("DELETE FROM responses WHERE fingerprint = ?", victims)
+        self.conn.execute("COMMIT")
+        self.total_bytes = self._stored_bytes()
+        metrics.inc("scraper_http_cache_evictions_total", len(victims), spider=self.spider_name)
+        logger.info(f"Evicted {len(victims)} cached responses, {self.total_bytes} bytes remain")
+        return len(victims)
+
+    def _miss(self, result: str) -> None:
+        self.misses += 1
+        metrics.inc("scraper_http_cache_requests_total", spider=self.spider_name, result=result)
+        return None
+
+    def _stored_bytes(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
@@ -0,0 +1,247 @@
+"""
+Incremental process_data: recompute only the managers changed since the last run.
+
+The checkpoint's change log (storage/changes.py) lists every manager touched
+by a crawl. The byte offset processed up to is kept in a small state file as
+the watermark, so a run reads only the ids appended since and recomputes
+their rows.
+
+The rows are kept in the quarter-partitioned Parquet dataset, where they carry
+their manager_id and holding_key: a run reads only the changed managers' rows
+and rewrites only the quarter partitions they fall in, so it costs O(changed
+rows) rather than O(total output). Incremental mode writes the dataset even
+when OUTPUT_FORMATS leaves it out. A CSV, if selected too, is read and
+rewritten whole on every run, with a warning; the manager of each of its rows
+is kept in a sidecar file (<output>.managers) so the changed managers' rows
+are replaced where they were.
+
+Every inserted, updated or deleted row, keyed by (manager_id, holding_key), is
+appended to a JSONL change feed. Without a usable watermark or previous
+output everything is processed, as process_data would.
+"""
+import io
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set
+
+import pandas as pd
+
+from .. import metrics
+from .checkpoint_manager import CheckpointManager
+from .parquet_output import delete_quarters, parquet_path_for, read_processed, replace_quarters, write_parquet
+from .processor import KEY_COLUMNS, OUTPUT_COLUMNS, ROW_COLUMNS, compute_rows
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_COLUMNS = {"value_($000)": "int64", "shares": "int64", "change": "int64", "pct_change": "float64"}
+
+
+def as_text(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows as the exact strings the CSV output holds for them."""
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)), dtype=str, keep_default_na=False)
+
+
+def _load_state(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        logger.error(f"Error loading processing state: {e}")
+        return None
+
+
+def _save_state(path: Path, state: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    tmp_path.replace(path)
+
+
+def mark_processed(checkpoint: CheckpointManager, state_path: str, end: int) -> None:
+    """
+    Record that the output reflects the change log up to end, the log's size
+    before the checkpoint was read, and empty the log if nothing was appended
+    since. Full and parallel processing call this too, so the log doesn't grow
+    for ever outside incremental mode.
+    """
+    watermark = 0 if checkpoint.changes.truncate_if_unchanged(end) else end
+    _save_state(Path(state_path), {"watermark": watermark, "updated_at": time.time()})
+
+
+def managers_path_for(output_path: str) -> Path:
+    """Sidecar next to the CSV listing the manager of each of its rows, e.g. data/processed_data.csv.managers."""
+    return Path(f"{output_path}.managers")
+
+
+def _csv_stamp(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_size} {stat.st_mtime_ns}"
+
+
+def _read_csv(output_path: str) -> Optional[pd.DataFrame]:
+    """
+    The CSV as text with the manager_id of each row, or None when it has no
+    sidecar matching it, e.g. after full processing rewrote it.
+    """
+    csv_path, managers_path = Path(output_path), managers_path_for(output_path)
+    if not csv_path.exists() or not managers_path.exists():
+        return None
+    stamp, *managers = managers_path.read_text(encoding="utf-8").split("\n")[:-1]
+    if stamp != _csv_stamp(csv_path):
+        return None
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    if len(df) != len(managers):
+        return None
+    return df.assign(manager_id=managers)
+
+
+def _write_csv(df: pd.DataFrame, output_path: str) -> None:
+    """Write rows to the CSV in OUTPUT_COLUMNS, and their managers to its sidecar."""
+    csv_path, managers_path = Path(output_path), managers_path_for(output_path)
+    df.to_csv(csv_path, index=False, columns=OUTPUT_COLUMNS)
+    tmp_path = managers_path.with_name(managers_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_csv_stamp(csv_path) + "\n")
+        f.writelines(f"{manager_id}\n" for manager_id in df["manager_id"])
+    os.replace(tmp_path, managers_path)
+
+
+def _read_rows(parquet_path: Path, managers: Optional[Set[str]] = None) -> pd.DataFrame:
+    """Rows of the dataset as text, only those of the given managers if any."""
+    if not parquet_path.exists():
+        return pd.DataFrame(columns=ROW_COLUMNS, dtype=str)
+    filters = {} if managers is None else {"manager_id": sorted(managers)}
+    return as_text(read_processed(str(parquet_path), **filters)[ROW_COLUMNS])
+
+
+def change_feed(old: pd.DataFrame, new: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Insert, update and delete records turning the old rows into the new ones.
+
+    Rows are matched on KEY_COLUMNS. A key that repeats (an output that
+    predates the key's uniqueness) is grouped, and its rows are paired in
+    order instead of overwriting one another.
+    """
+    typed_old = old.astype(NUMERIC_COLUMNS) if len(old) else old
+    typed_new = new.astype(NUMERIC_COLUMNS) if len(new) else new
+    old_rows: Dict[tuple, Deque[tuple]] = defaultdict(deque)
+    for (_, row), typed in zip(old.iterrows(), typed_old.to_dict("records")):
+        old_rows[tuple(row[KEY_COLUMNS])].append((row, typed))
+
+    records = []
+    for (_, row), typed in zip(new.iterrows(), typed_new.to_dict("records")):
+        group = old_rows.get(tuple(row[KEY_COLUMNS]))
+        previous = group.popleft() if group else None
+        if previous is None:
+            records.append({"op": "insert", "row": typed})
+        elif not previous[0].equals(row):
+            records.append({"op": "update", "row": typed, "before": previous[1]})
+    records.extend({"op": "delete", "row": typed} for group in old_rows.values() for _, typed in group)
+    return records
+
+
+def _splice(previous: pd.DataFrame, replaced: pd.Series, rows: pd.DataFrame) -> pd.DataFrame:
+    """Put each manager's new rows where its old rows were; managers new to the output go last."""
+    positions = pd.Series(range(len(previous)), index=previous.index)
+    first = positions[replaced].groupby(previous.loc[replaced, "manager_id"]).min()
+    rows = rows.assign(_position=rows["manager_id"].map(first).fillna(len(previous)))
+    kept = previous[~replaced].assign(_position=positions[~replaced])
+    combined = pd.concat([frame for frame in (kept, rows) if len(frame)] or [kept], ignore_index=True)
+    return combined.sort_values("_position", kind="stable").drop(columns="_position").reset_index(drop=True)
+
+
+def process_incremental(checkpoint: CheckpointManager, output_path: str = "data/processed_data.csv",
+                        engine: str = "columnar", formats: Sequence[str] = ("parquet",),
+                        state_path: str = "data/processing_state.json",
+                        feed_path: str = "data/changes.jsonl") -> pd.DataFrame:
+    """
+    Bring the output up to date with the managers changed since the last run.
+
+    Args:
+        checkpoint: Checkpoint whose change log drives the run
+        output_path, engine, formats: As for process_data; the Parquet
+            dataset is written whatever formats says
+        state_path: Where the change log watermark is kept between runs
+        feed_path: JSONL file the change feed is appended to
+
+    Returns:
+        DataFrame with the recomputed rows
+    """
+    if "parquet" not in formats:
+        logger.warning("Incremental processing keeps its rows in the Parquet dataset, writing it as well")
+    if "csv" in formats:
+        logger.warning("Incremental processing reads and rewrites the whole CSV on every run; "
+                       "set OUTPUT_FORMATS=parquet to only touch the changed rows")
+
+    log = checkpoint.changes
+    end = log.size()
+    state = _load_state(Path(state_path))
+    parquet_path = parquet_path_for(output_path)
+    previous_csv = _read_csv(output_path) if "csv" in formats else None
+
+    changed: Optional[Set[str]] = None
+    if (state is not None and parquet_path.exists() and ("csv" not in formats or previous_csv is not None)
+            and state.get("watermark", 0) <= end):
+        changed = log.read(state["watermark"], end)
+
+    if changed is None:
+        logger.info("No processing watermark or previous output, processing every manager")
+        records = checkpoint.get_all()
+        managers = set(records)
+        old_rows = _read_rows(parquet_path)
+    else:
+        # In checkpoint order, so managers new to the output are appended as process_data orders them
+        records = {manager_id: checkpoint[manager_id] for manager_id in checkpoint.manager_ids() if manager_id in changed}
+        managers = changed
+        old_rows = _read_rows(parquet_path, managers)
+        logger.info(f"Processing {len(records)} managers changed since the last run")
+
+    df = compute_rows(records, engine, mode="incremental")
+    rows = as_text(df)
+
+    output_file = Path(output_path)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if "csv" in formats:
+        with metrics.timer("scraper_process_seconds", step="csv", mode="incremental"):
+            if previous_csv is None or changed is None:
+                _write_csv(rows, output_path)
+            else:
+                _write_csv(_splice(previous_csv, previous_csv["manager_id"].isin(managers), rows), output_path)
+        logger.info(f"Processed data updated in {output_file}")
+
+    with metrics.timer("scraper_process_seconds", step="parquet", mode="incremental"):
+        if changed is None:
+            write_parquet(df, str(parquet_path))
+            logger.info(f"Processed data saved to {parquet_path}")
+        else:
+            quarters = set(old_rows["quarter"]) | set(df["quarter"])
+            existing = pd.DataFrame(columns=ROW_COLUMNS)
+            if quarters:
+                existing = read_processed(str(parquet_path), quarter=sorted(quarters))[ROW_COLUMNS]
+            updated = pd.concat([existing[~existing["manager_id"].isin(managers)], df], ignore_index=True)
+            delete_quarters(str(parquet_path), quarters - set(updated["quarter"]))
+            if len(updated):
+                replace_quarters(updated, str(parquet_path))
+            logger.info(f"Processed data updated in {parquet_path} ({len(quarters)} quarters)")
+
+    with metrics.timer("scraper_process_seconds", step="feed", mode="incremental"):
+        feed = change_feed(old_rows, rows)
+        if feed:
+            processed_at = datetime.now(timezone.utc).isoformat()
+            Path(feed_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(feed_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(dict(record, watermark=end, processed_at=processed_at)) + "\n" for record in feed))
+    metrics.inc("scraper_change_feed_records_total", len(feed))
+    logger.info(f"Appended {len(feed)} change records to {feed_path}")
+
+    # Everything up to end is reflected in the output now; an emptied log restarts at 0
+    mark_processed(checkpoint, state_path, end)
+    return df
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .. import metrics
+from .checkpoint_manager import CheckpointManager
+from .compact import plain
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class JournaledCheckpointManager(CheckpointManager):
+    """
+    Checkpoint stored as a JSON snapshot plus an append-only journal.
+
+    Every manager, filing and holding mutation is encoded as one JSON line and
+    handed to a background writer thread, so a save only costs as much as the
+    records added since the previous one. On load the journal is replayed on top
+    of the snapshot. Once it grows past ``compact_threshold`` records it is
+    folded into a new snapshot, while the crawl runs as well as on close, so a
+    long or restarted crawl doesn't replay an ever growing journal.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, compact_threshold: int = 100_000,
+                 compact: bool = False):
+        self.journal_path = Path(f"{path}.journal")
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+        self.journal_records = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        super().__init__(path, compact)
+
+    def _load(self) -> None:
+        """Load the snapshot, then replay the journal on top of it."""
+        super()._load()
+        self.journal_records = 0
+        if not self.journal_path.exists():
+            return
+
+        # Offset just past the last complete line
+        end = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    end += len(line)
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # A torn trailing line is what a crash mid-write leaves behind
+                    logger.warning(f"Ignoring corrupt journal record in {self.journal_path}")
+                    continue
+                self._apply(record)
+                self.journal_records += 1
+
+        if end < self.journal_path.stat().st_size:
+            # Cut the torn line off, or the next record appended would be glued onto it and lost
+            logger.warning(f"Truncating a torn record at the end of {self.journal_path}")
+            with open(self.journal_path, "rb+") as f:
+                f.truncate(end)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "manager":
+            self.data[record["manager_id"]] = self._record(record["value"])
+        elif op == "filing":
+            self._put_filing(record["manager_id"], record["filing_id"], record["value"])
+        elif op == "holding":
+            self._put_holding(record["manager_id"], record["filing_id"], record["holding_id"], record["value"])
+        elif op == "holdings":
+            self._put_holdings(record["manager_id"], record["filing_id"], record["value"])
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        # Encode on the caller's thread so later mutations of ``value`` can't race the writer
+        self._queue.put(json.dumps(record, separators=(",", ":"), default=plain) + "\n")
+        self.journal_records += 1
+        if self.compact_threshold and self.journal_records >= self.compact_threshold:
+            logger.info(f"Compacting checkpoint journal ({self.journal_records} records)")
+            self.compact()
+            return
+        self._ensure_writer()
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="checkpoint-journal", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            while True:
+                try:
+                    line = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                stop = line is _STOP
+                if not stop:
+                    f.write(line)
+                self._queue.task_done()
+
+                # Drain whatever else is pending before paying for a flush
+                while not stop:
+                    try:
+                        line = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    stop = line is _STOP
+                    if not stop:
+                        f.write(line)
+                    self._queue.task_done()
+
+                try:
+                    f.flush()
+                except IOError as e:
+                    logger.error(f"Error flushing checkpoint journal: {e}")
+                if stop:
+                    return
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.data[key] = self._record(value)
+        self.changes.touch(key)
+        self._append({"op": "manager", "manager_id": key, "value": value})
+
+    def add_filing(self, manager_id: str, filing_id: str, record: Dict[str, Any]) -> bool:
+        if not self._put_filing(manager_id, filing_id, record):
+            return False
+        self.changes.touch(manager_id)
+        self._append({"op": "filing", "manager_id": manager_id, "filing_id": filing_id, "value": record})
+        return True
+
+    def add_holding(self, manager_id: str, filing_id: str, holding_id: str, record: Dict[str, Any]) -> bool:
+        if not self._put_holding(manager_id, filing_id, holding_id, record):
+            return False
+        self.changes.touch(manager_id)
+        self._append({
+            "op": "holding",
+            "manager_id": manager_id,
+            "filing_id": filing_id,
+            "holding_id": holding_id,
+            "value": record,
+        })
+        return True
+
+    def add_holdings(self, manager_id: str, filing_id: str, holdings: Dict[str, Dict[str, Any]]) -> bool:
+        """A batch of holdings is one journal record."""
+        if not self._put_holdings(manager_id, filing_id, holdings):
+            return False
+        self.changes.touch(manager_id)
+        self._append({"op": "holdings", "manager_id": manager_id, "filing_id": filing_id, "value": holdings})
+        return True
+
+    def import_managers(self, managers: Dict[str, Any]) -> None:
+        """Store complete manager records straight into a fresh snapshot instead of the journal."""
+        self.data.update((manager_id, self._record(manager)) for manager_id, manager in managers.items())
+        for manager_id in managers:
+            self.changes.touch(manager_id)
+        self.compact()
+        self.changes.flush()
+
+    def save(self) -> None:
+        """Wait until every journaled record has been handed to the OS."""
+        if self._writer is not None and self._writer.is_alive():
+            with metrics.timer("scraper_checkpoint_save_seconds", backend="journal", op="save"):
+                self._queue.join()
+        self.changes.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        if self.journal_path.exists():
+            stats["bytes"] += self.journal_path.stat().st_size
+        stats["journal_records"] = self.journal_records
+        return stats
+
+    def compact(self) -> None:
+        """Write a fresh snapshot and truncate the journal."""
+        self._stop_writer()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with metrics.timer("scraper_checkpoint_save_seconds", backend="journal", op="compact"):
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.data, f, separators=(",", ":"), default=plain)
+                os.replace(tmp_path, self.path)
+            # Replaying the old journal over the new snapshot is idempotent, so a
+            # crash between these two steps loses nothing
+            open(self.journal_path, "w").close()
+            self.journal_records = 0
+        except IOError as e:
+            logger.error(f"Error compacting checkpoint: {e}")
+
+    def close(self) -> None:
+        """Flush the journal, compacting it if it has grown large."""
+        self._stop_writer()
+        if self.compact_threshold and self.journal_records >= self.compact_threshold:
+            logger.info(f"Compacting checkpoint journal ({self.journal_records} records)")
+            self.compact()
+        self.changes.close()
+
+    def release(self) -> None:
+        self._stop_writer()
+        self.changes.close()
+
+    def _stop_writer(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        self._writer = None
@@ -0,0 +1,149 @@
+"""
+Streaming, multi-process variant of process_data.
+
+process_data diffs the whole checkpoint at once and builds every output row
+before writing any. Here the managers are read in chunks
+(CheckpointManager.iter_manager_chunks), diffed in a pool of worker
+processes, and each chunk's rows are appended to the outputs as soon as the
+chunks before it are written. Chunks keep the checkpoint's manager order, so
+the CSV is the same file process_data writes.
+
+Only the chunks in flight (two per worker) and their rows are held at once.
+With the sqlite backend each worker reads its chunk, a range of manager
+rowids, from the database itself, so the checkpoint is never loaded whole and
+nothing but rows crosses between processes. The json and journal backends
+still load the checkpoint, and their chunks are pickled to the workers.
+"""
+import logging
+import os
+import shutil
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .. import metrics
+from .checkpoint_manager import CheckpointManager
+from .processor import OUTPUT_COLUMNS, compute_rows
+
+logger = logging.getLogger(__name__)
+
+# Chunks submitted ahead of the one being written, per worker
+_CHUNKS_PER_WORKER = 2
+
+
+def diff_chunk(chunk: Dict[str, Any], engine: str, csv: bool,
+               frame: bool) -> Tuple[int, Optional[str], Optional[pd.DataFrame]]:
+    """(rows, CSV text without header, rows as a frame) of one chunk of managers; runs in a worker."""
+    df = compute_rows(chunk, engine, mode="parallel")
+    text = df.to_csv(index=False, header=False, columns=OUTPUT_COLUMNS) if csv and len(df) else None
+    return len(df), text, df if frame and len(df) else None
+
+
+def diff_range(path: str, after: int, upto: int, engine: str, csv: bool,
+               frame: bool) -> Tuple[int, Optional[str], Optional[pd.DataFrame]]:
+    """diff_chunk of a manager rowid range, read from the sqlite checkpoint by the worker itself."""
+    from .sqlite_checkpoint import SQLiteCheckpointManager
+
+    checkpoint = SQLiteCheckpointManager(path, read_only=True)
+    try:
+        return diff_chunk(checkpoint.load_manager_range(after, upto), engine, csv, frame)
+    finally:
+        checkpoint.release()
+
+
+class _InProcess:
+    """Executor running each chunk when it is submitted, for a single worker."""
+
+    def submit(self, fn, *args) -> Future:
+        future: Future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        pass
+
+
+def process_parallel(checkpoint: CheckpointManager, output_path: str = "data/processed_data.csv",
+                     engine: str = "columnar", formats: Sequence[str] = ("csv",),
+                     chunk_size: int = 2000, workers: int = 0) -> int:
+    """
+    Process the checkpoint chunk by chunk and stream the rows to the outputs.
+
+    Args:
+        checkpoint: Checkpoint to process
+        output_path: Path to save the processed data
+        engine: Diff engine run on each chunk, as in process_data
+        formats: Outputs to write, as in process_data
+        chunk_size: Managers per chunk
+        workers: Worker processes, 0 for one per CPU; 1 diffs in this process
+
+    Returns:
+        Number of rows written
+    """
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Processing collected data in chunks of {chunk_size} managers with {workers} workers...")
+
+    output_file = Path(output_path)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    csv_file = open(output_file, "w", newline="", encoding="utf-8") if "csv" in formats else None
+    parquet_path = None
+    if "parquet" in formats:
+        from .parquet_output import parquet_path_for
+        parquet_path = parquet_path_for(output_path)
+        # The chunks are appended to an empty dataset, so no quarter of an earlier run survives
+        shutil.rmtree(parquet_path, ignore_errors=True)
+
+    executor = ProcessPoolExecutor(workers) if workers > 1 else _InProcess()
+    pending: Deque[Future] = deque()
+    rows = part = 0
+
+    def write_next() -> None:
+        nonlocal rows, part
+        count, text, df = pending.popleft().result()
+        rows += count
+        if text:
+            csv_file.write(text)
+        if df is not None:
+            _append_parquet(df, parquet_path, part)
+        part += 1
+
+    try:
+        with metrics.timer("scraper_process_seconds", step="parallel", engine=engine):
+            if csv_file is not None:
+                csv_file.write(pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(index=False))
+            for task in _tasks(checkpoint, chunk_size, workers):
+                pending.append(executor.submit(*task, engine, csv_file is not None, parquet_path is not None))
+                if len(pending) >= workers * _CHUNKS_PER_WORKER:
+                    write_next()
+            while pending:
+                write_next()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if csv_file is not None:
+            csv_file.close()
+
+    metrics.inc("scraper_processed_rows_total", rows, mode="parallel")
+    logger.info(f"Processed {rows} rows saved to {output_file if csv_file else parquet_path}")
+    return rows
+
+
+def _tasks(checkpoint: CheckpointManager, chunk_size: int, workers: int) -> Iterator[tuple]:
+    """(function, chunk arguments) per chunk: sqlite ranges are read by the workers, other chunks are sent to them."""
+    if workers > 1 and hasattr(checkpoint, "manager_ranges"):
+        checkpoint.save()
+        for after, upto in checkpoint.manager_ranges(chunk_size):
+            yield diff_range, str(checkpoint.json_path), after, upto
+        return
+    for chunk in checkpoint.iter_manager_chunks(chunk_size):
+        yield diff_chunk, chunk
+
+
+def _append_parquet(df: pd.DataFrame, path: Path, part: int) -> None:
+    """Add a chunk's rows to the dataset."""
+    from .parquet_output import append_parquet
+
+    with metrics.timer("scraper_process_seconds", step="parquet"):
+        append_parquet(df, str(path), part)
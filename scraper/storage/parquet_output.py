@@ -0,0 +1,123 @@
+"""
+Columnar output for process_data: a Parquet dataset partitioned by quarter.
+
+Repeated strings (fund names, symbols, class, transaction type) are
+dictionary encoded and amounts are stored as integers. Rows are sorted by
+transaction type inside each partition so row-group statistics let readers
+skip everything but the rows they ask for.
+"""
+import shutil
+from pathlib import Path
+from typing import Any, Iterable, List, Optional
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+_DICT = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMA = pa.schema([
+    ("fund_name", _DICT),
+    ("filing_date", pa.string()),
+    ("quarter", pa.string()),
+    ("stock_symbol", _DICT),
+    ("cl", _DICT),
+    ("value_($000)", pa.int64()),
+    ("shares", pa.int64()),
+    ("change", pa.int64()),
+    ("pct_change", pa.float64()),
+    ("inferred_transaction_type", _DICT),
+    ("manager_id", _DICT),
+    ("holding_key", pa.string()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("quarter", pa.string())]), flavor="hive")
+
+ROWS_PER_GROUP = 64 * 1024
+
+
+def parquet_path_for(output_path: str) -> Path:
+    """Dataset directory that sits next to the CSV, e.g. data/processed_data/."""
+    return Path(output_path).with_suffix("")
+
+
+def _write(df: pd.DataFrame, path: str, **options: Any) -> None:
+    df = df.sort_values(["quarter", "inferred_transaction_type"], kind="stable")
+    # cl is often missing entirely; keep it a string column either way
+    df = df.assign(cl=df["cl"].fillna("").astype(str))
+    table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+    ds.write_dataset(
+        table,
+        str(path),
+        format="parquet",
+        partitioning=PARTITIONING,
+        max_rows_per_group=ROWS_PER_GROUP,
+        min_rows_per_group=min(ROWS_PER_GROUP, max(len(table), 1)),
+        **options,
+    )
+
+
+def write_parquet(df: pd.DataFrame, path: str) -> None:
+    """
+    Write processed rows as a quarter-partitioned Parquet dataset, replacing
+    the whole dataset: it is written next to the old one and swapped in, so
+    quarters that have left the output don't survive and readers never see a
+    half-written dataset.
+    """
+    target = Path(path)
+    tmp_path = target.with_name(target.name + ".tmp")
+    old_path = target.with_name(target.name + ".old")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    if len(df):
+        _write(df, str(tmp_path), existing_data_behavior="overwrite_or_ignore")
+    shutil.rmtree(old_path, ignore_errors=True)
+    if target.exists():
+        target.rename(old_path)
+    tmp_path.rename(target)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def replace_quarters(df: pd.DataFrame, path: str) -> None:
+    """Write processed rows into the dataset, replacing only the quarters present in df."""
+    _write(df, path, existing_data_behavior="delete_matching")
+
+
+def append_parquet(df: pd.DataFrame, path: str, part: int) -> None:
+    """Add processed rows to the dataset as files named after part, keeping what the partitions already hold."""
+    _write(df, path, existing_data_behavior="overwrite_or_ignore", basename_template=f"part-{part}-{{i}}.parquet")
+
+
+def delete_quarters(path: str, quarters: Iterable[str]) -> None:
+    """Remove the partitions of quarters that no longer have any rows."""
+    for quarter in quarters:
+        shutil.rmtree(Path(path) / f"quarter={quote(quarter, safe='')}", ignore_errors=True)
+
+
+def _filter_expression(filters: dict) -> Optional[pc.Expression]:
+    expression = None
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            condition = pc.field(column).isin(list(value))
+        else:
+            condition = pc.field(column) == value
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_processed(path: str, columns: Optional[List[str]] = None, **filters: Any) -> pd.DataFrame:
+    """
+    Load processed rows, pushing column and row filters down to the dataset.
+
+    Filters on quarter prune whole partitions; the others are evaluated
+    against row-group statistics before any data is decoded.
+
+    Example:
+        read_processed("data/processed_data", columns=["fund_name", "shares"],
+                       quarter="Q4 2024", inferred_transaction_type="buy")
+    """
+    dataset = ds.dataset(str(path), format="parquet", partitioning=PARTITIONING)
+    table = dataset.to_table(columns=columns, filter=_filter_expression(filters))
+    return table.to_pandas()
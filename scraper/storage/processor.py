@@ -1,28 +1,65 @@
 import logging
+import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Sequence
 import pandas as pd
 
+from .. import metrics
+
 logger = logging.getLogger(__name__)
 
+OUTPUT_COLUMNS = [
+    'fund_name', 'filing_date', 'quarter', 'stock_symbol', 'cl',
+    'value_($000)', 'shares', 'change', 'pct_change', 'inferred_transaction_type'
+]
+
+# Identify a row (fund names and symbols are not unique): kept next to
+# OUTPUT_COLUMNS in the computed rows and the Parquet dataset, not in the CSV
+KEY_COLUMNS = ['manager_id', 'holding_key']
+ROW_COLUMNS = OUTPUT_COLUMNS + KEY_COLUMNS
+
+_QUARTER = re.compile(r"^\s*Q([1-4])\s+(\d{4})\s*$")
+
+
 def parse_int(val):
+    # Normalized holdings are ints already (scraper/normalize.py); older checkpoints hold "1,234" text
+    if type(val) is int:
+        return val
     try:
         return int(str(val).replace(',', ''))
     except (TypeError, ValueError):
         return 0
 
 
-def process_data(checkpoint_data: Dict[str, Any], output_path: str = "data/processed_data.csv"):
-    """
-    Process the scraped data to generate useful insights.
-    This function would be called from the DataProcessingPipeline.
+@lru_cache(maxsize=None)
+def quarter_key(quarter: str) -> int:
+    """Sortable index of a "Q4 2024" label (year * 4 + quarter - 1), -1 if it doesn't parse."""
+    match = _QUARTER.match(quarter or "")
+    if not match:
+        return -1
+    return int(match.group(2)) * 4 + int(match.group(1)) - 1
 
-    Args:
-        checkpoint_data: Dictionary of all scraped data
-        output_path: Path to save the processed data
-    """
-    logger.info("Processing collected data...")
 
+def holding_symbol(key: str, holding: Dict[str, Any]) -> str:
+    """A holding's symbol: its own field, or the key of a holding stored before keys were holding_keys."""
+    return holding.get('symbol', key)
+
+
+def keyed_by_symbol(holdings: Dict[str, Any]) -> bool:
+    """Whether a filing's holdings were stored before normalization, keyed by symbol instead of holding_key."""
+    for key in holdings:
+        return 'symbol' not in holdings[key]
+    return False
+
+
+def sort_filings(filings: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A manager's filings, most recent quarter first; filings of the same quarter keep their scraped order."""
+    return sorted(filings.values(), key=lambda filing: quarter_key(filing.get('quarter', '')), reverse=True)
+
+
+def compute_diffs_loop(checkpoint_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Row-by-row latest-vs-previous filing diff, kept as the reference for the columnar engine."""
     processed_data = []
     # Extract data from checkpoint
     for manager_id, manager_data in checkpoint_data.items():
@@ -32,11 +69,18 @@ def process_data(checkpoint_data: Dict[str, Any], output_path: str = "data/proce
         fund_name = manager_data.get('name', 'Unknown')
         filings = manager_data.get("filings", {})
 
-        latest_filing = list(filings.values())[0]
-        prev_filing = list(filings.values())[1] if len(filings) > 1 else None
-        print("prev_filing", prev_filing)
+        ordered = sort_filings(filings)
+        latest_filing = ordered[0]
+        prev_filing = ordered[1] if len(ordered) > 1 else None
+        latest_holdings = latest_filing.get('holdings', {})
+        prev_holdings = prev_filing.get('holdings', {}) if prev_filing else {}
+        # A filing stored before normalization is keyed by symbol: match the two filings on symbols
+        by_symbol = bool(prev_holdings) and keyed_by_symbol(latest_holdings) != keyed_by_symbol(prev_holdings)
+        if by_symbol:
+            prev_holdings = {holding_symbol(key, holding): holding for key, holding in prev_holdings.items()}
         # Process holdings in latest filing
-        for symbol, holding in latest_filing.get('holdings', {}).items():
+        for key, holding in latest_holdings.items():
+            symbol = holding_symbol(key, holding)
             entry = {
                 'fund_name': fund_name,
                 'filing_date': latest_filing.get('filing_date', ''),
@@ -44,14 +88,14 @@ def process_data(checkpoint_data: Dict[str, Any], output_path: str = "data/proce
                 'stock_symbol': symbol,
                 'cl': holding.get('cl', ''),
                 'value_($000)': parse_int(holding.get('value')),
-                'shares': parse_int(holding.get('shares'))
+                'shares': parse_int(holding.get('shares')),
+                'manager_id': manager_id,
+                'holding_key': key
             }
 
             # Find previous holding data if exists
-            prev_shares = 0
-            if prev_filing:
-                prev_holding = prev_filing.get('holdings', {}).get(symbol, {})
-                prev_shares = parse_int(prev_holding.get('shares'))
+            prev_holding = prev_holdings.get(symbol if by_symbol else key, {})
+            prev_shares = parse_int(prev_holding.get('shares'))
 
             # Calculate metrics
             current_shares = entry['shares']
@@ -73,17 +117,58 @@ def process_data(checkpoint_data: Dict[str, Any], output_path: str = "data/proce
                 entry['inferred_transaction_type'] = 'hold'
 
             processed_data.append(entry)
+    return processed_data
+
+
+def compute_rows(checkpoint_data: Dict[str, Any], engine: str = "columnar", mode: str = "full") -> pd.DataFrame:
+    """Output rows for the given managers with the selected engine, in ROW_COLUMNS."""
+    with metrics.timer("scraper_process_seconds", step="diff", engine=engine, mode=mode):
+        if engine == "columnar":
+            from .columnar import compute_diffs
+            df = compute_diffs(checkpoint_data)
+        elif engine == "loop":
+            df = pd.DataFrame(compute_diffs_loop(checkpoint_data), columns=ROW_COLUMNS)
+        else:
+            raise ValueError(f"Unknown processing engine: {engine}")
+    metrics.inc("scraper_processed_rows_total", len(df), mode=mode)
+    return df
+
+
+def process_data(checkpoint_data: Dict[str, Any], output_path: str = "data/processed_data.csv",
+                 engine: str = "columnar", formats: Sequence[str] = ("csv",)) -> pd.DataFrame:
+    """
+    Process the scraped data to generate useful insights.
+    This function would be called from the DataProcessingPipeline.
+
+    Args:
+        checkpoint_data: Dictionary of all scraped data
+        output_path: Path to save the processed data
+        engine: "columnar" to diff all managers in one vectorized join,
+            "loop" for the row-by-row reference implementation
+        formats: Outputs to write: "csv" to output_path and/or "parquet" to a
+            quarter-partitioned dataset next to it (output_path without suffix)
+
+    Returns:
+        DataFrame with the processed rows
+    """
+    logger.info("Processing collected data...")
+
+    df = compute_rows(checkpoint_data, engine)
 
     # Save processed data
-    output_file = Path("data/processed_data.csv")
+    output_file = Path(output_path)
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    df = pd.DataFrame(processed_data)[[
-        'fund_name', 'filing_date', 'quarter', 'stock_symbol', 'cl',
-        'value_($000)', 'shares', 'change', 'pct_change', 'inferred_transaction_type'
-    ]]
+    if "csv" in formats:
+        with metrics.timer("scraper_process_seconds", step="csv"):
+            df.to_csv(output_file, index=False, columns=OUTPUT_COLUMNS)
+        logger.info(f"Processed data saved to {output_file}")
 
-    df.to_csv(output_file, index=False)
+    if "parquet" in formats:
+        from .parquet_output import parquet_path_for, write_parquet
+        parquet_path = parquet_path_for(output_path)
+        with metrics.timer("scraper_process_seconds", step="parquet"):
+            write_parquet(df, parquet_path)
+        logger.info(f"Processed data saved to {parquet_path}")
 
-    logger.info(f"Processed data saved to {output_file}")
-    return processed_data
+    return df
@@ -0,0 +1,70 @@
+import logging
+import os
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class SeenSet:
+    """
+    Persistent set of ids stored as a sorted file with one id per line.
+
+    Lookups bisect the sorted list loaded at startup; ids added during the run
+    are kept aside and merged into the file on save.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.ids: List[str] = []
+        self.new_ids: Set[str] = set()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.ids = [line.rstrip("\n") for line in f if line.strip()]
+        # Files are written sorted, but a hand-edited one shouldn't break lookups
+        if any(a > b for a, b in zip(self.ids, self.ids[1:])):
+            self.ids.sort()
+
+    def __contains__(self, item: str) -> bool:
+        if item in self.new_ids:
+            return True
+        i = bisect_left(self.ids, item)
+        return i < len(self.ids) and self.ids[i] == item
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.new_ids)
+
+    def add(self, item: str) -> None:
+        if item not in self:
+            self.new_ids.add(item)
+
+    def save(self) -> None:
+        """Merge ids added since the last save into the sorted file."""
+        if not self.new_ids:
+            return
+        ids = sorted(self.ids + list(self.new_ids))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{item}\n" for item in ids)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            # Keep the new ids pending, so the next save writes them
+            logger.error(f"Error saving seen set: {e}")
+            return
+        self.ids = ids
+        self.new_ids.clear()
+
+
+def seen_filings_from_settings(settings) -> Optional[SeenSet]:
+    """Open the completed-filings set when incremental mode is on."""
+    if not settings.getbool("INCREMENTAL"):
+        return None
+    return SeenSet(settings.get("SEEN_FILINGS_PATH", "checkpoints/seen_filings.txt"))
@@ -0,0 +1,428 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .. import metrics
+from .changes import ChangeLog
+from .checkpoint_manager import CheckpointManager
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS managers (
+    manager_id TEXT PRIMARY KEY,
+    name TEXT,
+    filing_url TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS filings (
+    filing_id TEXT PRIMARY KEY,
+    manager_id TEXT NOT NULL,
+    quarter TEXT,
+    filing_url TEXT,
+    filing_date TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS filings_manager_id ON filings (manager_id);
+CREATE TABLE IF NOT EXISTS holdings (
+    filing_id TEXT NOT NULL,
+    holding_id TEXT NOT NULL,
+    cusip TEXT,
+    shares,
+    value,
+    extra TEXT,
+    PRIMARY KEY (filing_id, holding_id)
+);
+CREATE INDEX IF NOT EXISTS holdings_cusip ON holdings (cusip);
+"""
+
+MANAGER_FIELDS = ("id", "name", "filing_url", "filings")
+FILING_FIELDS = ("quarter", "filing_url", "filing_date", "filing_id", "holdings")
+HOLDING_FIELDS = ("cusip", "shares", "value")
+
+PAGE_SIZE = 500
+
+
+def _extra(record: Dict[str, Any], known: Tuple[str, ...]) -> Optional[str]:
+    extra = {k: v for k, v in record.items() if k not in known}
+    return json.dumps(extra) if extra else None
+
+
+def _holding_row(filing_id: str, holding_id: str, record: Dict[str, Any]) -> tuple:
+    # A cusip of None (normalized holdings without one) goes in extra, so it reads back unlike a missing cusip
+    known = HOLDING_FIELDS if record.get("cusip") is not None else HOLDING_FIELDS[1:]
+    return (filing_id, holding_id, record.get("cusip"), record.get("shares"), record.get("value"),
+            _extra(record, known))
+
+
+def _with_extra(record: Dict[str, Any], extra: Optional[str]) -> Dict[str, Any]:
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+class _SharedStore:
+    """One connection and one write buffer per database file, shared by every checkpoint in the process."""
+
+    def __init__(self, path: Path, batch_size: int, read_only: bool = False):
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        if read_only:
+            self.conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True,
+                                        isolation_level=None, check_same_thread=False)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+        # Pending rows keyed by primary key, so repeated writes collapse within a batch
+        self.pending: Dict[str, Dict[Any, tuple]] = {"managers": {}, "filings": {}, "holdings": {}}
+        self.pending_count = 0
+
+    def queue(self, table: str, key: Any, row: tuple) -> None:
+        with self.lock:
+            self.pending[table][key] = row
+            self.pending_count += 1
+            if self.pending_count >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.pending_count:
+                return
+            started = time.perf_counter()
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO managers (manager_id, name, filing_url, extra) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (manager_id) DO UPDATE SET "
+                    "name = excluded.name, filing_url = excluded.filing_url, extra = excluded.extra",
+                    self.pending["managers"].values(),
+                )
+                self.conn.executemany(
+                    "INSERT INTO filings (filing_id, manager_id, quarter, filing_url, filing_date, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (filing_id) DO UPDATE SET "
+                    "manager_id = excluded.manager_id, quarter = excluded.quarter, "
+                    "filing_url = excluded.filing_url, filing_date = excluded.filing_date, extra = excluded.extra",
+                    self.pending["filings"].values(),
+                )
+                self.conn.executemany(
+                    "INSERT INTO holdings (filing_id, holding_id, cusip, shares, value, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (filing_id, holding_id) DO UPDATE SET "
+                    "cusip = excluded.cusip, shares = excluded.shares, value = excluded.value, extra = excluded.extra",
+                    self.pending["holdings"].values(),
+                )
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+            for rows in self.pending.values():
+                rows.clear()
+            self.pending_count = 0
+            metrics.observe("scraper_checkpoint_save_seconds", time.perf_counter() - started,
+                            backend="sqlite", op="flush")
+
+    def queue_many(self, table: str, rows: Dict[Any, tuple]) -> None:
+        """queue() for rows keyed by primary key, under one lock."""
+        with self.lock:
+            self.pending[table].update(rows)
+            self.pending_count += len(rows)
+            if self.pending_count >= self.batch_size:
+                self.flush()
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Run a read query after writing out pending rows."""
+        with self.lock:
+            self.flush()
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    def has_manager(self, manager_id: str) -> bool:
+        with self.lock:
+            if manager_id in self.pending["managers"]:
+                return True
+            return self.conn.execute(
+                "SELECT 1 FROM managers WHERE manager_id = ?", (manager_id,)
+            ).fetchone() is not None
+
+    def has_filing(self, manager_id: str, filing_id: str) -> bool:
+        with self.lock:
+            row = self.pending["filings"].get(filing_id)
+            if row is not None:
+                return row[1] == manager_id
+            return self.conn.execute(
+                "SELECT 1 FROM filings WHERE filing_id = ? AND manager_id = ?", (filing_id, manager_id)
+            ).fetchone() is not None
+
+
+_stores: Dict[str, _SharedStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: Path, batch_size: int = 1000) -> _SharedStore:
+    """Return the process-wide store for a database file, opening it on first use."""
+    # Keyed by pid too: a forked process (a processing worker) must not use its parent's connection
+    key = f"{os.getpid()}:{path.resolve()}"
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = _SharedStore(path, batch_size)
+        return store
+
+
+class SQLiteCheckpointManager(CheckpointManager):
+    """
+    Checkpoint stored in normalized SQLite tables.
+
+    All instances pointing at the same file share one connection and one
+    write buffer, so the spiders always see what the pipeline has written.
+    A JSON checkpoint found at the configured path is imported the first
+    time the database is created.
+
+    With read_only the database must exist: it gets its own read-only
+    connection, nothing is created or imported, and release() closes it.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000, read_only: bool = False):
+        self.json_path = Path(path)
+        self.path = self.json_path.with_suffix(".db")
+        self.changes = ChangeLog(f"{path}.changes")
+        self.read_only = read_only
+        self._last_filing: Optional[Tuple[str, str]] = None
+        if read_only:
+            self.store = _SharedStore(self.path, batch_size, read_only=True)
+            return
+        is_new = not self.path.exists()
+        self.store = get_store(self.path, batch_size)
+        if is_new and self.json_path.exists() and self.json_path != self.path:
+            self._import_json()
+
+    def _import_json(self) -> None:
+        logger.info(f"Importing {self.json_path} into {self.path}")
+        self.import_managers(CheckpointManager(str(self.json_path)).data)
+
+    def import_managers(self, managers: Dict[str, Any]) -> None:
+        """Store complete manager records as rows of the three tables, and save."""
+        for manager_id, manager in managers.items():
+            self.add_manager(manager_id, manager)
+            for filing_id, filing in manager.get("filings", {}).items():
+                self.add_filing(manager_id, filing_id, filing)
+                for holding_id, holding in filing.get("holdings", {}).items():
+                    self.add_holding(manager_id, filing_id, holding_id, holding)
+        self.save()
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self.get_all()
+
+    def save(self) -> None:
+        """Write pending rows to the database."""
+        self.store.flush()
+        self.changes.flush()
+
+    def close(self) -> None:
+        self.save()
+        self.changes.close()
+
+    def release(self) -> None:
+        self.changes.close()
+        if self.read_only:
+            self.store.close()
+
+    def add_manager(self, manager_id: str, record: Dict[str, Any]) -> None:
+        self.changes.touch(manager_id)
+        self.store.queue("managers", manager_id, (
+            manager_id, record.get("name"), record.get("filing_url"), _extra(record, MANAGER_FIELDS),
+        ))
+
+    def add_filing(self, manager_id: str, filing_id: str, record: Dict[str, Any]) -> bool:
+        if not self.store.has_manager(manager_id):
+            return False
+        self.changes.touch(manager_id)
+        self.store.queue("filings", filing_id, (
+            filing_id, manager_id, record.get("quarter"), record.get("filing_url"),
+            record.get("filing_date"), _extra(record, FILING_FIELDS),
+        ))
+        return True
+
+    def has_filing(self, manager_id: str, filing_id: str) -> bool:
+        return self.store.has_filing(manager_id, filing_id)
+
+    def add_holding(self, manager_id: str, filing_id: str, holding_id: str, record: Dict[str, Any]) -> bool:
+        # Holdings arrive in runs per filing, so remember the last filing that checked out
+        if self._last_filing != (manager_id, filing_id):
+            if not self.store.has_filing(manager_id, filing_id):
+                return False
+            self._last_filing = (manager_id, filing_id)
+            self.changes.touch(manager_id)
+        self.store.queue("holdings", (filing_id, holding_id), _holding_row(filing_id, holding_id, record))
+        return True
+
+    def add_holdings(self, manager_id: str, filing_id: str, holdings: Dict[str, Dict[str, Any]]) -> bool:
+        if not self.store.has_filing(manager_id, filing_id):
+            return False
+        self._last_filing = (manager_id, filing_id)
+        self.changes.touch(manager_id)
+        self.store.queue_many("holdings", {
+            (filing_id, holding_id): _holding_row(filing_id, holding_id, record)
+            for holding_id, record in holdings.items()
+        })
+        return True
+
+    def manager_ids(self) -> Iterator[str]:
+        for (manager_id,) in self.store.query("SELECT manager_id FROM managers"):
+            yield manager_id
+
+    def iter_managers(self, without_filings: bool = False) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        condition = "AND NOT EXISTS (SELECT 1 FROM filings f WHERE f.manager_id = m.manager_id)" if without_filings else ""
+        last = 0
+        while True:
+            rows = self.store.query(
+                "SELECT m.rowid, m.manager_id, m.name, m.filing_url, m.extra FROM managers m "
+                f"WHERE m.rowid > ? {condition} ORDER BY m.rowid LIMIT ?",
+                (last, PAGE_SIZE),
+            )
+            if not rows:
+                return
+            for rowid, manager_id, name, filing_url, extra in rows:
+                yield manager_id, _with_extra({"id": manager_id, "name": name, "filing_url": filing_url}, extra)
+            last = rows[-1][0]
+
+    def iter_filings(self, without_holdings: bool = False) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        condition = "AND NOT EXISTS (SELECT 1 FROM holdings h WHERE h.filing_id = f.filing_id)" if without_holdings else ""
+        last = 0
+        while True:
+            rows = self.store.query(
+                "SELECT f.rowid, f.manager_id, f.filing_id, f.quarter, f.filing_url, f.filing_date, f.extra "
+                f"FROM filings f WHERE f.rowid > ? {condition} ORDER BY f.rowid LIMIT ?",
+                (last, PAGE_SIZE),
+            )
+            if not rows:
+                return
+            for rowid, manager_id, filing_id, quarter, filing_url, filing_date, extra in rows:
+                yield manager_id, filing_id, _with_extra({
+                    "quarter": quarter,
+                    "filing_url": filing_url,
+                    "filing_date": filing_date,
+                    "filing_id": filing_id,
+                }, extra)
+            last = rows[-1][0]
+
+    def holders(self, cusip: str) -> List[Tuple[str, str, str, Any, Any]]:
+        """Return (manager_id, filing_id, holding_id, shares, value) for every holding of a cusip."""
+        return self.store.query(
+            "SELECT f.manager_id, h.filing_id, h.holding_id, h.shares, h.value "
+            "FROM holdings h JOIN filings f ON f.filing_id = h.filing_id WHERE h.cusip = ?",
+            (cusip,),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts from the tables, without loading any records."""
+        query = self.store.query
+        quarters = {quarter or "": count for quarter, count in query("SELECT quarter, COUNT(*) FROM filings GROUP BY quarter")}
+        return {
+            "path": str(self.path),
+            "bytes": sum(path.stat().st_size for path in (self.path, Path(f"{self.path}-wal")) if path.exists()),
+            "managers": query("SELECT COUNT(*) FROM managers")[0][0],
+            "managers_with_filings": query("SELECT COUNT(DISTINCT manager_id) FROM filings")[0][0],
+            "filings": sum(quarters.values()),
+            "filings_without_holdings": query(
+                "SELECT COUNT(*) FROM filings f WHERE NOT EXISTS (SELECT 1 FROM holdings h WHERE h.filing_id = f.filing_id)"
+            )[0][0],
+            "holdings": query("SELECT COUNT(*) FROM holdings")[0][0],
+            "quarters": quarters,
+        }
+
+    def manager_ranges(self, size: int) -> Iterator[Tuple[int, int]]:
+        """Consecutive (after, upto] manager rowid ranges of up to size managers, in rowid order."""
+        last = 0
+        while True:
+            rows = self.store.query("SELECT rowid FROM managers WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, size))
+            if not rows:
+                return
+            yield last, rows[-1][0]
+            last = rows[-1][0]
+
+    def load_manager_range(self, after: int, upto: int) -> Dict[str, Any]:
+        """The managers of a manager_ranges range, with one query per table."""
+        return self._load_managers(condition="rowid > ? AND rowid <= ?", params=(after, upto))
+
+    def iter_manager_chunks(self, size: int) -> Iterator[Dict[str, Any]]:
+        for after, upto in self.manager_ranges(size):
+            yield self.load_manager_range(after, upto)
+
+    def _load_managers(self, manager_id: Optional[str] = None, condition: Optional[str] = None,
+                       params: tuple = ()) -> Dict[str, Any]:
+        """Managers in the nested JSON layout: one manager, those matching a condition on managers, or all."""
+        if manager_id is not None:
+            condition, params = "manager_id = ?", (manager_id,)
+        if condition is None:
+            where, filing_where = "", ""
+        else:
+            where = f"WHERE {condition}"
+            filing_where = f"WHERE f.manager_id IN (SELECT manager_id FROM managers {where})"
+
+        managers: Dict[str, Any] = {}
+        for manager_id, name, filing_url, extra in self.store.query(
+            f"SELECT manager_id, name, filing_url, extra FROM managers {where} ORDER BY rowid", params
+        ):
+            managers[manager_id] = _with_extra(
+                {"id": manager_id, "name": name, "filing_url": filing_url, "filings": {}}, extra
+            )
+
+        filings: Dict[str, Dict[str, Any]] = {}
+        for manager_id, filing_id, quarter, filing_url, filing_date, extra in self.store.query(
+            "SELECT f.manager_id, f.filing_id, f.quarter, f.filing_url, f.filing_date, f.extra "
+            f"FROM filings f {filing_where} ORDER BY f.rowid", params
+        ):
+            manager = managers.get(manager_id)
+            if manager is None:
+                continue
+            filing = _with_extra({
+                "quarter": quarter,
+                "filing_url": filing_url,
+                "filing_date": filing_date,
+                "filing_id": filing_id,
+                "holdings": {},
+            }, extra)
+            manager["filings"][filing_id] = filing
+            filings[filing_id] = filing
+
+        for filing_id, holding_id, cusip, shares, value, extra in self.store.query(
+            "SELECT h.filing_id, h.holding_id, h.cusip, h.shares, h.value, h.extra FROM holdings h "
+            f"JOIN filings f ON f.filing_id = h.filing_id {filing_where} ORDER BY h.rowid", params
+        ):
+            filing = filings.get(filing_id)
+            if filing is None:
+                continue
+            holding = {"shares": shares, "value": value}
+            if cusip is not None:
+                holding["cusip"] = cusip
+            filing["holdings"][holding_id] = _with_extra(holding, extra)
+        return managers
+
+    def __getitem__(self, key: str) -> Any:
+        return self._load_managers(key).get(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.add_manager(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return self.store.has_manager(key)
+
+    def values(self):
+        return self.get_all().values()
+
+    def get_all(self) -> Dict[str, Any]:
+        """Materialize the whole checkpoint in the nested JSON layout."""
+        return self._load_managers()
@@ -0,0 +1,22 @@
+import pytest
+
+from scraper.storage.columnar import parse_int_column
+from scraper.storage.processor import parse_int
+
+
+@pytest.mark.parametrize("values", [
+    ["1,234", "-5", "+7", "0012"],
+    ["1 2", ""],
+    ["1 2", "3"],
+    [" 8", "9\t"],
+    ["1_000", "2"],
+    ["1.0", "1e3", "inf"],
+    ["N/A", "", None, "-"],
+    ['"5"', "6"],
+    ["12\n3", "4"],
+    ["１２", "3"],
+    [12, 3.5, "4"],
+    [],
+])
+def test_parse_int_column_matches_parse_int(values):
+    assert parse_int_column(values).tolist() == [parse_int(value) for value in values]
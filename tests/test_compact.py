@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from scraper.storage.checkpoint_manager import CheckpointManager
+from scraper.storage.processor import process_data
+
+
+def record(cusip, symbol, shares, value, cl="COM", **fields):
+    return {"shares": shares, "value": value, "cusip": cusip, "symbol": symbol, "issuer": f"{symbol} INC",
+            "cl": cl, "percentage": fields.pop("percentage", 1.5), "principal": "SH", "option": "", **fields}
+
+
+MANAGERS = {
+    "m1": {"id": "m1", "name": "Fund A", "filing_url": "/manager/m1", "filings": {
+        "f1": {"quarter": "Q3 2024", "filing_url": "", "filing_date": "2024-11-14", "holdings": {
+            "037833100|COM": record("037833100", "AAPL", 100, 20),
+            "ACME|COM": record(None, "ACME", 50, 5, percentage=None),
+            # Stored before normalization: text amounts, no cusip
+            "OLD": {"shares": "1,000", "value": "25"},
+        }},
+        "f2": {"quarter": "Q4 2024", "filing_url": "", "filing_date": "2025-02-14", "holdings": {
+            "037833100|COM": record("037833100", "AAPL", 150, 30),
+            "594918104|COM|CALL": record("594918104", "MSFT", 10, 4, option="CALL"),
+            "OLD": {"shares": "900", "value": "N/A"},
+            # Doesn't fit the columns and stays a dict
+            "ODD": {"shares": 1.5, "value": 2, "note": "kept as is"},
+        }},
+    }},
+    "m2": {"id": "m2", "name": "Fund B", "filing_url": "/manager/m2", "filings": {
+        "f3": {"quarter": "Q4 2024", "filing_url": "", "filing_date": "2025-02-10", "holdings": {
+            "037833100|COM": record("037833100", "AAPL", 7, 1),
+        }},
+    }},
+    "m3": {"id": "m3", "name": "Fund C", "filing_url": "/manager/m3", "filings": {}},
+}
+
+
+def load(tmp_path, compact):
+    path = tmp_path / "checkpoint.json"
+    path.write_text(json.dumps(MANAGERS))
+    return CheckpointManager(str(path), compact=compact)
+
+
+@pytest.mark.parametrize("engine", ["columnar", "loop"])
+def test_compact_records_process_like_dicts(tmp_path, engine):
+    plain = process_data(load(tmp_path, False).get_all(), str(tmp_path / "plain.csv"), engine, ["csv"])
+    compact = process_data(load(tmp_path, True).get_all(), str(tmp_path / "compact.csv"), engine, ["csv"])
+
+    assert len(plain) == 5
+    assert (tmp_path / "compact.csv").read_text() == (tmp_path / "plain.csv").read_text()
+    assert compact.equals(plain)
+
+
+def build(path, compact):
+    checkpoint = CheckpointManager(str(path), compact=compact, autosave=0)
+    for manager_id, manager in MANAGERS.items():
+        checkpoint.add_manager(manager_id, {key: value for key, value in manager.items() if key != "filings"})
+        for filing_id, filing in manager["filings"].items():
+            checkpoint.add_filing(manager_id, filing_id, {key: value for key, value in filing.items() if key != "holdings"})
+            checkpoint.add_holdings(manager_id, filing_id, filing["holdings"])
+    checkpoint.save()
+    return checkpoint
+
+
+def test_compact_records_added_one_by_one_save_like_dicts(tmp_path):
+    build(tmp_path / "plain.json", False)
+    build(tmp_path / "compact.json", True)
+
+    assert (tmp_path / "compact.json").read_text() == (tmp_path / "plain.json").read_text()
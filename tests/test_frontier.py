@@ -0,0 +1,62 @@
+import scrapy
+from scrapy.utils.test import get_crawler
+
+from scraper.scheduler import FrontierScheduler
+
+
+class FilingsSpider(scrapy.Spider):
+    name = "filings"
+
+    def parse(self, response):
+        pass
+
+
+def open_scheduler(tmp_path):
+    crawler = get_crawler(FilingsSpider, {
+        "FRONTIER_PATH": str(tmp_path / "frontier.db"),
+        # Commit every change, as if the run had been going for a while
+        "FRONTIER_COMMIT_INTERVAL": 0,
+    })
+    spider = FilingsSpider()
+    scheduler = FrontierScheduler.from_crawler(crawler)
+    scheduler.open(spider)
+    return scheduler, spider
+
+
+def request(spider, name, weight):
+    return scrapy.Request(f"https://site/filing/{name}", callback=spider.parse, meta={"frontier_weight": weight})
+
+
+def test_killed_run_resumes_with_its_in_flight_requests(tmp_path):
+    scheduler, spider = open_scheduler(tmp_path)
+    for name, weight in (("small", 10), ("large", 1000), ("medium", 100)):
+        scheduler.enqueue_request(request(spider, name, weight))
+    assert scheduler.next_request().url == "https://site/filing/large"
+    medium = scheduler.next_request()
+    scheduler.complete(medium)
+    # Killed: large is in flight and never completed, the scheduler is not closed
+
+    resumed, spider = open_scheduler(tmp_path)
+    assert resumed.resumed and len(resumed) == 2 and resumed.frontier.requeued == 1
+    popped = [resumed.next_request(), resumed.next_request()]
+    assert [popped_request.url for popped_request in popped] == ["https://site/filing/large", "https://site/filing/small"]
+    assert popped[0].callback == spider.parse and popped[0].meta["frontier_weight"] == 1000
+    assert resumed.next_request() is None
+    resumed.close("finished")
+
+    finished, _ = open_scheduler(tmp_path)
+    assert not finished.resumed and len(finished) == 0
+    finished.close("finished")
+
+
+def test_requests_queued_twice_while_resuming_collapse(tmp_path):
+    scheduler, spider = open_scheduler(tmp_path)
+    scheduler.enqueue_request(request(spider, "a", 1))
+    scheduler.close("shutdown")
+
+    resumed, spider = open_scheduler(tmp_path)
+    # The dupefilter is off for a resumed run, so the parent page can queue a again
+    assert resumed.enqueue_request(request(spider, "a", 5))
+    assert len(resumed) == 1
+    assert resumed.next_request().meta["frontier_weight"] == 5
+    resumed.close("finished")
@@ -0,0 +1,22 @@
+from scraper.storage.backends import open_checkpoint
+from scraper.storage.holdings_index import HoldingsIndex, checkpoint_managers
+
+
+def test_rebuild_from_sqlite_checkpoint(tmp_path):
+    checkpoint = open_checkpoint(str(tmp_path / "checkpoint.json"), "sqlite")
+    checkpoint.add_manager("m1", {"id": "m1", "name": "Fund A", "filing_url": "https://13f.info/manager/m1"})
+    checkpoint.add_filing("m1", "f1", {"quarter": "Q4 2024", "filing_url": "", "filing_date": "2025-02-14"})
+    checkpoint.add_holding("m1", "f1", "037833100|COM", {
+        "symbol": "AAPL", "cusip": "037833100", "cl": "COM", "shares": 100, "value": 20,
+    })
+    checkpoint.save()
+
+    index = HoldingsIndex(str(tmp_path / "index.db"))
+    assert index.rebuild(checkpoint_managers(checkpoint)) == 1
+    holders = index.holders("037833100")
+    index.close()
+    checkpoint.close()
+
+    assert [(row["manager_id"], row["name"], row["quarter"], row["shares"]) for row in holders] == [
+        ("m1", "Fund A", "Q4 2024", 100),
+    ]
@@ -0,0 +1,73 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from scrapy.http import Request, Response
+from scrapy.settings import Settings
+from scrapy.utils.request import RequestFingerprinter
+
+from scraper.storage import http_cache
+from scraper.storage.http_cache import SQLiteCacheStorage
+
+BODY_BYTES = 4000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(http_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def open_storage(tmp_path, **overrides):
+    settings = Settings({
+        "HTTPCACHE_DIR": str(tmp_path / "httpcache"),
+        "HTTPCACHE_EXPIRATION_SECS": 3600,
+        "HTTPCACHE_EXPIRATION_RULES": [(r"/manager/", 60), (r"/holdings/", 0)],
+        "HTTPCACHE_MAX_SIZE_MB": 0,
+        **overrides,
+    })
+    storage = SQLiteCacheStorage(settings)
+    spider = SimpleNamespace(name="test", crawler=SimpleNamespace(request_fingerprinter=RequestFingerprinter()))
+    storage.open_spider(spider)
+    return storage, spider
+
+
+def store(storage, spider, url):
+    # Random bytes don't compress, so every entry takes about BODY_BYTES
+    storage.store_response(spider, Request(url), Response(url, body=os.urandom(BODY_BYTES)))
+
+
+def cached(storage, spider, url):
+    return storage.retrieve_response(spider, Request(url)) is not None
+
+
+def test_expiry_follows_the_first_matching_rule(tmp_path, clock):
+    storage, spider = open_storage(tmp_path)
+    urls = ["https://site/manager/1.html", "https://site/holdings/1.json", "https://site/managers/a.html"]
+    for url in urls:
+        store(storage, spider, url)
+
+    clock[0] += 61
+    assert [cached(storage, spider, url) for url in urls] == [False, True, True]
+
+    clock[0] += 3600
+    assert [cached(storage, spider, url) for url in urls] == [False, True, False]
+    assert (storage.hits, storage.misses) == (3, 3)
+    storage.close_spider(spider)
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, clock):
+    storage, spider = open_storage(tmp_path, HTTPCACHE_MAX_SIZE_MB=(3.5 * BODY_BYTES) / 1024 / 1024)
+    for url in ("https://site/a", "https://site/b", "https://site/c"):
+        store(storage, spider, url)
+        clock[0] += 1
+    # Reading a makes b the least recently used
+    assert cached(storage, spider, "https://site/a")
+    clock[0] += 1
+
+    store(storage, spider, "https://site/d")
+
+    assert [cached(storage, spider, f"https://site/{name}") for name in "abcd"] == [True, False, True, True]
+    assert storage.total_bytes <= storage.max_bytes
+    storage.close_spider(spider)
@@ -0,0 +1,137 @@
+import json
+
+import pandas as pd
+import pytest
+
+from scraper.storage.backends import open_checkpoint
+from scraper.storage.incremental import change_feed, process_incremental
+from scraper.storage.processor import OUTPUT_COLUMNS, process_data
+
+
+def holding(cusip, symbol, shares, cl="COM"):
+    return f"{cusip}|{cl}", {"symbol": symbol, "cusip": cusip, "cl": cl, "shares": shares, "value": shares // 10}
+
+
+def filing(quarter, *holdings):
+    return {"quarter": quarter, "filing_url": "", "filing_date": "2025-02-14", "holdings": dict(holdings)}
+
+
+def add_manager(checkpoint, manager_id, name, *filings):
+    checkpoint.add_manager(manager_id, {"id": manager_id, "name": name, "filing_url": ""})
+    for number, record in enumerate(filings):
+        filing_id = f"{manager_id}-{number}"
+        checkpoint.add_filing(manager_id, filing_id, {key: value for key, value in record.items() if key != "holdings"})
+        checkpoint.add_holdings(manager_id, filing_id, record["holdings"])
+    checkpoint.save()
+
+
+def read_feed(path):
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def run(checkpoint, tmp_path, engine, formats):
+    return process_incremental(checkpoint, str(tmp_path / "out.csv"), engine, formats,
+                               str(tmp_path / "state.json"), str(tmp_path / "feed.jsonl"))
+
+
+@pytest.mark.parametrize("engine", ["columnar", "loop"])
+@pytest.mark.parametrize("formats", [("csv",), ("parquet",)])
+def test_managers_sharing_a_name_are_kept_apart(tmp_path, engine, formats):
+    checkpoint = open_checkpoint(str(tmp_path / "checkpoint.json"))
+    add_manager(checkpoint, "m1", "Capital LLC", filing("Q4 2024", holding("037833100", "AAPL", 100)))
+    add_manager(checkpoint, "m2", "Capital LLC", filing("Q4 2024", holding("037833100", "AAPL", 500)))
+    run(checkpoint, tmp_path, engine, formats)
+    feed_path = tmp_path / "feed.jsonl"
+    assert [(r["op"], r["row"]["manager_id"]) for r in read_feed(feed_path)] == [("insert", "m1"), ("insert", "m2")]
+    feed_path.unlink()
+
+    # Only m2 changes; m1 holds the same key under the same fund name
+    add_manager(checkpoint, "m2", "Capital LLC", filing("Q4 2024", holding("037833100", "AAPL", 500)),
+                filing("Q1 2025", holding("037833100", "AAPL", 700)))
+    run(checkpoint, tmp_path, engine, formats)
+
+    feed = read_feed(feed_path)
+    assert [(r["op"], r["row"]["manager_id"], r["row"]["shares"]) for r in feed] == [("update", "m2", 700)]
+    assert (feed[0]["before"]["manager_id"], feed[0]["before"]["shares"]) == ("m2", 500)
+
+    expected = process_data(checkpoint.get_all(), str(tmp_path / "full.csv"), engine, ["csv"])
+    if "csv" in formats:
+        assert (tmp_path / "out.csv").read_text() == (tmp_path / "full.csv").read_text()
+    else:
+        from scraper.storage.parquet_output import read_processed
+        output = read_processed(str(tmp_path / "out"))[list(expected.columns)].astype({"manager_id": str})
+        pd.testing.assert_frame_equal(
+            output.sort_values("manager_id", ignore_index=True),
+            expected.sort_values("manager_id", ignore_index=True),
+            check_dtype=False, check_categorical=False,
+        )
+
+
+def test_cusip_filed_under_two_symbols_is_one_position(tmp_path):
+    checkpoint = open_checkpoint(str(tmp_path / "checkpoint.json"))
+    add_manager(checkpoint, "m1", "Capital LLC", filing("Q4 2024", holding("30303M102", "FB", 100)))
+    add_manager(checkpoint, "m2", "Capital LLC", filing("Q4 2024", holding("30303M102", "META", 100)))
+    run(checkpoint, tmp_path, "columnar", ("csv",))
+    feed_path = tmp_path / "feed.jsonl"
+    feed_path.unlink()
+
+    # m1's next filing lists the same cusip under its new symbol
+    add_manager(checkpoint, "m1", "Capital LLC", filing("Q4 2024", holding("30303M102", "FB", 100)),
+                filing("Q1 2025", holding("30303M102", "META", 150)))
+    run(checkpoint, tmp_path, "columnar", ("csv",))
+
+    (record,) = read_feed(feed_path)
+    assert record["op"] == "update"
+    assert (record["row"]["manager_id"], record["row"]["holding_key"]) == ("m1", "30303M102|COM")
+    assert (record["before"]["stock_symbol"], record["row"]["stock_symbol"]) == ("FB", "META")
+    assert (record["before"]["shares"], record["row"]["shares"]) == (100, 150)
+
+
+def test_repeated_keys_are_paired_in_order():
+    columns = ["manager_id", "holding_key", "fund_name", "value_($000)", "shares", "change", "pct_change"]
+    old = pd.DataFrame([["m1", "k", "A", "1", "10", "0", "0.0"], ["m1", "k", "A", "2", "20", "0", "0.0"]],
+                       columns=columns)
+    new = pd.DataFrame([["m1", "k", "A", "1", "10", "0", "0.0"], ["m1", "k", "A", "3", "30", "0", "0.0"],
+                        ["m1", "k", "A", "4", "40", "0", "0.0"]], columns=columns)
+
+    feed = change_feed(old, new)
+
+    assert [(r["op"], r["row"]["shares"], r.get("before", {}).get("shares")) for r in feed] == [
+        ("update", 30, 20), ("insert", 40, None),
+    ]
+
+
+def test_csv_keeps_its_columns_and_is_spliced_through_the_sidecar(tmp_path):
+    checkpoint = open_checkpoint(str(tmp_path / "checkpoint.json"))
+    add_manager(checkpoint, "m1", "Capital LLC", filing("Q4 2024", holding("037833100", "AAPL", 100)))
+    add_manager(checkpoint, "m2", "Other LLC", filing("Q4 2024", holding("037833100", "AAPL", 500)))
+    run(checkpoint, tmp_path, "columnar", ("csv",))
+
+    assert list(pd.read_csv(tmp_path / "out.csv", nrows=0).columns) == OUTPUT_COLUMNS
+    assert (tmp_path / "out").exists()
+    assert (tmp_path / "out.csv.managers").read_text().splitlines()[1:] == ["m1", "m2"]
+
+    feed_path = tmp_path / "feed.jsonl"
+    feed_path.unlink()
+    add_manager(checkpoint, "m1", "Capital LLC", filing("Q4 2024", holding("037833100", "AAPL", 100)),
+                filing("Q1 2025", holding("037833100", "AAPL", 300)))
+    run(checkpoint, tmp_path, "columnar", ("csv",))
+
+    assert [(r["op"], r["row"]["manager_id"]) for r in read_feed(feed_path)] == [("update", "m1")]
+    process_data(checkpoint.get_all(), str(tmp_path / "full.csv"), "columnar", ["csv"])
+    assert (tmp_path / "out.csv").read_text() == (tmp_path / "full.csv").read_text()
+
+
+def test_csv_changed_behind_the_sidecar_is_rewritten(tmp_path):
+    checkpoint = open_checkpoint(str(tmp_path / "checkpoint.json"))
+    add_manager(checkpoint, "m1", "Capital LLC", filing("Q4 2024", holding("037833100", "AAPL", 100)))
+    run(checkpoint, tmp_path, "columnar", ("csv",))
+    (tmp_path / "out.csv").write_text(",".join(OUTPUT_COLUMNS) + "\n")
+
+    add_manager(checkpoint, "m2", "Other LLC", filing("Q4 2024", holding("037833100", "AAPL", 500)))
+    run(checkpoint, tmp_path, "columnar", ("csv",))
+
+    process_data(checkpoint.get_all(), str(tmp_path / "full.csv"), "columnar", ["csv"])
+    assert (tmp_path / "out.csv").read_text() == (tmp_path / "full.csv").read_text()
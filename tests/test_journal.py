@@ -0,0 +1,44 @@
+from scraper.storage.journal import JournaledCheckpointManager
+
+
+def open_journal(tmp_path, **options):
+    return JournaledCheckpointManager(str(tmp_path / "checkpoint.json"), flush_interval=0.01, **options)
+
+
+def test_record_after_a_torn_line_survives_reload(tmp_path):
+    checkpoint = open_journal(tmp_path)
+    checkpoint.add_manager("m1", {"id": "m1", "name": "Fund A"})
+    checkpoint.add_filing("m1", "f1", {"quarter": "Q4 2024"})
+    checkpoint.close()
+    # What a crash in the middle of a write leaves behind
+    with open(checkpoint.journal_path, "a") as f:
+        f.write('{"op":"holding","manager_id":"m1","filing_id":"f1","hold')
+
+    checkpoint = open_journal(tmp_path)
+    checkpoint.add_manager("m2", {"id": "m2", "name": "Fund B"})
+    checkpoint.save()
+    checkpoint.close()
+
+    reloaded = open_journal(tmp_path)
+    assert "m2" in reloaded
+    assert list(reloaded["m1"]["filings"]) == ["f1"]
+    reloaded.close()
+
+
+def test_journal_is_compacted_while_records_are_added(tmp_path):
+    checkpoint = open_journal(tmp_path, compact_threshold=10)
+    checkpoint.add_manager("m1", {"id": "m1", "name": "Fund A"})
+    checkpoint.add_filing("m1", "f1", {"quarter": "Q4 2024"})
+    for number in range(25):
+        checkpoint.add_holding("m1", "f1", f"h{number}", {"shares": number})
+    checkpoint.save()
+
+    # Two compactions so far; the snapshot holds everything they covered
+    assert checkpoint.journal_records == 7
+    assert checkpoint.path.exists()
+    assert len(checkpoint.journal_path.read_text().splitlines()) == 7
+
+    # Simulate a crash: no close, just reopen
+    reloaded = open_journal(tmp_path, compact_threshold=10)
+    assert len(reloaded["m1"]["filings"]["f1"]["holdings"]) == 25
+    assert reloaded.journal_records == 7
@@ -0,0 +1,79 @@
+import json
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from scraper.main import ModuleSettings, process, stats
+from scraper.storage.backends import checkpoint_from_settings
+from scraper.storage.sqlite_checkpoint import SQLiteCheckpointManager
+
+ROOT = Path(__file__).resolve().parents[1]
+
+PROCESS = """
+import json, sys
+from scraper.main import ModuleSettings, process
+process(ModuleSettings(json.loads(sys.argv[1])))
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules} & {"scrapy", "twisted"})))
+"""
+
+
+MANAGERS = {"m1": {"id": "m1", "name": "Fund A", "filings": {"f1": {
+    "quarter": "Q4 2024", "filing_date": "2025-02-14",
+    "holdings": {"037833100|COM": {"symbol": "AAPL", "cusip": "037833100", "cl": "COM", "shares": 10, "value": 2}},
+}}}}
+
+
+def settings_for(tmp_path, backend="json"):
+    checkpoint = tmp_path / "checkpoint.json"
+    if not checkpoint.exists():
+        checkpoint.write_text(json.dumps(MANAGERS))
+    return {
+        "CHECKPOINT_PATH": str(checkpoint),
+        "CHECKPOINT_BACKEND": backend,
+        "OUTPUT_PATH": str(tmp_path / "processed.csv"),
+        "OUTPUT_FORMATS": ["csv"],
+        "PROCESSING_MODE": "full",
+        "PROCESSING_STATE_PATH": str(tmp_path / "state.json"),
+        "RUN_SUMMARY_PATH": str(tmp_path / "runs.jsonl"),
+        "HISTORY_PATH": "",
+        "METRICS_ENABLED": False,
+    }
+
+
+def test_process_runs_without_importing_scrapy(tmp_path):
+    overrides = settings_for(tmp_path)
+
+    result = subprocess.run([sys.executable, "-c", PROCESS, json.dumps(overrides)], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+    assert json.loads((tmp_path / "runs.jsonl").read_text())["stage"] == "process"
+
+
+def test_stats_and_process_do_not_create_the_sqlite_checkpoint(tmp_path):
+    settings = ModuleSettings(settings_for(tmp_path, "sqlite"))
+
+    assert stats(settings, as_json=True)["managers"] == 1
+    process(settings)
+
+    assert not (tmp_path / "checkpoint.db").exists()
+    assert len((tmp_path / "processed.csv").read_text().splitlines()) == 2
+
+
+def test_read_only_sqlite_checkpoint_is_not_written_and_released(tmp_path):
+    settings = ModuleSettings(settings_for(tmp_path, "sqlite"))
+    writer = SQLiteCheckpointManager(settings.get("CHECKPOINT_PATH"))
+    writer.close()
+    (tmp_path / "checkpoint.json").unlink()
+
+    checkpoint = checkpoint_from_settings(settings, read_only=True)
+    assert list(checkpoint.manager_ids()) == ["m1"]
+    checkpoint.add_manager("m2", {"id": "m2", "name": "Fund B"})
+    with pytest.raises(sqlite3.OperationalError):
+        checkpoint.save()
+    checkpoint.release()
+    with pytest.raises(sqlite3.ProgrammingError):
+        checkpoint.store.conn.execute("SELECT 1")
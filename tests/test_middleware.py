@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request
+from scrapy.utils.test import get_crawler
+# Held requests wait on a Deferred, which Scrapy only hands out once a reactor is installed; none is run
+from twisted.internet import reactor  # noqa: F401
+from twisted.internet.defer import Deferred
+
+from scraper.middleware import AdaptiveConcurrencyMiddleware
+
+
+def open_middleware():
+    crawler = get_crawler(settings_dict={
+        "ADAPTIVE_CONCURRENCY": True,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 1,
+        "ADAPTIVE_MIN_CONCURRENCY": 1,
+    })
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(get_slot_key=lambda request: "13f.info", slots={}))
+    return AdaptiveConcurrencyMiddleware.from_crawler(crawler)
+
+
+def test_ignored_request_frees_its_place_without_counting_a_failure():
+    middleware = open_middleware()
+    first = Request("https://13f.info/manager/0001-fund-a")
+    second = Request("https://13f.info/manager/0002-fund-b")
+
+    sent = Deferred.fromCoroutine(middleware.process_request(first, None))
+    # The host allows one request at a time, so the second one is held
+    held = Deferred.fromCoroutine(middleware.process_request(second, None))
+    assert sent.called and not held.called
+
+    middleware.process_exception(first, IgnoreRequest("Not modified"), None)
+
+    state = middleware.hosts["13f.info"]
+    assert held.called
+    assert (state.in_flight, state.slot_in_flight["13f.info"]) == (1, 1)
+    assert (state.consecutive_failures, state.errors, state.responses) == (0, 0, 0)
+
+    middleware.process_exception(second, TimeoutError(), None)
+
+    assert (state.in_flight, state.slot_in_flight["13f.info"]) == (0, 0)
+    assert (state.consecutive_failures, state.errors, state.responses) == (1, 1, 1)
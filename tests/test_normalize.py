@@ -0,0 +1,35 @@
+from scraper.items import HoldingsBatchItem
+from scraper.normalize import holding_records, normalize_batch
+
+
+def batch(*rows):
+    item = HoldingsBatchItem(manager_id="m1", filing_id="f1", quarter="Q4 2024", filing_date="2025-02-14")
+    columns = ("symbol", "issuer", "cl", "cusip", "value", "percentage", "shares", "principal", "option")
+    for index, column in enumerate(columns):
+        item[column] = [row[index] for row in rows]
+    return item
+
+
+def test_rows_sharing_a_key_are_summed():
+    item = normalize_batch(batch(
+        ["AAPL", "APPLE INC", "COM", "037833100", "1,000", "1.5", "5,000", "SH", ""],
+        ["MSFT", "MICROSOFT", "COM", "594918104", "400", "0.5", "900", "SH", ""],
+        ["AAPL", "APPLE INC", "COM", "037833100", "200", "0.25", "1,000", "SH", ""],
+    ))
+
+    records = holding_records(item)
+    assert list(records) == ["037833100|COM", "594918104|COM"]
+    assert (records["037833100|COM"]["shares"], records["037833100|COM"]["value"]) == (6000, 1200)
+    assert records["037833100|COM"]["percentage"] == 1.75
+    assert item.row_count() == 2
+
+
+def test_principal_amounts_are_kept_apart_from_shares():
+    item = normalize_batch(batch(
+        ["T", "AT&T INC", "COM", "00206R102", "300", "", "10,000", "SH", ""],
+        ["T", "AT&T INC", "COM", "00206R102", "500", "", "500,000", "PRN", ""],
+        ["T", "AT&T INC", "COM", "00206R102", "20", "", "1,000", "SH", "PUT"],
+    ))
+
+    assert item["key"] == ["00206R102|COM", "00206R102|COM|PRN", "00206R102|COM|PUT"]
+    assert item["shares"] == [10000, 500000, 1000]
@@ -0,0 +1,49 @@
+from parsel import Selector
+
+from scraper.parsers import filing_rows, manager_links
+
+LISTING = """
+<table>
+  <tr><td><a href="/manager/0001-fund-a"><b>Fund</b> A</a></td></tr>
+  <tr><td><a href="https://13f.info/manager/0002-fund-b"><!-- old name -->Fund <span>B</span></a></td></tr>
+</table>
+"""
+
+FILINGS = """
+<table id="managerFilings"><tbody>
+  <tr>
+    <td><a href="/13f/000001-fund-a-q4-2024"><span>Q4</span> 2024</a></td>
+    <td><b>1,234</b></td>
+    <td>56,789 <i>k</i></td>
+    <td><a href="/data/aapl">AAPL</a>, MSFT</td>
+    <td><!-- form -->13F-HR</td>
+    <td>2025-02-14</td>
+    <td><span>000001</span></td>
+  </tr>
+</tbody></table>
+"""
+
+
+def test_manager_links_match_css_selectors_with_nested_markup():
+    selector = Selector(text=LISTING)
+    expected = []
+    for link in selector.css("table a[href*='/manager/']"):
+        href = link.attrib["href"]
+        expected.append((href.rstrip("/").split("/")[-1].split("-")[0], link.css("::text").get("").strip(), href))
+
+    assert manager_links(selector.root) == expected
+    assert [name for _, name, _ in expected] == ["Fund", "Fund"]
+
+
+def test_filing_rows_match_css_selectors_with_nested_markup():
+    selector = Selector(text=FILINGS)
+    cells = selector.css("#managerFilings tbody tr")[0].css("td")
+    quarter_link = cells[0].css("a")
+
+    (row,) = filing_rows(selector.root)
+    assert row.quarter == quarter_link.css("::text").get("").strip() == "Q4"
+    assert row.filing_url == quarter_link.attrib.get("href", "")
+    assert [row.holdings, row.value, row.top_holdings, row.form_type, row.filing_date, row.filing_id] == [
+        cells[i].css("::text").get("").strip() for i in range(1, 7)
+    ]
+    assert (row.holdings, row.value, row.form_type, row.filing_id) == ("1,234", "56,789", "13F-HR", "000001")
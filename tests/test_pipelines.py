@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+from pymongo import UpdateOne
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+from scraper.items import HoldingItem, ManagerItem
+from scraper.pipelines import MongoPipeline
+
+
+class FakeCollection:
+    def __init__(self):
+        self.writes = []
+
+    def bulk_write(self, operations, ordered=True):
+        assert not ordered
+        self.writes.append(list(operations))
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+def open_pipeline(batch_size=2, max_pending_batches=1):
+    pipeline = MongoPipeline("mongodb://unused", "13f", batch_size=batch_size,
+                             max_pending_batches=max_pending_batches,
+                             stats=MemoryStatsCollector(get_crawler()))
+    pipeline.db = FakeDatabase()
+    # The writer thread hands results back through the reactor; run them in place
+    pipeline.reactor = SimpleNamespace(callFromThread=lambda function, *args: function(*args))
+    return pipeline
+
+
+def manager(manager_id, name):
+    return ManagerItem(id=manager_id, name=name, link=f"/manager/{manager_id}")
+
+
+def holding(filing_id, shares):
+    return HoldingItem(manager_id="m1", filing_id=filing_id, quarter="Q4 2024", symbol="AAPL", issuer="APPLE INC",
+                       cl="COM", cusip="037833100", value="1,000", percentage="1.5", shares=shares,
+                       principal="SH", option="")
+
+
+def drain(pipeline):
+    pipeline.batches.put(None)
+    pipeline._write_batches()
+
+
+def test_writes_are_batched_and_repeated_keys_collapse():
+    pipeline = open_pipeline(batch_size=3, max_pending_batches=4)
+    items = [manager("m1", "Old name"), manager("m1", "New name"), holding("f1", "100"), holding("f1", "150")]
+
+    assert [pipeline.process_item(item, None) for item in items] == items
+    # Two upserts of the same key stay one buffered write until a third key arrives
+    assert len(pipeline.buffer) == 2 and pipeline.pending_batches == 0
+
+    pipeline.process_item(holding("f2", "10"), None)
+    drain(pipeline)
+
+    assert pipeline.db["managers"].writes == [[UpdateOne(
+        {"_id": "m1"}, {"$set": {"name": "New name", "filing_url": "/manager/m1"}}, upsert=True,
+    )]]
+    (holdings,) = pipeline.db["holdings"].writes
+    assert [(operation._filter["filing_id"], operation._doc["$set"]["shares"]) for operation in holdings] == [
+        ("f1", 150), ("f2", 10),
+    ]
+    assert not pipeline.buffer and pipeline.pending_batches == 0
+    assert pipeline.stats.get_value("mongo/batches") == 1
+
+
+def test_scraper_waits_while_the_writer_is_behind():
+    pipeline = open_pipeline(batch_size=1, max_pending_batches=1)
+    fired = []
+
+    first = pipeline.process_item(manager("m1", "A"), None)
+    waiting = pipeline.process_item(manager("m2", "B"), None)
+    waiting.addCallback(fired.append)
+
+    assert first["id"] == "m1"
+    assert pipeline.pending_batches == 2 and not fired
+    assert pipeline.stats.get_value("mongo/backpressure_waits") == 1
+
+    drain(pipeline)
+
+    assert [item["id"] for item in fired] == ["m2"]
+    assert pipeline.pending_batches == 0
+    assert [write[0]._filter for write in pipeline.db["managers"].writes] == [{"_id": "m1"}, {"_id": "m2"}]
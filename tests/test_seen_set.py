@@ -0,0 +1,21 @@
+from scraper.storage.seen_set import SeenSet
+
+
+def test_ids_added_before_a_failed_save_are_written_by_the_next(tmp_path):
+    path = tmp_path / "seen.txt"
+    seen = SeenSet(str(path))
+    seen.add("b")
+    seen.save()
+    seen.add("a")
+
+    # A directory in the way of the temporary file makes the write fail
+    blocker = tmp_path / "seen.txt.tmp"
+    blocker.mkdir()
+    seen.save()
+    assert path.read_text() == "b\n"
+    assert "a" in seen and len(seen) == 2
+
+    blocker.rmdir()
+    seen.save()
+    assert path.read_text() == "a\nb\n"
+    assert SeenSet(str(path)).ids == ["a", "b"]
@@ -0,0 +1,47 @@
+import json
+
+from scraper.storage.backends import open_checkpoint
+from scraper.storage.sqlite_checkpoint import SQLiteCheckpointManager
+
+MANAGERS = {
+    "m1": {"id": "m1", "name": "Fund A", "filing_url": "/manager/m1", "cik": "0001", "filings": {
+        "f1": {"quarter": "Q4 2024", "filing_url": "/filing/f1", "filing_date": "2025-02-14", "filing_id": "f1",
+               "form": "13F-HR", "holdings": {
+                   "037833100|COM": {"symbol": "AAPL", "cusip": "037833100", "cl": "COM", "shares": 10, "value": 2},
+                   "ACME|COM": {"symbol": "ACME", "cusip": None, "cl": "COM", "shares": 5, "value": 1},
+                   # Written before holdings carried a cusip
+                   "OLD": {"shares": "1,000", "value": "25"},
+               }},
+    }},
+    "m2": {"id": "m2", "name": "Fund B", "filing_url": "/manager/m2", "filings": {}},
+}
+
+
+def test_records_read_back_as_written(tmp_path):
+    checkpoint = SQLiteCheckpointManager(str(tmp_path / "checkpoint.json"))
+    checkpoint.import_managers(MANAGERS)
+    checkpoint.close()
+
+    reopened = SQLiteCheckpointManager(str(tmp_path / "checkpoint.json"), read_only=True)
+    assert reopened.get_all() == MANAGERS
+    assert reopened["m1"] == MANAGERS["m1"]
+    assert [manager_id for manager_id, _ in reopened.iter_managers(without_filings=True)] == ["m2"]
+    assert reopened.holders("037833100") == [("m1", "f1", "037833100|COM", 10, 2)]
+    reopened.release()
+
+
+def test_json_checkpoint_is_imported_once(tmp_path):
+    json_path = tmp_path / "checkpoint.json"
+    json_path.write_text(json.dumps(MANAGERS))
+
+    checkpoint = open_checkpoint(str(json_path), "sqlite")
+    assert (tmp_path / "checkpoint.db").exists()
+    assert checkpoint.get_all() == MANAGERS
+    assert checkpoint.changes.read(0, checkpoint.changes.size()) == {"m1", "m2"}
+    checkpoint.add_manager("m3", {"id": "m3", "name": "Fund C"})
+    checkpoint.close()
+
+    # The JSON file is left alone and not imported again over the database
+    json_path.write_text(json.dumps({}))
+    reopened = open_checkpoint(str(json_path), "sqlite")
+    assert list(reopened.manager_ids()) == ["m1", "m2", "m3"]